@@ -0,0 +1,131 @@
+-- Tablas de resumen para las preguntas agregadas más frecuentes
+-- (distribución de géneros, géneros por votos medios, películas por género y por año, tops por métrica).
+-- Son vistas materializadas. Las lambdas de carga no las recalculan en su transacción (cada
+-- refresco recorre todas las películas y bloquea los demás refrescos hasta el commit): solo
+-- anotan la carga con mark_analytics_stale() y, después del commit, llaman a
+-- refresh_analytics_if_stale(), que refresca una vez por tanda de cargas y, después del refresco,
+-- vuelve a llamar a bump_data_version() para que la API no se quede con resultados cacheados de
+-- las vistas sin actualizar.
+-- La API las detecta solas (pg_matviews) y dirige a ellas las plantillas de los fallbacks y la
+-- SQL de Gemini que encaja (ver movie-api/app/utils/analytics_routes.py).
+-- Ejecutar después de data-version.sql.
+
+-- Por género: número de películas y medias de cada métrica
+CREATE MATERIALIZED VIEW IF NOT EXISTS resumen_generos AS
+SELECT g.nombre,
+       COUNT(pg.movie_id) AS num_peliculas,
+       AVG(p.vote_average) AS avg_vote_average,
+       AVG(p.vote_count) AS avg_vote_count,
+       AVG(p.popularity) AS avg_popularity,
+       AVG(p.duracion) AS avg_duracion,
+       AVG(p.budget) AS avg_budget,
+       AVG(p.revenue) AS avg_revenue
+FROM generos g
+LEFT JOIN peliculas_generos pg ON g.genero_id = pg.genero_id
+LEFT JOIN peliculas p ON pg.movie_id = p.movie_id
+GROUP BY g.nombre;
+
+-- Por año de estreno (la fila con anio NULL son las películas sin fecha)
+CREATE MATERIALIZED VIEW IF NOT EXISTS resumen_anios AS
+SELECT EXTRACT(YEAR FROM release_date) AS anio,
+       COUNT(*) AS num_peliculas,
+       AVG(vote_average) AS avg_vote_average,
+       AVG(vote_count) AS avg_vote_count,
+       AVG(popularity) AS avg_popularity,
+       AVG(duracion) AS avg_duracion,
+       AVG(budget) AS avg_budget,
+       AVG(revenue) AS avg_revenue
+FROM peliculas
+GROUP BY 1;
+
+-- Top 100 por métrica, con los mismos filtros que las plantillas top_* de la API
+-- (ANALYTICS_TOP_N en analytics_routes.py debe coincidir con el 100 de abajo)
+CREATE MATERIALIZED VIEW IF NOT EXISTS top_peliculas AS
+SELECT metrica, posicion, movie_id, titulo, valor
+FROM (
+    SELECT 'vote_average' AS metrica, ROW_NUMBER() OVER (ORDER BY vote_average DESC, movie_id) AS posicion,
+           movie_id, titulo, vote_average::DOUBLE PRECISION AS valor
+    FROM peliculas WHERE vote_average IS NOT NULL
+    UNION ALL
+    SELECT 'popularity', ROW_NUMBER() OVER (ORDER BY popularity DESC, movie_id),
+           movie_id, titulo, popularity::DOUBLE PRECISION
+    FROM peliculas WHERE popularity IS NOT NULL
+    UNION ALL
+    SELECT 'vote_count', ROW_NUMBER() OVER (ORDER BY vote_count DESC, movie_id),
+           movie_id, titulo, vote_count::DOUBLE PRECISION
+    FROM peliculas WHERE vote_count IS NOT NULL
+    UNION ALL
+    SELECT 'budget', ROW_NUMBER() OVER (ORDER BY budget DESC, movie_id),
+           movie_id, titulo, budget::DOUBLE PRECISION
+    FROM peliculas WHERE budget > 0
+    UNION ALL
+    SELECT 'revenue', ROW_NUMBER() OVER (ORDER BY revenue DESC, movie_id),
+           movie_id, titulo, revenue::DOUBLE PRECISION
+    FROM peliculas WHERE revenue > 0
+    UNION ALL
+    SELECT 'duracion', ROW_NUMBER() OVER (ORDER BY duracion DESC, movie_id),
+           movie_id, titulo, duracion::DOUBLE PRECISION
+    FROM peliculas WHERE duracion IS NOT NULL
+    UNION ALL
+    SELECT 'duracion_asc', ROW_NUMBER() OVER (ORDER BY duracion ASC, movie_id),
+           movie_id, titulo, duracion::DOUBLE PRECISION
+    FROM peliculas WHERE duracion IS NOT NULL
+) t
+WHERE posicion <= 100;
+
+-- REFRESH ... CONCURRENTLY necesita un índice único en cada vista; mientras se refrescan
+-- las consultas de la API siguen leyendo la versión anterior sin bloquearse
+CREATE UNIQUE INDEX IF NOT EXISTS resumen_generos_nombre_idx ON resumen_generos (nombre);
+CREATE UNIQUE INDEX IF NOT EXISTS resumen_anios_anio_idx ON resumen_anios (anio);
+CREATE UNIQUE INDEX IF NOT EXISTS top_peliculas_metrica_posicion_idx ON top_peliculas (metrica, posicion);
+
+CREATE OR REPLACE FUNCTION refresh_analytics() RETURNS VOID AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY resumen_generos;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY resumen_anios;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY top_peliculas;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Cargas con commit y cargas incluidas en el último refresco (una sola fila, como data_version)
+CREATE TABLE IF NOT EXISTS analytics_refresh (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    cargas BIGINT NOT NULL DEFAULT 0,
+    cargas_refrescadas BIGINT NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMPTZ
+);
+
+INSERT INTO analytics_refresh (id) VALUES (1)
+ON CONFLICT (id) DO NOTHING;
+
+-- Dentro de la transacción de cada carga, justo antes del commit
+CREATE OR REPLACE FUNCTION mark_analytics_stale() RETURNS VOID AS $$
+    UPDATE analytics_refresh SET cargas = cargas + 1 WHERE id = 1;
+$$ LANGUAGE sql;
+
+-- Después del commit de la carga, en otra transacción. Un solo refresco a la vez: si otra carga
+-- está refrescando se espera a que termine y se vuelve a mirar, y si ese refresco ya incluía
+-- todas las cargas no se repite. Con muchas cargas en paralelo se hace un refresco por tanda y no
+-- uno por fichero. Devuelve si ha refrescado.
+CREATE OR REPLACE FUNCTION refresh_analytics_if_stale() RETURNS BOOLEAN AS $$
+DECLARE
+    pendientes BIGINT;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('refresh_analytics'));
+    SELECT cargas INTO pendientes
+    FROM analytics_refresh
+    WHERE id = 1 AND cargas > cargas_refrescadas;
+    IF NOT FOUND THEN
+        RETURN FALSE;
+    END IF;
+
+    -- El REFRESH ve al menos las cargas contadas en pendientes; las que hagan commit después
+    -- quedan pendientes para el siguiente
+    PERFORM refresh_analytics();
+    UPDATE analytics_refresh
+    SET cargas_refrescadas = pendientes, refreshed_at = now()
+    WHERE id = 1;
+    PERFORM bump_data_version();
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,27 @@
+-- Marcador de versión de los datos
+-- Las lambdas de carga llaman a bump_data_version() dentro de su transacción, justo antes del commit.
+-- La API usa la versión como parte de la clave de su caché de resultados y recibe el cambio
+-- al instante mediante NOTIFY (se entrega solo cuando la transacción hace commit).
+
+CREATE TABLE IF NOT EXISTS data_version (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO data_version (id, version) VALUES (1, 1)
+ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_data_version() RETURNS BIGINT AS $$
+DECLARE
+    new_version BIGINT;
+BEGIN
+    UPDATE data_version
+    SET version = version + 1, updated_at = now()
+    WHERE id = 1
+    RETURNING version INTO new_version;
+
+    PERFORM pg_notify('data_version', new_version::text);
+    RETURN new_version;
+END;
+$$ LANGUAGE plpgsql;
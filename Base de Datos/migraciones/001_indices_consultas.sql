@@ -0,0 +1,47 @@
+-- Migración 001: índices para las consultas de la API sobre peliculas y peliculas_generos
+-- Hasta ahora solo había claves primarias, así que cada "top N por métrica" ordenaba la tabla
+-- entera y cada filtro por año o por género la recorría completa.
+--
+-- Aplicar con psql fuera de una transacción (CREATE INDEX CONCURRENTLY no admite BEGIN/COMMIT
+-- ni psql -1), así no se bloquean las cargas de las lambdas mientras se construyen:
+--   psql "$DATABASE_URL" -f "Base de Datos/migraciones/001_indices_consultas.sql"
+-- Deshacer: 001_indices_consultas_rollback.sql
+-- Si se interrumpe, un índice a medio construir queda INVALID y IF NOT EXISTS no lo rehace:
+-- borrarlo (DROP INDEX CONCURRENTLY) y volver a ejecutar el script.
+-- Para ver qué consultas registradas siguen haciendo Seq Scan: movie-api/app/tests/replay_queries.py
+
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version TEXT PRIMARY KEY,
+    descripcion TEXT NOT NULL,
+    aplicada_en TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Tops por métrica (ORDER BY ... DESC LIMIT n): el índice se recorre hacia atrás y la
+-- consulta lee solo n entradas. Un btree ascendente sirve para DESC (NULLS FIRST, como el
+-- ORDER BY sin filtro) y para los que filtran IS NOT NULL.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS peliculas_vote_average_idx ON peliculas (vote_average);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS peliculas_popularity_idx ON peliculas (popularity);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS peliculas_vote_count_idx ON peliculas (vote_count);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS peliculas_duracion_idx ON peliculas (duracion);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS peliculas_release_date_idx ON peliculas (release_date);
+
+-- Presupuesto y recaudación solo se consultan con > 0 (la mayoría de filas tienen 0):
+-- índices parciales, más pequeños y que el planificador usa al ver el mismo predicado
+CREATE INDEX CONCURRENTLY IF NOT EXISTS peliculas_budget_positive_idx ON peliculas (budget) WHERE budget > 0;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS peliculas_revenue_positive_idx ON peliculas (revenue) WHERE revenue > 0;
+
+-- Filtros por año: la expresión tiene que ser idéntica a la de las consultas
+-- (EXTRACT(YEAR FROM release_date), como piden las reglas del prompt de Gemini)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS peliculas_release_year_idx ON peliculas ((EXTRACT(YEAR FROM release_date)));
+
+-- La clave primaria (movie_id, genero_id) no sirve para "películas de un género":
+-- índice inverso, que además cubre movie_id para el JOIN con peliculas
+CREATE INDEX CONCURRENTLY IF NOT EXISTS peliculas_generos_genero_movie_idx ON peliculas_generos (genero_id, movie_id);
+
+-- Estadísticas al día para que el planificador elija los índices nuevos
+ANALYZE peliculas;
+ANALYZE peliculas_generos;
+
+INSERT INTO schema_migrations (version, descripcion)
+VALUES ('001', 'Índices para las consultas de la API')
+ON CONFLICT (version) DO NOTHING;
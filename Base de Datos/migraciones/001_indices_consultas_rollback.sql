@@ -0,0 +1,14 @@
+-- Deshace la migración 001 (índices para las consultas de la API)
+--   psql "$DATABASE_URL" -f "Base de Datos/migraciones/001_indices_consultas_rollback.sql"
+
+DROP INDEX CONCURRENTLY IF EXISTS peliculas_vote_average_idx;
+DROP INDEX CONCURRENTLY IF EXISTS peliculas_popularity_idx;
+DROP INDEX CONCURRENTLY IF EXISTS peliculas_vote_count_idx;
+DROP INDEX CONCURRENTLY IF EXISTS peliculas_duracion_idx;
+DROP INDEX CONCURRENTLY IF EXISTS peliculas_release_date_idx;
+DROP INDEX CONCURRENTLY IF EXISTS peliculas_budget_positive_idx;
+DROP INDEX CONCURRENTLY IF EXISTS peliculas_revenue_positive_idx;
+DROP INDEX CONCURRENTLY IF EXISTS peliculas_release_year_idx;
+DROP INDEX CONCURRENTLY IF EXISTS peliculas_generos_genero_movie_idx;
+
+DELETE FROM schema_migrations WHERE version = '001';
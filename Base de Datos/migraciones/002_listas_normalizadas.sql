@@ -0,0 +1,137 @@
+-- Migración 002: compañías, países de producción e idiomas en tablas normalizadas
+-- Las lambdas guardaban cada lista como un TEXT separado por comas (production_companies,
+-- production_countries, spoken_languages): buscar un estudio o un país obligaba a un
+-- LIKE '%...%' sobre toda la tabla y el modelo tenía que volver a partir las cadenas fila a fila.
+-- Ahora, como generos / peliculas_generos, hay una tabla de nombres y una de unión por lista.
+-- Las columnas de texto se mantienen (las siguen escribiendo las lambdas) para no romper
+-- a quien las lea; las consultas nuevas deben usar las tablas de unión.
+--
+-- Orden de despliegue:
+--   1. psql "$DATABASE_URL" -f "Base de Datos/migraciones/002_listas_normalizadas.sql"
+--      (crea las tablas y rellena las películas existentes por lotes, con un COMMIT por lote)
+--   2. Desplegar las lambdas de carga, que ya escriben también en las tablas nuevas
+--   3. CALL rellenar_listas_normalizadas(); otra vez para las cargas hechas entre 1 y 2
+--      (es idempotente: solo añade lo que falta)
+-- Deshacer: 002_listas_normalizadas_rollback.sql
+
+CREATE TABLE IF NOT EXISTS companias (
+    compania_id SERIAL PRIMARY KEY,
+    nombre TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS paises (
+    pais_id SERIAL PRIMARY KEY,
+    nombre TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS idiomas (
+    idioma_id SERIAL PRIMARY KEY,
+    nombre TEXT NOT NULL UNIQUE
+);
+
+-- La clave primaria (movie_id, x_id) sirve para "listas de una película"; el índice inverso,
+-- para "películas de una compañía / país / idioma"
+CREATE TABLE IF NOT EXISTS peliculas_companias (
+    movie_id INT REFERENCES peliculas(movie_id) ON DELETE CASCADE,
+    compania_id INT REFERENCES companias(compania_id),
+    PRIMARY KEY (movie_id, compania_id)
+);
+CREATE INDEX IF NOT EXISTS peliculas_companias_compania_movie_idx ON peliculas_companias (compania_id, movie_id);
+
+CREATE TABLE IF NOT EXISTS peliculas_paises (
+    movie_id INT REFERENCES peliculas(movie_id) ON DELETE CASCADE,
+    pais_id INT REFERENCES paises(pais_id),
+    PRIMARY KEY (movie_id, pais_id)
+);
+CREATE INDEX IF NOT EXISTS peliculas_paises_pais_movie_idx ON peliculas_paises (pais_id, movie_id);
+
+CREATE TABLE IF NOT EXISTS peliculas_idiomas (
+    movie_id INT REFERENCES peliculas(movie_id) ON DELETE CASCADE,
+    idioma_id INT REFERENCES idiomas(idioma_id),
+    PRIMARY KEY (movie_id, idioma_id)
+);
+CREATE INDEX IF NOT EXISTS peliculas_idiomas_idioma_movie_idx ON peliculas_idiomas (idioma_id, movie_id);
+
+COMMENT ON TABLE companias IS 'compañías productoras';
+COMMENT ON TABLE paises IS 'países de producción';
+COMMENT ON TABLE idiomas IS 'idiomas hablados';
+
+-- Relleno de las películas ya cargadas a partir de las columnas de texto, por rangos de
+-- movie_id y con un COMMIT por lote: ninguna transacción toca el millón de filas a la vez y,
+-- si se corta, se puede volver a lanzar (ON CONFLICT DO NOTHING). Los nombres que contenían
+-- una coma se parten mal, igual que ya pasaba al leer las columnas de texto; las cargas
+-- nuevas usan las listas originales de la API.
+CREATE OR REPLACE PROCEDURE rellenar_listas_normalizadas(lote INT DEFAULT 50000) AS $$
+DECLARE
+    desde INT;
+    maximo INT;
+BEGIN
+    SELECT MIN(movie_id), MAX(movie_id) INTO desde, maximo FROM peliculas;
+    WHILE desde <= maximo LOOP
+        CREATE TEMP TABLE IF NOT EXISTS listas_lote (movie_id INT, lista TEXT, nombre TEXT) ON COMMIT DROP;
+
+        INSERT INTO listas_lote
+        SELECT p.movie_id, l.lista, btrim(n.nombre)
+        FROM peliculas p
+        CROSS JOIN LATERAL (VALUES
+            ('companias', p.production_companies),
+            ('paises', p.production_countries),
+            ('idiomas', p.spoken_languages)
+        ) AS l(lista, texto)
+        CROSS JOIN LATERAL unnest(string_to_array(l.texto, ',')) AS n(nombre)
+        WHERE p.movie_id >= desde AND p.movie_id < desde + lote
+          AND btrim(n.nombre) <> '';
+
+        INSERT INTO companias (nombre)
+        SELECT DISTINCT nombre FROM listas_lote WHERE lista = 'companias'
+        ON CONFLICT (nombre) DO NOTHING;
+        INSERT INTO paises (nombre)
+        SELECT DISTINCT nombre FROM listas_lote WHERE lista = 'paises'
+        ON CONFLICT (nombre) DO NOTHING;
+        INSERT INTO idiomas (nombre)
+        SELECT DISTINCT nombre FROM listas_lote WHERE lista = 'idiomas'
+        ON CONFLICT (nombre) DO NOTHING;
+
+        INSERT INTO peliculas_companias (movie_id, compania_id)
+        SELECT l.movie_id, c.compania_id
+        FROM listas_lote l JOIN companias c ON c.nombre = l.nombre
+        WHERE l.lista = 'companias'
+        ON CONFLICT DO NOTHING;
+        INSERT INTO peliculas_paises (movie_id, pais_id)
+        SELECT l.movie_id, c.pais_id
+        FROM listas_lote l JOIN paises c ON c.nombre = l.nombre
+        WHERE l.lista = 'paises'
+        ON CONFLICT DO NOTHING;
+        INSERT INTO peliculas_idiomas (movie_id, idioma_id)
+        SELECT l.movie_id, c.idioma_id
+        FROM listas_lote l JOIN idiomas c ON c.nombre = l.nombre
+        WHERE l.lista = 'idiomas'
+        ON CONFLICT DO NOTHING;
+
+        RAISE NOTICE 'Listas normalizadas: movie_id % - % de %', desde, desde + lote - 1, maximo;
+        desde := desde + lote;
+        COMMIT;
+    END LOOP;
+    ANALYZE companias, paises, idiomas, peliculas_companias, peliculas_paises, peliculas_idiomas;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Variables del modelo que antes salían de partir las cadenas en pandas, calculadas en la BD
+-- (num_production_companies, num_production_countries, num_spoken_languages)
+-- Agregados con JOIN (no subconsultas por fila): para la tabla entera son tres hash joins, y
+-- un WHERE movie_id = ... se empuja dentro de cada GROUP BY
+CREATE OR REPLACE VIEW peliculas_listas_features AS
+SELECT p.movie_id,
+       COALESCE(c.total, 0) AS num_production_companies,
+       COALESCE(pa.total, 0) AS num_production_countries,
+       COALESCE(i.total, 0) AS num_spoken_languages
+FROM peliculas p
+LEFT JOIN (SELECT movie_id, COUNT(*) AS total FROM peliculas_companias GROUP BY movie_id) c ON c.movie_id = p.movie_id
+LEFT JOIN (SELECT movie_id, COUNT(*) AS total FROM peliculas_paises GROUP BY movie_id) pa ON pa.movie_id = p.movie_id
+LEFT JOIN (SELECT movie_id, COUNT(*) AS total FROM peliculas_idiomas GROUP BY movie_id) i ON i.movie_id = p.movie_id;
+
+INSERT INTO schema_migrations (version, descripcion)
+VALUES ('002', 'Compañías, países e idiomas normalizados')
+ON CONFLICT (version) DO NOTHING;
+
+CALL rellenar_listas_normalizadas();
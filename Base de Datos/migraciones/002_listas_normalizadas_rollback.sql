@@ -0,0 +1,13 @@
+-- Deshace la migración 002 (las columnas de texto de peliculas no se han tocado)
+--   psql "$DATABASE_URL" -f "Base de Datos/migraciones/002_listas_normalizadas_rollback.sql"
+
+DROP VIEW IF EXISTS peliculas_listas_features;
+DROP PROCEDURE IF EXISTS rellenar_listas_normalizadas(INT);
+DROP TABLE IF EXISTS peliculas_companias;
+DROP TABLE IF EXISTS peliculas_paises;
+DROP TABLE IF EXISTS peliculas_idiomas;
+DROP TABLE IF EXISTS companias;
+DROP TABLE IF EXISTS paises;
+DROP TABLE IF EXISTS idiomas;
+
+DELETE FROM schema_migrations WHERE version = '002';
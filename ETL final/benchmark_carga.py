@@ -0,0 +1,167 @@
+# Filas/segundo de la carga de películas en la BD: INSERT fila a fila (como cargaban antes las lambdas
+# v2) frente a COPY a tablas temporales + INSERT ... SELECT (load_movies de las lambdas).
+# Trabaja en un esquema propio (benchmark_carga) que se crea y se borra al terminar, así que se
+# puede lanzar contra la BD local con datos sin tocar nada. Las películas son sintéticas.
+# Se mide:
+# - "nuevas": tablas vacías, todas las películas se insertan;
+# - "repetidas": el mismo fichero otra vez, todas chocan con ON CONFLICT (lo normal en la carga diaria).
+# Uso: python "ETL final/benchmark_carga.py" [--dsn "postgresql://postgres@localhost/TMDB"] [--rows 20000]
+import argparse
+import importlib.util
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+import psycopg
+
+DEFAULT_DSN = "postgresql://postgres@localhost:5432/TMDB"
+SCHEMA = "benchmark_carga"
+GENRE_IDS = [12, 14, 16, 18, 27, 28, 35, 36, 37, 53, 80, 99, 878, 9648, 10402, 10749, 10751, 10752, 10770]
+
+# Mismas columnas y tipos que peliculas en la BD (ver Base de Datos/)
+DDL = f"""
+    CREATE SCHEMA {SCHEMA};
+    CREATE TABLE {SCHEMA}.peliculas (
+        movie_id INTEGER PRIMARY KEY,
+        titulo TEXT NOT NULL,
+        release_date DATE,
+        duracion INTEGER,
+        vote_average NUMERIC(3,1),
+        vote_count INTEGER,
+        origin_country TEXT,
+        overview TEXT,
+        revenue BIGINT,
+        budget BIGINT,
+        adult BOOLEAN,
+        belong_to_collection VARCHAR(1000),
+        original_language VARCHAR,
+        original_title VARCHAR(500),
+        popularity DOUBLE PRECISION,
+        production_companies TEXT,
+        production_countries TEXT,
+        spoken_languages TEXT,
+        status VARCHAR,
+        tagline VARCHAR(1000)
+    );
+    CREATE TABLE {SCHEMA}.generos (genero_id INTEGER PRIMARY KEY, nombre VARCHAR(50));
+    CREATE TABLE {SCHEMA}.peliculas_generos (
+        movie_id INTEGER REFERENCES {SCHEMA}.peliculas (movie_id) ON DELETE CASCADE,
+        genero_id INTEGER REFERENCES {SCHEMA}.generos (genero_id),
+        PRIMARY KEY (movie_id, genero_id)
+    );
+"""
+
+LAYER_PATH = Path(__file__).resolve().parent.parent / "ETL1" / "Capas" / "python"
+
+
+def load_lambda():
+    # La lambda de carga diaria (el nombre del fichero no se puede importar tal cual), con el
+    # código de la capa de Lambda en el path como en AWS
+    sys.path.insert(0, str(LAYER_PATH))
+    path = Path(__file__).with_name("daily-upload-to-db-v2-lambda_function.py")
+    spec = importlib.util.spec_from_file_location("daily_upload_lambda", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_rows(n, seed=42):
+    # Filas ya limpias, en el orden de MOVIE_COLUMNS, y sus géneros
+    rnd = random.Random(seed)
+    movie_rows, genre_rows = [], []
+    for movie_id in range(1, n + 1):
+        movie_rows.append((
+            movie_id,
+            f"Película {movie_id}",
+            f"{rnd.randint(1950, 2024)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+            rnd.randint(60, 200),
+            round(rnd.uniform(0, 10), 1),
+            rnd.randint(0, 30000),
+            "US",
+            "Sinopsis sintética " * rnd.randint(5, 30),
+            rnd.randint(0, 10**9),
+            rnd.randint(0, 3 * 10**8),
+            False,
+            None,
+            "en",
+            f"Movie {movie_id}",
+            rnd.uniform(0, 500),
+            "Compañía A,Compañía B",
+            "United States of America",
+            "English",
+            "Released",
+            None,
+        ))
+        for genre_id in rnd.sample(GENRE_IDS, rnd.randint(1, 3)):
+            genre_rows.append((movie_id, genre_id))
+    return movie_rows, genre_rows
+
+
+def load_row_by_row(cur, movie_rows, genre_rows, columns):
+    # Lo que hacían antes las lambdas: un INSERT por película y otro por cada género
+    placeholders = ", ".join(["%s"] * len(columns))
+    genres = {}
+    for movie_id, genre_id in genre_rows:
+        genres.setdefault(movie_id, []).append(genre_id)
+    for row in movie_rows:
+        cur.execute(f"""
+            INSERT INTO peliculas ({', '.join(columns)}) VALUES ({placeholders})
+            ON CONFLICT (movie_id) DO NOTHING;
+        """, row)
+        for genre_id in genres.get(row[0], []):
+            cur.execute("""
+                INSERT INTO peliculas_generos (movie_id, genero_id)
+                VALUES (%s, %s)
+                ON CONFLICT DO NOTHING;
+            """, (row[0], genre_id))
+
+
+def timed(conn, load):
+    start = time.perf_counter()
+    with conn.cursor() as cur:
+        load(cur)
+    conn.commit()
+    return time.perf_counter() - start
+
+
+def main(dsn, rows):
+    lambda_module = load_lambda()
+    movie_rows, genre_rows = synthetic_rows(rows)
+    methods = {
+        "INSERT fila a fila": lambda cur: load_row_by_row(cur, movie_rows, genre_rows, lambda_module.MOVIE_COLUMNS),
+        "COPY + INSERT ... SELECT": lambda cur: lambda_module.load_movies(cur, movie_rows, genre_rows),
+    }
+    with psycopg.connect(dsn) as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.execute(DDL)
+        conn.execute(f"INSERT INTO {SCHEMA}.generos (genero_id) SELECT unnest(%s::int[])", (GENRE_IDS,))
+        conn.execute(f"SET search_path TO {SCHEMA}")
+        conn.commit()
+        try:
+            print(f"{rows} películas sintéticas, {len(genre_rows)} relaciones con géneros\n")
+            results = {}
+            for name, load in methods.items():
+                conn.execute("TRUNCATE peliculas, peliculas_generos")
+                conn.commit()
+                new = timed(conn, load)
+                repeated = timed(conn, load)
+                results[name] = (new, repeated)
+                print(f"{name:26} nuevas: {rows / new:>9,.0f} filas/s ({new:.2f} s)   "
+                      f"repetidas: {rows / repeated:>9,.0f} filas/s ({repeated:.2f} s)")
+            before, after = results.values()
+            print(f"\nCOPY es {before[0] / after[0]:.1f}x más rápido con películas nuevas y "
+                  f"{before[1] / after[1]:.1f}x con repetidas")
+        finally:
+            conn.rollback()
+            conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            conn.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Filas/s de la carga de películas: INSERT fila a fila frente a COPY")
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL", DEFAULT_DSN))
+    parser.add_argument("--rows", type=int, default=20000, help="Películas sintéticas a cargar")
+    args = parser.parse_args()
+    main(args.dsn, args.rows)
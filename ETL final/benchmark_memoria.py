@@ -0,0 +1,154 @@
+# Memoria máxima (RSS) de leer un fichero de películas de S3 entero con json.loads, como hacían antes
+# las lambdas de carga, frente a recorrerlo película a película con iter_movies y cargar por lotes
+# de LOAD_BATCH_SIZE. No hace falta S3 ni BD: el fichero sintético se sirve con el mismo
+# StreamingBody de botocore que devuelve get_object y las filas se preparan como en la lambda
+# de carga diaria, pero los lotes se descartan en lugar de cargarse.
+# Cada forma se mide en un proceso aparte para que una no herede la memoria de la otra.
+# Uso: python "ETL final/benchmark_memoria.py" [--mb 50] [--batch 1000]
+import argparse
+import importlib.util
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from botocore.response import StreamingBody
+
+LAYER_PATH = Path(__file__).resolve().parent.parent / "ETL1" / "Capas" / "python"
+
+
+def load_lambda():
+    # La lambda de carga diaria (el nombre del fichero no se puede importar tal cual), con el
+    # código de la capa de Lambda en el path como en AWS
+    sys.path.insert(0, str(LAYER_PATH))
+    path = Path(__file__).with_name("daily-upload-to-db-v2-lambda_function.py")
+    spec = importlib.util.spec_from_file_location("daily_upload_lambda", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_movie(movie_id, rnd):
+    # Película con los mismos campos que los ficheros en bruto de la API de TMDB
+    return {
+        "adult": False,
+        "belongs_to_collection": None,
+        "budget": rnd.randint(0, 3 * 10**8),
+        "genres": [{"id": g, "name": f"Género {g}"} for g in rnd.sample([18, 35, 28, 53, 27, 10749], 2)],
+        "id": movie_id,
+        "origin_country": ["US"],
+        "original_language": "en",
+        "original_title": f"Movie {movie_id}",
+        "overview": "Sinopsis sintética de la película. " * rnd.randint(5, 30),
+        "popularity": rnd.uniform(0, 500),
+        "production_companies": [
+            {"id": c, "logo_path": f"/logo{c}.png", "name": f"Compañía {c}", "origin_country": "US"}
+            for c in rnd.sample(range(1, 5000), rnd.randint(1, 4))
+        ],
+        "production_countries": [{"iso_3166_1": "US", "name": "United States of America"}],
+        "release_date": f"{rnd.randint(1950, 2024)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+        "revenue": rnd.randint(0, 10**9),
+        "runtime": rnd.randint(60, 200),
+        "spoken_languages": [{"english_name": "English", "iso_639_1": "en", "name": "English"}],
+        "status": "Released",
+        "tagline": "Eslogan sintético",
+        "title": f"Película {movie_id}",
+        "vote_average": round(rnd.uniform(0, 10), 3),
+        "vote_count": rnd.randint(0, 30000),
+    }
+
+
+def write_file(path, megabytes):
+    # Escribe el array JSON película a película hasta llegar al tamaño pedido
+    rnd = random.Random(42)
+    target = megabytes * 1024 * 1024
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        while f.tell() < target:
+            if count:
+                f.write(", ")
+            count += 1
+            json.dump(synthetic_movie(count, rnd), f, ensure_ascii=False)
+        f.write("]")
+    return count
+
+
+def movie_row(movie):
+    # Lo que guarda la lambda de cada película hasta cargar el lote: la fila y sus géneros
+    companies = [c.get("name") for c in movie.get("production_companies") or [] if c.get("name")]
+    row = (
+        movie["id"], movie["title"], movie.get("release_date") or None, movie.get("runtime"),
+        round(movie.get("vote_average", 0.0), 1), movie.get("vote_count", 0),
+        ",".join(movie.get("origin_country", [])) or None, movie.get("overview") or None,
+        movie.get("revenue", 0), movie.get("budget", 0), movie.get("adult", False), None,
+        movie.get("original_language"), movie.get("original_title"), movie.get("popularity", 0.0),
+        ",".join(companies) or None, None, None, movie.get("status"), movie.get("tagline"),
+    )
+    genres = [(movie["id"], g["id"]) for g in movie.get("genres", []) if g.get("id")]
+    return row, genres
+
+
+def measure(mode, path, batch):
+    # Se ejecuta en el proceso hijo: imprime JSON con la memoria por encima de la base y el tiempo
+    lambda_module = load_lambda()
+    size = os.path.getsize(path)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    rows, genre_rows, count = [], [], 0
+    with open(path, "rb") as raw:
+        body = StreamingBody(raw, size)
+        if mode == "json.loads":
+            # Antes: bytes + texto + lista completa de diccionarios y todas las filas a la vez
+            movies = json.loads(body.read().decode("utf-8"))
+            for movie in movies:
+                row, genres = movie_row(movie)
+                rows.append(row)
+                genre_rows.extend(genres)
+            count = len(rows)
+        else:
+            for movie in lambda_module.iter_movies(body):
+                row, genres = movie_row(movie)
+                rows.append(row)
+                genre_rows.extend(genres)
+                count += 1
+                if len(rows) >= batch:
+                    rows, genre_rows = [], []
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss va en KB en Linux y en bytes en macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    print(json.dumps({"movies": count, "peak_mb": (peak - baseline) * unit / 2**20, "seconds": elapsed}))
+
+
+def main(megabytes, batch):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "movies.json")
+        count = write_file(path, megabytes)
+        print(f"Fichero sintético: {os.path.getsize(path) / 2**20:.1f} MB, {count} películas, lotes de {batch}\n")
+        for mode in ("json.loads", "iter_movies"):
+            output = subprocess.run(
+                [sys.executable, __file__, "--measure", mode, "--file", path, "--batch", str(batch)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:12} memoria máxima +{result['peak_mb']:7.1f} MB   {result['seconds']:.2f} s   "
+                  f"({result['movies']} películas)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memoria máxima de json.loads frente a iter_movies")
+    parser.add_argument("--mb", type=int, default=50, help="Tamaño del fichero sintético en MB")
+    parser.add_argument("--batch", type=int, default=1000, help="Películas por lote (LOAD_BATCH_SIZE)")
+    parser.add_argument("--measure", choices=["json.loads", "iter_movies"], help=argparse.SUPPRESS)
+    parser.add_argument("--file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        measure(args.measure, args.file, args.batch)
+    else:
+        main(args.mb, args.batch)
@@ -6,6 +6,15 @@ import psycopg
 import os
 import re
 
+# Código común de las lambdas de carga (capa ETL1/Capas/layer.zip)
+from carga_peliculas import iter_movies, refresh_analytics, save_movie_lists
+
+# Películas que se cargan en la BD de una vez
+LOAD_BATCH_SIZE = int(os.environ.get('LOAD_BATCH_SIZE', '1000'))
+# Refrescar las tablas de resumen al terminar cada carga. En cargas masivas se puede desactivar y
+# refrescar una vez al final con SELECT refresh_analytics_if_stale();
+REFRESH_ANALYTICS = os.environ.get('REFRESH_ANALYTICS', 'true').lower() == 'true'
+
 # Cargar las credenciales de acceso a la BD desde SM
 def get_rds_key():
     secret_name = os.environ.get('DB_KEY')
@@ -49,6 +58,62 @@ def is_valid_title(title):
     return True
 
 
+# Columnas de peliculas en el orden de las filas que se cargan con COPY
+MOVIE_COLUMNS = (
+    'movie_id', 'titulo', 'release_date', 'duracion', 'vote_average',
+    'vote_count', 'origin_country', 'overview', 'revenue', 'budget',
+    'adult', 'belong_to_collection', 'original_language', 'original_title',
+    'popularity', 'production_companies', 'production_countries',
+    'spoken_languages', 'status', 'tagline'
+)
+
+
+def load_movies(cur, movie_rows, genre_rows):
+    # Carga en bloque las películas del fichero: COPY a tablas temporales (no escriben WAL y son
+    # de esta conexión, así dos cargas a la vez no se pisan) y un INSERT ... SELECT por tabla
+    # en vez de un INSERT por película y género.
+    # movie_rows: tuplas en el orden de MOVIE_COLUMNS, sin movie_id repetidos
+    # genre_rows: tuplas (movie_id, genero_id)
+    # Devuelve los movie_id insertados (las que ya existían no se tocan: DO NOTHING)
+    columns = ', '.join(MOVIE_COLUMNS)
+    # Se llama una vez por lote dentro de la misma transacción: las tablas se reutilizan vaciadas
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS peliculas_carga (LIKE peliculas) ON COMMIT DROP;")
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS peliculas_generos_carga (movie_id INTEGER, genero_id INTEGER) ON COMMIT DROP;")
+    cur.execute("TRUNCATE peliculas_carga, peliculas_generos_carga;")
+    with cur.copy(f"COPY peliculas_carga ({columns}) FROM STDIN") as copy:
+        for row in movie_rows:
+            copy.write_row(row)
+    with cur.copy("COPY peliculas_generos_carga (movie_id, genero_id) FROM STDIN") as copy:
+        for row in genre_rows:
+            copy.write_row(row)
+
+    cur.execute(f"""
+        INSERT INTO peliculas ({columns})
+        SELECT {columns} FROM peliculas_carga
+        ON CONFLICT (movie_id) DO NOTHING
+        RETURNING movie_id;
+    """)
+    inserted = [row[0] for row in cur.fetchall()]
+    # Géneros de todas las películas del fichero, también de las que ya estaban
+    cur.execute("""
+        INSERT INTO peliculas_generos (movie_id, genero_id)
+        SELECT DISTINCT movie_id, genero_id FROM peliculas_generos_carga
+        ON CONFLICT DO NOTHING;
+    """)
+    return inserted
+
+
+def load_batch(cur, movie_rows, genre_rows, movie_lists):
+    # Carga un lote de películas limpias y las listas de las que son nuevas (las que ya existían
+    # no se tocan); vacía las estructuras para el siguiente lote y devuelve cuántas se han insertado
+    inserted = load_movies(cur, movie_rows.values(), genre_rows)
+    save_movie_lists(cur, {movie_id: movie_lists[movie_id] for movie_id in inserted})
+    movie_rows.clear()
+    genre_rows.clear()
+    movie_lists.clear()
+    return len(inserted)
+
+
 def lambda_handler(event, context):
     # Leer los datos extraidos de Secrets Manager
     rds_key = get_rds_key()
@@ -81,17 +146,21 @@ def lambda_handler(event, context):
 
     total_peliculas = 0
     peliculas_omitidas = 0
+    peliculas_nuevas = 0
+    # Filas limpias del lote actual (se cargan cada LOAD_BATCH_SIZE películas) e IDs ya vistos en el fichero
+    movie_rows = {}
+    genre_rows = []
+    movie_lists = {}
+    seen_ids = set()
 
     try:
         with conn.cursor() as cur:
             print(f"Procesando archivo: {key}")
 
-            # Leer archivo JSON desde S3
+            # Leer archivo JSON desde S3 película a película, sin descargarlo entero en memoria
             file_obj = s3.get_object(Bucket=bucket_name, Key=key)
-            content = file_obj['Body'].read().decode('utf-8')
-            movies = json.loads(content)
 
-            for movie in movies:
+            for movie in iter_movies(file_obj['Body']):
                 # Validar campos obligatorios
                 movie_id = movie.get('id')
                 title = movie.get('title')
@@ -124,36 +193,26 @@ def lambda_handler(event, context):
                 original_title = movie.get('original_title') or None
                 popularity = movie.get('popularity', 0.0)
                 
-                # Procesar arrays como strings separados por comas
-                production_companies = None
-                if movie.get('production_companies'):
-                    companies = [comp.get('name') for comp in movie['production_companies'] if comp.get('name')]
-                    production_companies = ','.join(companies) if companies else None
+                # Procesar arrays: las listas van a las tablas normalizadas y, separadas por comas,
+                # a las columnas de texto de siempre
+                companies = [comp.get('name') for comp in movie.get('production_companies') or [] if comp.get('name')]
+                production_companies = ','.join(companies) if companies else None
                 
-                production_countries = None
-                if movie.get('production_countries'):
-                    countries = [country.get('name') for country in movie['production_countries'] if country.get('name')]
-                    production_countries = ','.join(countries) if countries else None
+                countries = [country.get('name') for country in movie.get('production_countries') or [] if country.get('name')]
+                production_countries = ','.join(countries) if countries else None
                 
-                spoken_languages = None
-                if movie.get('spoken_languages'):
-                    languages = [lang.get('name') for lang in movie['spoken_languages'] if lang.get('name')]
-                    spoken_languages = ','.join(languages) if languages else None
+                languages = [lang.get('name') for lang in movie.get('spoken_languages') or [] if lang.get('name')]
+                spoken_languages = ','.join(languages) if languages else None
                 
                 status = movie.get('status') or None
                 tagline = movie.get('tagline') or None
 
-                # Insertar película con todos los campos
-                cur.execute("""
-                    INSERT INTO peliculas (
-                        movie_id, titulo, release_date, duracion, vote_average,
-                        vote_count, origin_country, overview, revenue, budget,
-                        adult, belong_to_collection, original_language, original_title,
-                        popularity, production_companies, production_countries,
-                        spoken_languages, status, tagline
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (movie_id) DO NOTHING;
-                """, (
+                # Fila de la película con todos los campos; si el ID se repite vale la primera
+                if movie_id in seen_ids:
+                    continue
+                seen_ids.add(movie_id)
+                total_peliculas += 1
+                movie_rows[movie_id] = (
                     movie_id,
                     title,
                     release_date,
@@ -174,21 +233,36 @@ def lambda_handler(event, context):
                     spoken_languages,
                     status,
                     tagline
-                ))
+                )
+                movie_lists[movie_id] = {
+                    'production_companies': companies,
+                    'production_countries': countries,
+                    'spoken_languages': languages
+                }
 
-                # Insertar relación con géneros
+                # Relación con géneros
                 for genre in movie.get('genres', []):
                     genre_id = genre.get('id')
                     if genre_id:
-                        cur.execute("""
-                            INSERT INTO peliculas_generos (movie_id, genero_id)
-                            VALUES (%s, %s)
-                            ON CONFLICT DO NOTHING;
-                        """, (movie_id, genre_id))
+                        genre_rows.append((movie_id, genre_id))
 
-            total_peliculas = len([m for m in movies if m.get('id') and is_valid_title(m.get('title', ''))])
+                if len(movie_rows) >= LOAD_BATCH_SIZE:
+                    peliculas_nuevas += load_batch(cur, movie_rows, genre_rows, movie_lists)
+
+            if movie_rows:
+                peliculas_nuevas += load_batch(cur, movie_rows, genre_rows, movie_lists)
+            print(f"Cargadas con COPY {len(seen_ids)} películas: {peliculas_nuevas} nuevas")
+
+            # Anotar la carga para el refresco de las tablas de resumen (Base de Datos/analytics-views.sql)
+            cur.execute("SELECT mark_analytics_stale();")
+            # Marcar nueva versión de datos (invalida la caché de resultados de la API al hacer commit)
+            cur.execute("SELECT bump_data_version();")
             conn.commit()
-            print(f"Procesamiento completado: {total_peliculas} películas insertadas, {peliculas_omitidas} omitidas")
+            print(f"Procesamiento completado: {total_peliculas} películas procesadas, {peliculas_nuevas} insertadas, {peliculas_omitidas} omitidas")
+
+        # Fuera de la transacción de la carga: un refresco por tanda de cargas, no uno por fichero
+        if REFRESH_ANALYTICS:
+            refresh_analytics(conn)
 
     except Exception as e:
         print(f"Error procesando {key}: {str(e)}")
@@ -202,5 +276,5 @@ def lambda_handler(event, context):
 
     return {
         'statusCode': 200,
-        'body': f'{total_peliculas} películas procesadas desde {key}. {peliculas_omitidas} películas omitidas por problemas de calidad.'
+        'body': f'{total_peliculas} películas procesadas desde {key}, {peliculas_nuevas} insertadas (el resto ya existían). {peliculas_omitidas} películas omitidas por problemas de calidad.'
     }
\ No newline at end of file
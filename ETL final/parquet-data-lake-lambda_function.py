@@ -0,0 +1,260 @@
+# Copia en Parquet de los ficheros JSON en bruto del data-lake, para que los análisis y el
+# entrenamiento lean solo las columnas que necesitan en lugar de parsear todas las películas enteras.
+# - Se lanza con el mismo evento de S3 que las lambdas de carga (un fichero movies_*.json nuevo).
+# - Escribe PARQUET_PREFIX/rango_id=N/<fichero>-0.parquet (zstd, ordenado por id) conservando
+#   las listas anidadas (géneros, compañías, países, idiomas) como listas de structs.
+# - Se particiona por rangos de ID_RANGE_SIZE ids y no por año de estreno: cada fichero de origen
+#   (5.000 ids seguidos) cae en una sola partición en lugar de repartirse en más de cien ficheros
+#   de unas decenas de filas. El año va en la columna anio y se puede filtrar igual.
+# - Cada fichero de origen deja su entrada en PARQUET_PREFIX/_manifest/<fichero>.json
+#   (filas, rango de ids, años y ficheros escritos); read_manifest las junta.
+# - En local una carpeta hace de bucket (iter_movies viene de la capa ETL1/Capas/python):
+#   PYTHONPATH="ETL1/Capas/python" python "ETL final/parquet-data-lake-lambda_function.py" --source carpeta_json --target carpeta_parquet
+# Lectura, por ejemplo con pandas:
+#   pd.read_parquet("carpeta_parquet", columns=["id", "vote_average", "genres"], filters=[("anio", ">=", 2000)])
+
+import argparse
+import datetime
+import json
+import os
+import posixpath
+
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+# Lectura por trozos del array JSON, común con las lambdas de carga (capa ETL1/Capas/layer.zip)
+from carga_peliculas import iter_movies
+
+LOAD_BATCH_SIZE = int(os.environ.get('LOAD_BATCH_SIZE', '1000'))
+PARQUET_PREFIX = os.environ.get('PARQUET_PREFIX', 'parquet/peliculas')
+COMPRESSION = 'zstd'
+ID_RANGE_SIZE = 100000
+MANIFEST_DIR = '_manifest'
+
+# Campos de la API de TMDB que se guardan, con su tipo. Los que no encajan con el tipo se dejan a
+# NULL en lugar de hacer fallar el fichero entero
+MOVIE_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('title', pa.string()),
+    ('original_title', pa.string()),
+    ('original_language', pa.string()),
+    ('overview', pa.string()),
+    ('tagline', pa.string()),
+    ('status', pa.string()),
+    ('release_date', pa.date32()),
+    ('runtime', pa.int64()),
+    ('adult', pa.bool_()),
+    ('budget', pa.int64()),
+    ('revenue', pa.int64()),
+    ('popularity', pa.float64()),
+    ('vote_average', pa.float64()),
+    ('vote_count', pa.int64()),
+    ('imdb_id', pa.string()),
+    ('homepage', pa.string()),
+    ('origin_country', pa.list_(pa.string())),
+    ('belongs_to_collection', pa.struct([('id', pa.int64()), ('name', pa.string())])),
+    ('genres', pa.list_(pa.struct([('id', pa.int64()), ('name', pa.string())]))),
+    ('production_companies', pa.list_(pa.struct([
+        ('id', pa.int64()), ('name', pa.string()), ('origin_country', pa.string())
+    ]))),
+    ('production_countries', pa.list_(pa.struct([('iso_3166_1', pa.string()), ('name', pa.string())]))),
+    ('spoken_languages', pa.list_(pa.struct([
+        ('iso_639_1', pa.string()), ('english_name', pa.string()), ('name', pa.string())
+    ]))),
+    # Año de release_date (NULL si no tiene fecha)
+    ('anio', pa.int32()),
+    # Columna de partición: primer id del rango de ID_RANGE_SIZE ids de la película
+    ('rango_id', pa.int64()),
+])
+
+
+def coerce(value, type_):
+    # Convierte un valor del JSON al tipo de Arrow de su columna; None si no encaja
+    if value is None:
+        return None
+    if pa.types.is_struct(type_):
+        if not isinstance(value, dict):
+            return None
+        return {field.name: coerce(value.get(field.name), field.type) for field in type_}
+    if pa.types.is_list(type_):
+        if not isinstance(value, list):
+            return None
+        items = [coerce(item, type_.value_type) for item in value]
+        return [item for item in items if item is not None]
+    if pa.types.is_date(type_):
+        try:
+            return datetime.date.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None
+    if pa.types.is_boolean(type_):
+        return value if isinstance(value, bool) else None
+    if isinstance(value, bool):
+        return None
+    if pa.types.is_integer(type_):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    if pa.types.is_floating(type_):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    return value if isinstance(value, str) else None
+
+
+def movie_record(movie):
+    # Fila con las columnas de MOVIE_SCHEMA, o None si la película no tiene un id válido
+    if not isinstance(movie, dict):
+        return None
+    record = {field.name: coerce(movie.get(field.name), field.type) for field in MOVIE_SCHEMA}
+    if record['id'] is None:
+        return None
+    record['anio'] = record['release_date'].year if record['release_date'] else None
+    record['rango_id'] = record['id'] // ID_RANGE_SIZE * ID_RANGE_SIZE
+    return record
+
+
+def read_table(fs, path):
+    # Tabla de Arrow con las películas válidas del fichero (se convierten por lotes para no tener
+    # todos los diccionarios en memoria a la vez) y el número de películas omitidas
+    batches, records, skipped = [], [], 0
+    with fs.open_input_stream(path) as body:
+        for movie in iter_movies(body):
+            record = movie_record(movie)
+            if record is None:
+                skipped += 1
+                continue
+            records.append(record)
+            if len(records) >= LOAD_BATCH_SIZE:
+                batches.append(pa.RecordBatch.from_pylist(records, schema=MOVIE_SCHEMA))
+                records = []
+    if records:
+        batches.append(pa.RecordBatch.from_pylist(records, schema=MOVIE_SCHEMA))
+    table = pa.Table.from_batches(batches, schema=MOVIE_SCHEMA)
+    # Ordenado por id: las estadísticas de cada row group permiten saltar rangos de ids al leer
+    return table.sort_by('id'), skipped
+
+
+def manifest_path(target, source_name):
+    return posixpath.join(target, MANIFEST_DIR, f"{source_name}.json")
+
+
+def read_manifest(fs, target):
+    # Junta las entradas de _manifest/ en {nombre del fichero de origen: entrada}
+    selector = pafs.FileSelector(posixpath.join(target, MANIFEST_DIR), allow_not_found=True)
+    entries = {}
+    for info in fs.get_file_info(selector):
+        if info.is_file and info.path.endswith('.json'):
+            with fs.open_input_stream(info.path) as f:
+                entry = json.loads(f.read().decode('utf-8'))
+            entries[entry['nombre']] = entry
+    return entries
+
+
+def transform_file(fs, source_path, target):
+    # Escribe la copia en Parquet de un fichero JSON y su entrada en el manifiesto
+    source_name = posixpath.splitext(posixpath.basename(source_path))[0]
+    table, skipped = read_table(fs, source_path)
+
+    files = []
+
+    def visit(written):
+        files.append({
+            'ruta': posixpath.relpath(written.path, target),
+            'filas': written.metadata.num_rows,
+            'bytes': written.size,
+        })
+
+    if table.num_rows:
+        pq.write_to_dataset(
+            table,
+            root_path=target,
+            partition_cols=['rango_id'],
+            filesystem=fs,
+            basename_template=f"{source_name}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore',
+            compression=COMPRESSION,
+            file_visitor=visit,
+        )
+
+    # Si el fichero ya se había convertido, se borran sus Parquet que esta vez no se han escrito
+    # (p. ej. ahora cae en menos particiones). Solo después de escribir los nuevos, para que un
+    # fallo a medias no deje el fichero sin copia; los que ya no existen se saltan (reintentos)
+    previous = read_manifest(fs, target).get(source_name)
+    if previous:
+        current = {written['ruta'] for written in files}
+        for written in previous['ficheros']:
+            path = posixpath.join(target, written['ruta'])
+            if written['ruta'] not in current and fs.get_file_info(path).type == pafs.FileType.File:
+                fs.delete_file(path)
+
+    years = [year for year in table.column('anio').unique().to_pylist() if year is not None]
+    ids = table.column('id')
+    entry = {
+        'nombre': source_name,
+        'origen': source_path,
+        'filas': table.num_rows,
+        'omitidas': skipped,
+        'min_id': ids[0].as_py() if table.num_rows else None,
+        'max_id': ids[-1].as_py() if table.num_rows else None,
+        'anios': [min(years), max(years)] if years else None,
+        'ficheros': sorted(files, key=lambda f: f['ruta']),
+        'compresion': COMPRESSION,
+        'columnas': MOVIE_SCHEMA.names,
+        'generado': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+    }
+    fs.create_dir(posixpath.join(target, MANIFEST_DIR), recursive=True)
+    with fs.open_output_stream(manifest_path(target, source_name)) as f:
+        f.write(json.dumps(entry, ensure_ascii=False, indent=2).encode('utf-8'))
+    print(f"{source_path}: {table.num_rows} películas en {len(files)} ficheros Parquet, {skipped} omitidas")
+    return entry
+
+
+def lambda_handler(event, context):
+    # Fichero JSON nuevo en el bucket -> copia en Parquet en PARQUET_BUCKET (por defecto el mismo)
+    try:
+        record = event['Records'][0]['s3']
+        bucket = record['bucket']['name']
+        key = record['object']['key']
+    except (KeyError, IndexError):
+        return {
+            'statusCode': 400,
+            'body': 'No se pudo extraer el nombre del archivo del evento.'
+        }
+    if not key.endswith('.json') or key.startswith(PARQUET_PREFIX):
+        return {'statusCode': 200, 'body': f'{key} no es un fichero de películas, se ignora'}
+
+    fs = pafs.S3FileSystem(region=os.environ.get('REGION'))
+    target = posixpath.join(os.environ.get('PARQUET_BUCKET', bucket), PARQUET_PREFIX)
+    try:
+        entry = transform_file(fs, f"{bucket}/{key}", target)
+    except Exception as e:
+        print(f"Error procesando {key}: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': f'Error procesando {key}: {str(e)}'
+        }
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'filas': entry['filas'], 'omitidas': entry['omitidas'], 'ficheros': len(entry['ficheros'])})
+    }
+
+
+if __name__ == "__main__":
+    # Ejecución local: una carpeta con los JSON hace de bucket de origen y otra de destino
+    parser = argparse.ArgumentParser(description="Copia en Parquet particionado de los ficheros JSON de películas")
+    parser.add_argument("--source", required=True, help="Carpeta con los ficheros movies_*.json")
+    parser.add_argument("--target", required=True, help="Carpeta donde se escribe el Parquet")
+    args = parser.parse_args()
+
+    local = pafs.LocalFileSystem()
+    source = os.path.abspath(args.source)
+    target = os.path.abspath(args.target)
+    for name in sorted(os.listdir(source)):
+        if name.endswith('.json'):
+            transform_file(local, os.path.join(source, name), target)
+    entries = read_manifest(local, target)
+    print(f"\nManifiesto: {len(entries)} ficheros de origen, {sum(e['filas'] for e in entries.values())} películas, "
+          f"{sum(f['bytes'] for e in entries.values() for f in e['ficheros']) / 2**20:.1f} MB en Parquet")
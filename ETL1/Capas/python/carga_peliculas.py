@@ -0,0 +1,129 @@
+# Código común de las lambdas que leen los ficheros de películas del data-lake
+# (ETL final/*-v2-lambda_function.py, ETL final/parquet-data-lake-lambda_function.py y
+# ETL2/volcado-completo-lambda_function.py): la lectura por trozos del array JSON, el guardado
+# de las listas normalizadas (compañías, países e idiomas) y el refresco de las tablas de
+# resumen después de cada carga. Va en la capa de Lambda
+# (ETL1/Capas/layer.zip), cuya carpeta python/ está en el sys.path de las lambdas; después de
+# cambiarlo hay que regenerar la capa:
+#   cd ETL1/Capas && zip layer.zip python/carga_peliculas.py
+# En local basta con añadir la carpeta al path: PYTHONPATH="ETL1/Capas/python"
+
+import codecs
+import json
+
+# Bytes que se leen de S3 cada vez
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def iter_movies(body, chunk_size=READ_CHUNK_SIZE):
+    # Recorre el array JSON del fichero película a película leyendo el cuerpo de S3 por trozos:
+    # en memoria solo están el trozo actual y la película que se está leyendo, no el fichero entero
+    # (ni los bytes, ni el texto decodificado, ni la lista completa de diccionarios).
+    # Es igual de estricto que json.loads: falla si falta una coma entre películas o si sobra
+    # una antes del cierre del array.
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    # consumed: caracteres del fichero que ya no están en buffer (para situar los errores)
+    buffer, pos, consumed = '', 0, 0
+    # Lo siguiente que puede venir: '[' al principio, una película (o ']' si el array está vacío)
+    # después del '[', una película después de cada coma y una coma o ']' después de cada película
+    expected = '['
+    finished = False
+    while not finished:
+        chunk = body.read(chunk_size)
+        finished = not chunk
+        consumed += pos
+        buffer = buffer[pos:] + utf8.decode(chunk or b'', final=finished)
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos == len(buffer):
+                break
+            char = buffer[pos]
+            if expected == '[':
+                if char != '[':
+                    raise ValueError("El fichero no contiene un array JSON de películas")
+                expected = 'primera'
+                pos += 1
+            elif char == ']' and expected != 'pelicula':
+                return
+            elif expected == 'separador':
+                if char != ',':
+                    raise ValueError(f"Falta una coma entre películas (carácter {consumed + pos})")
+                expected = 'pelicula'
+                pos += 1
+            elif char in ',]':
+                raise ValueError(f"Coma sobrante en el array de películas (carácter {consumed + pos})")
+            else:
+                try:
+                    movie, pos = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    # Película a medias: falta leer el siguiente trozo (salvo que ya no quede nada)
+                    if finished:
+                        raise
+                    break
+                expected = 'separador'
+                yield movie
+    raise ValueError("El fichero JSON termina antes de cerrar el array de películas")
+
+
+# Tablas normalizadas de cada lista (Base de Datos/migraciones/002_listas_normalizadas.sql):
+# campo de la API -> (tabla de nombres, su clave, tabla de unión con peliculas)
+LIST_TABLES = {
+    'production_companies': ('companias', 'compania_id', 'peliculas_companias'),
+    'production_countries': ('paises', 'pais_id', 'peliculas_paises'),
+    'spoken_languages': ('idiomas', 'idioma_id', 'peliculas_idiomas'),
+}
+
+def save_movie_lists(cur, movie_lists, replace=False):
+    # Guarda en bloque las compañías, países e idiomas de todas las películas del fichero:
+    # dos sentencias por lista (nombres nuevos y relaciones) en vez de una por película y nombre.
+    # movie_lists: {movie_id: {'production_companies': [nombres], ...}}
+    # Con replace=True se borran antes las relaciones de esas películas (actualizaciones).
+    if not movie_lists:
+        return
+    if replace:
+        for _, _, link_table in LIST_TABLES.values():
+            cur.execute(f"DELETE FROM {link_table} WHERE movie_id = ANY(%s)", (list(movie_lists),))
+    for field, (table, id_column, link_table) in LIST_TABLES.items():
+        pairs = [
+            (movie_id, name.strip())
+            for movie_id, lists in movie_lists.items()
+            for name in lists.get(field) or []
+            if name and name.strip()
+        ]
+        if not pairs:
+            continue
+        movie_ids = [movie_id for movie_id, _ in pairs]
+        names = [name for _, name in pairs]
+        cur.execute(f"""
+            INSERT INTO {table} (nombre)
+            SELECT DISTINCT unnest(%s::text[])
+            ON CONFLICT (nombre) DO NOTHING;
+        """, (names,))
+        cur.execute(f"""
+            INSERT INTO {link_table} (movie_id, {id_column})
+            SELECT d.movie_id, t.{id_column}
+            FROM unnest(%s::int[], %s::text[]) AS d(movie_id, nombre)
+            JOIN {table} t ON t.nombre = d.nombre
+            ON CONFLICT DO NOTHING;
+        """, (movie_ids, names))
+
+
+def refresh_analytics(conn):
+    # Recalcula las tablas de resumen (Base de Datos/analytics-views.sql) si hay cargas que aún no
+    # incluyen. Se llama después del commit de la carga, en su propia transacción: si otra lambda
+    # está refrescando espera a que termine y solo repite si quedan cargas fuera de ese refresco.
+    # Si falla, la carga ya está guardada y las cargas quedan pendientes para el siguiente refresco.
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT refresh_analytics_if_stale();")
+            refreshed = cur.fetchone()[0]
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error refrescando las tablas de resumen: {e}")
+        return False
+    print("Tablas de resumen refrescadas" if refreshed else "Tablas de resumen ya al día")
+    return refreshed
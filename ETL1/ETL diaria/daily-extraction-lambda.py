@@ -1,10 +1,12 @@
-import requests
+import asyncio
 import json
 import boto3
 import io
-import time
 import os
 
+# Extractor asíncrono con límite de peticiones (tmdb_extractor.py, se empaqueta junto a la lambda)
+from tmdb_extractor import TMDBExtractor
+
 # Establecer conexion con Secrets Manager para obtener la API KEY
 def get_tmdb_key():
     secret_name = "api/key"
@@ -27,8 +29,8 @@ def get_tmdb_key():
 def lambda_handler(event, context):
     # VARIABLES GLOBALES
     TMDB_KEY = get_tmdb_key() # Desde SM
-    LATEST_MOVIE_URL = f"https://api.themoviedb.org/3/movie/latest?api_key={TMDB_KEY}&language=en-US"
-    MOVIES_URL = f"https://api.themoviedb.org/3/movie"
+    # Concurrencia y peticiones/s por defecto según los límites de TMDB (TMDB_CONCURRENCY, TMDB_RATE_LIMIT)
+    extractor = TMDBExtractor(TMDB_KEY)
     # Variables del entorno
     BUCKET_NAME = os.environ.get("BUCKET_NAME")
     LAST_ID_FILE = os.environ.get("LAST_ID_FILE")
@@ -44,12 +46,14 @@ def lambda_handler(event, context):
         LAST_SAVED_ID = 0
 
     # 2) Obtener latest_movie_id de la API
-    resp = requests.get(LATEST_MOVIE_URL)
-    if resp.status_code != 200:
-        print("Error al obtener latest_movie_id:", resp.status_code)
+    try:
+        latest_movie_id = asyncio.run(extractor.get_latest_id())
+    except Exception as e:
+        latest_movie_id = None
+        print("Error al obtener latest_movie_id:", e)
+    if latest_movie_id is None:
         return {"statusCode": 500, "body": "Error TMDB"}
 
-    latest_movie_id = resp.json()["id"]
     print(f"TMDB latest_movie_id = {latest_movie_id}")
 
     # 3) Si no hay nuevos, salimos sin tocar el fichero con el ultimo id
@@ -57,19 +61,14 @@ def lambda_handler(event, context):
         print("No hay nuevas películas")
         return {"statusCode": 200, "body": "Sin novedades"}
 
-    # 4) Descarga de películas nuevas
-    movies = []
-    for movie_id in range(LAST_SAVED_ID + 1, latest_movie_id):
-        try:
-            r = requests.get(
-                f"{MOVIES_URL}/{movie_id}?api_key={TMDB_KEY}&language=en-US",
-                timeout=10
-            )
-            if r.status_code == 200:
-                movies.append(r.json())
-        except Exception as e:
-            print(f"Error ID {movie_id}:", e)
-        time.sleep(0.05)
+    # 4) Descarga de películas nuevas (en paralelo, reutilizando conexiones y sin pasar del límite de TMDB)
+    movies = asyncio.run(extractor.fetch_movies(range(LAST_SAVED_ID + 1, latest_movie_id)))
+    stats = extractor.stats()
+    print(f"Descargadas {stats['movies']} películas de {stats['ids']} ids en {stats['seconds']} s "
+          f"({stats['ids_per_second']} ids/s, {stats['not_found']} 404, {stats['rate_limited']} 429, "
+          f"{stats['failed']} fallidos)")
+    if extractor.failed_ids:
+        print(f"Ids no descargados tras los reintentos: {extractor.failed_ids}")
 
     # 5) Subir JSON con los datos
     file_name = f"movies_{LAST_SAVED_ID+1}_to_{latest_movie_id}.json"
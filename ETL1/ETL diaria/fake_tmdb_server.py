@@ -0,0 +1,158 @@
+# Servidor falso de la API de TMDB (GET /3/movie/latest y /3/movie/<id>) para probar el extractor
+# sin red ni API key: latencia, huecos de ids (404) y límite de peticiones por segundo configurables.
+# Cuando se pasa del límite responde 429 con Retry-After, como la API real. Cuenta peticiones,
+# 429 y conexiones abiertas (con keep-alive deben ser muchas menos que peticiones).
+# Se usa desde tmdb_extractor.py (--mock) o desde la línea de comandos:
+#   python fake_tmdb_server.py --port 8766 --latest 20000 --rate-limit 50 --delay 0.05
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MOVIE_PATH = re.compile(r"^/3/movie/(\d+|latest)(?:\?|$)")
+
+
+def fake_movie(movie_id):
+    # Detalle de película con los mismos campos que devuelve TMDB
+    return {
+        "adult": False,
+        "belongs_to_collection": None,
+        "budget": movie_id * 1000,
+        "genres": [{"id": 18, "name": "Drama"}],
+        "id": movie_id,
+        "origin_country": ["US"],
+        "original_language": "en",
+        "original_title": f"Movie {movie_id}",
+        "overview": "Sinopsis de prueba.",
+        "popularity": 1.5,
+        "production_companies": [],
+        "production_countries": [{"iso_3166_1": "US", "name": "United States of America"}],
+        "release_date": "2024-01-01",
+        "revenue": 0,
+        "runtime": 90,
+        "spoken_languages": [{"english_name": "English", "iso_639_1": "en", "name": "English"}],
+        "status": "Released",
+        "tagline": None,
+        "title": f"Película {movie_id}",
+        "vote_average": 6.5,
+        "vote_count": 10,
+    }
+
+
+class FakeTMDBServer:
+
+    def __init__(self, port=0, latest=20000, rate_limit=50, delay=0.0, missing_every=7, retry_after=1):
+        self.latest = latest
+        self.rate_limit = rate_limit
+        self.delay = delay
+        self.missing_every = missing_every
+        self.retry_after = retry_after
+        self.requests = 0
+        self.rate_limited = 0
+        self.connections = 0
+        self._window = (0, 0)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}/3"
+
+    def _allow(self):
+        # Ventana fija de un segundo: como mucho rate_limit peticiones por segundo
+        with self._lock:
+            self.requests += 1
+            second = int(time.monotonic())
+            start, count = self._window
+            count = count + 1 if start == second else 1
+            self._window = (second, count)
+            if self.rate_limit and count > self.rate_limit:
+                self.rate_limited += 1
+                return False
+            return True
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1 para que el cliente pueda reutilizar la conexión (keep-alive)
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def do_GET(self):
+                match = MOVIE_PATH.match(self.path)
+                if not match:
+                    self._reply(404, {"success": False, "status_code": 34, "status_message": "The resource you requested could not be found."})
+                    return
+                if not server._allow():
+                    self._reply(429, {"success": False, "status_code": 25, "status_message": "Your request count is over the allowed limit."},
+                                {"Retry-After": str(server.retry_after)})
+                    return
+                if server.delay:
+                    time.sleep(server.delay)
+                if match.group(1) == "latest":
+                    self._reply(200, fake_movie(server.latest))
+                    return
+                movie_id = int(match.group(1))
+                if movie_id > server.latest or (server.missing_every and movie_id % server.missing_every == 0):
+                    self._reply(404, {"success": False, "status_code": 34, "status_message": "The resource you requested could not be found."})
+                    return
+                self._reply(200, fake_movie(movie_id))
+
+            def _reply(self, status, body, headers=None):
+                data = json.dumps(body).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    for name, value in (headers or {}).items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor falso de la API de TMDB")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latest", type=int, default=20000, help="Id que devuelve /movie/latest")
+    parser.add_argument("--rate-limit", type=int, default=50, help="Peticiones por segundo antes de responder 429 (0 = sin límite)")
+    parser.add_argument("--delay", type=float, default=0.0, help="Segundos de espera por respuesta")
+    parser.add_argument("--missing-every", type=int, default=7, help="Uno de cada N ids devuelve 404 (0 = ninguno)")
+    args = parser.parse_args()
+    server = FakeTMDBServer(args.port, args.latest, args.rate_limit, args.delay, args.missing_every)
+    print(f"Servidor falso de TMDB en {server.url} (límite {args.rate_limit}/s, delay={args.delay}s)")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
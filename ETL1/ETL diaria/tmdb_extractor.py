@@ -0,0 +1,264 @@
+# Extractor asíncrono de la API de TMDB para la lambda de extracción diaria (y reutilizable desde
+# la extracción completa en lugar del pool de hilos con requests):
+# - un único cliente httpx con conexiones keep-alive (no una conexión nueva por película);
+# - como mucho `concurrency` peticiones a la vez;
+# - token bucket a TMDB_RATE_LIMIT peticiones/s (TMDB documenta un límite de unas 50/s por IP
+#   y 20 conexiones simultáneas, así que por defecto 40/s y 20 conexiones);
+# - 429: se respeta Retry-After parando a todos los workers, 5xx y errores de red: reintentos con
+#   backoff exponencial con jitter. Los 404 son ids que no existen y no se reintentan.
+# Mide ids/s y se puede probar sin red contra fake_tmdb_server.py (o apuntando TMDB_API_URL a él):
+#   python tmdb_extractor.py --mock --start 1 --end 3000
+#   python tmdb_extractor.py --mock --start 1 --end 500 --sequential   (compara con requests + sleep)
+#   python tmdb_extractor.py --base-url https://api.themoviedb.org/3 --api-key ... --start 1 --end 500
+import argparse
+import asyncio
+import email.utils
+import os
+import random
+import time
+
+import httpx
+
+TMDB_API_URL = os.environ.get("TMDB_API_URL", "https://api.themoviedb.org/3")
+TMDB_RATE_LIMIT = float(os.environ.get("TMDB_RATE_LIMIT", "40"))
+TMDB_BURST = int(os.environ.get("TMDB_BURST", "10"))
+TMDB_CONCURRENCY = int(os.environ.get("TMDB_CONCURRENCY", "20"))
+TMDB_MAX_RETRIES = int(os.environ.get("TMDB_MAX_RETRIES", "5"))
+TMDB_TIMEOUT = float(os.environ.get("TMDB_TIMEOUT", "10"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+
+class TokenBucket:
+    # `rate` fichas por segundo con hasta `capacity` acumuladas; pause() vacía el cubo y lo
+    # bloquea un tiempo (Retry-After de un 429) para todos los que esperan ficha
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+
+def retry_after_seconds(value):
+    # Retry-After en segundos o como fecha HTTP; None si no viene o no se entiende
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_seconds(attempt):
+    # Backoff exponencial con jitter completo: entre 0 y BACKOFF_BASE * 2^intento (con tope)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class TMDBExtractor:
+
+    def __init__(self, api_key, base_url=TMDB_API_URL, concurrency=TMDB_CONCURRENCY, rate=TMDB_RATE_LIMIT,
+                 burst=TMDB_BURST, max_retries=TMDB_MAX_RETRIES, timeout=TMDB_TIMEOUT, language="en-US"):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.language = language
+        self.reset_stats()
+
+    def reset_stats(self):
+        self._stats = {
+            "ids": 0,
+            "movies": 0,
+            "not_found": 0,
+            "failed": 0,
+            "requests": 0,
+            "rate_limited": 0,
+            "retries": 0,
+            "seconds": 0.0,
+        }
+        self.failed_ids = []
+
+    def stats(self):
+        # Contadores de la última extracción, con ids/s
+        stats = dict(self._stats)
+        stats["seconds"] = round(stats["seconds"], 2)
+        stats["ids_per_second"] = round(self._stats["ids"] / self._stats["seconds"], 1) if self._stats["seconds"] else 0.0
+        return stats
+
+    def _client(self):
+        # Un cliente por extracción: el pool mantiene abiertas tantas conexiones como workers
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            params={"api_key": self.api_key, "language": self.language},
+            limits=limits,
+            timeout=self.timeout,
+        )
+
+    async def _get(self, client, bucket, path):
+        # JSON de la respuesta, None si es 404. Lanza la última excepción si se agotan los reintentos
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._stats["retries"] += 1
+            await bucket.acquire()
+            self._stats["requests"] += 1
+            try:
+                response = await client.get(path)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"Error de red en {path} ({e.__class__.__name__}), reintento {attempt + 1}")
+                await asyncio.sleep(backoff_seconds(attempt))
+                continue
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code == 404:
+                return None
+            if response.status_code == 429:
+                self._stats["rate_limited"] += 1
+                wait = retry_after_seconds(response.headers.get("Retry-After"))
+                wait = backoff_seconds(attempt) if wait is None else wait + random.uniform(0, BACKOFF_BASE)
+                # Todos los workers paran: si uno recibe 429 el resto también lo recibiría
+                bucket.pause(wait)
+            elif response.status_code < 500:
+                response.raise_for_status()
+            elif attempt < self.max_retries:
+                await asyncio.sleep(backoff_seconds(attempt))
+            if attempt == self.max_retries:
+                response.raise_for_status()
+        return None
+
+    async def get_latest_id(self):
+        async with self._client() as client:
+            bucket = TokenBucket(self.rate, self.burst)
+            latest = await self._get(client, bucket, "/movie/latest")
+        return latest["id"] if latest else None
+
+    async def fetch_movies(self, ids):
+        # Detalle de cada id (los que existen), ordenado por id. Los ids que fallan tras todos los
+        # reintentos se saltan y quedan en failed_ids
+        self.reset_stats()
+        queue = asyncio.Queue()
+        for movie_id in ids:
+            queue.put_nowait(movie_id)
+        self._stats["ids"] = queue.qsize()
+        movies = {}
+        bucket = TokenBucket(self.rate, self.burst)
+        start = time.perf_counter()
+
+        async def worker(client):
+            while True:
+                try:
+                    movie_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    movie = await self._get(client, bucket, f"/movie/{movie_id}")
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code in (401, 403):
+                        # API key inválida: fallarían todos los ids
+                        raise
+                    print(f"Error ID {movie_id}: {e}")
+                    self._stats["failed"] += 1
+                    self.failed_ids.append(movie_id)
+                    continue
+                except (httpx.HTTPError, ValueError) as e:
+                    print(f"Error ID {movie_id}: {e}")
+                    self._stats["failed"] += 1
+                    self.failed_ids.append(movie_id)
+                    continue
+                if movie is None:
+                    self._stats["not_found"] += 1
+                else:
+                    movies[movie_id] = movie
+
+        async with self._client() as client:
+            await asyncio.gather(*(worker(client) for _ in range(self.concurrency)))
+        self._stats["seconds"] = time.perf_counter() - start
+        self._stats["movies"] = len(movies)
+        return [movies[movie_id] for movie_id in sorted(movies)]
+
+
+def sequential_baseline(ids, api_key, base_url):
+    # Lo que hacía antes la lambda diaria: requests.get por id (conexión nueva cada vez) y sleep(0.05)
+    import requests
+    start = time.perf_counter()
+    movies = 0
+    for movie_id in ids:
+        try:
+            r = requests.get(f"{base_url}/movie/{movie_id}?api_key={api_key}&language=en-US", timeout=10)
+            if r.status_code == 200:
+                movies += 1
+        except Exception as e:
+            print(f"Error ID {movie_id}:", e)
+        time.sleep(0.05)
+    return movies, time.perf_counter() - start
+
+
+def print_stats(label, stats):
+    print(f"{label}: {stats['ids']} ids en {stats['seconds']} s -> {stats['ids_per_second']} ids/s "
+          f"({stats['movies']} películas, {stats['not_found']} 404, {stats['failed']} fallidos, "
+          f"{stats['rate_limited']} 429, {stats['retries']} reintentos, {stats['requests']} peticiones)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extracción asíncrona de películas de TMDB con medida de ids/s")
+    parser.add_argument("--start", type=int, default=1)
+    parser.add_argument("--end", type=int, default=2000, help="Último id (incluido)")
+    parser.add_argument("--base-url", default=TMDB_API_URL)
+    parser.add_argument("--api-key", default=os.environ.get("API_KEY", "fake"))
+    parser.add_argument("--concurrency", type=int, default=TMDB_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=TMDB_RATE_LIMIT, help="Peticiones por segundo")
+    parser.add_argument("--burst", type=int, default=TMDB_BURST)
+    parser.add_argument("--mock", action="store_true", help="Levantar fake_tmdb_server.py y extraer de él")
+    parser.add_argument("--mock-rate-limit", type=int, default=50, help="Límite por segundo del servidor falso")
+    parser.add_argument("--mock-delay", type=float, default=0.05, help="Latencia del servidor falso")
+    parser.add_argument("--sequential", action="store_true", help="Medir también la extracción secuencial anterior")
+    args = parser.parse_args()
+
+    ids = range(args.start, args.end + 1)
+    server = None
+    if args.mock:
+        from fake_tmdb_server import FakeTMDBServer
+        server = FakeTMDBServer(latest=args.end, rate_limit=args.mock_rate_limit, delay=args.mock_delay).start()
+        args.base_url = server.url
+    try:
+        extractor = TMDBExtractor(args.api_key, args.base_url, args.concurrency, args.rate, args.burst)
+        asyncio.run(extractor.fetch_movies(ids))
+        print_stats(f"Asíncrono ({args.concurrency} conexiones, {args.rate:g}/s)", extractor.stats())
+        if server:
+            print(f"  servidor: {server.requests} peticiones en {server.connections} conexiones, {server.rate_limited} respondidas con 429")
+        if args.sequential:
+            movies, seconds = sequential_baseline(ids, args.api_key, args.base_url)
+            print(f"Secuencial (requests + sleep 0.05): {len(ids)} ids en {seconds:.2f} s -> {len(ids) / seconds:.1f} ids/s ({movies} películas)")
+    finally:
+        if server:
+            server.stop()
@@ -3,9 +3,21 @@ import json
 import psycopg
 import os
 
+# Código común de las lambdas de carga (capa ETL1/Capas/layer.zip)
+from carga_peliculas import LIST_TABLES, iter_movies, refresh_analytics, save_movie_lists
+
+# Películas que se guardan en la BD de una vez
+LOAD_BATCH_SIZE = int(os.environ.get('LOAD_BATCH_SIZE', '1000'))
+
 def lambda_handler(event, context):
     # Lambda function para procesar un archivo JSON de películas desde S3
     # y actualizar la base de datos RDS con validación completa.
+    # Con {'action': 'refresh_analytics'} solo refresca las tablas de resumen: el notebook de
+    # invocación en paralelo manda cada fichero con 'refresh_analytics': False y refresca una vez
+    # al terminar todos.
+    
+    if event.get('action') == 'refresh_analytics':
+        return refresh_analytics_handler()
     
     try:
         # Obtener información del archivo desde el evento
@@ -21,7 +33,9 @@ def lambda_handler(event, context):
         rds_key = get_rds_key()
         
         # Procesar archivo
-        processed, inserted, updated = process_movie_file(s3, bucket_name, file_key, rds_key)
+        processed, inserted, updated = process_movie_file(
+            s3, bucket_name, file_key, rds_key, refresh=event.get('refresh_analytics', True)
+        )
         
         return {
             'statusCode': 200,
@@ -43,6 +57,25 @@ def lambda_handler(event, context):
             })
         }
 
+def refresh_analytics_handler():
+    # Refresca las tablas de resumen si hay cargas que aún no incluyen
+    try:
+        conn = connect_db(get_rds_key())
+        try:
+            refreshed = refresh_analytics(conn)
+        finally:
+            conn.close()
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'refreshed': refreshed})
+        }
+    except Exception as e:
+        print(f"Error refrescando las tablas de resumen: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
 def get_rds_key():
     # Obtener credenciales de RDS desde AWS Secrets Manager
     secret_name = os.environ['DB_KEY']
@@ -68,33 +101,39 @@ def get_rds_key():
         print(f"Error al obtener el secreto: {e}")
         raise e
 
-def process_movie_file(s3_client, bucket, key, rds_credentials):
-    # Procesa un archivo JSON desde S3 y actualiza la base de datos
+
+def connect_db(rds_credentials):
+    return psycopg.connect(
+        host=rds_credentials['host'],
+        user=rds_credentials['username'],
+        password=rds_credentials['password'],
+        dbname=rds_credentials['dbname'],
+        port=rds_credentials['port']
+    )
+
+
+def process_movie_file(s3_client, bucket, key, rds_credentials, refresh=True):
+    # Procesa un archivo JSON desde S3 y actualiza la base de datos.
+    # Con refresh=False no refresca las tablas de resumen al terminar (lo hace quien lanza la carga)
     
     try:
-        # Leer archivo JSON desde S3
+        # Abrir archivo JSON desde S3 (se lee película a película con iter_movies)
         file_obj = s3_client.get_object(Bucket=bucket, Key=key)
-        content = file_obj['Body'].read().decode('utf-8')
-        movies = json.loads(content)
-        
-        print(f"Archivo leído: {len(movies)} películas encontradas")
         
         # Conectar a la base de datos
-        conn = psycopg.connect(
-            host=rds_credentials['host'],
-            user=rds_credentials['username'],
-            password=rds_credentials['password'],
-            dbname=rds_credentials['dbname'],
-            port=rds_credentials['port']
-        )
+        conn = connect_db(rds_credentials)
         
         processed_count = 0
         updated_count = 0
         inserted_count = 0
+        # Filas, géneros y listas de las películas del lote actual (se guardan cada LOAD_BATCH_SIZE)
+        movie_rows = {}
+        movie_genres = {}
+        movie_lists = {}
         
         try:
             with conn.cursor() as cur:
-                for movie in movies:
+                for movie in iter_movies(file_obj['Body']):
                     # Limpiar y validar datos de la película
                     cleaned_movie = clean_and_validate_movie(movie)
                     if not cleaned_movie:
@@ -102,27 +141,40 @@ def process_movie_file(s3_client, bucket, key, rds_credentials):
                     
                     movie_id = cleaned_movie['id']
                     
-                    # Verificar si la película ya existe
-                    cur.execute("SELECT movie_id FROM peliculas WHERE movie_id = %s", (movie_id,))
-                    exists = cur.fetchone()
-                    
-                    if exists:
-                        # Actualizar película existente con campos completos
-                        update_movie(cur, cleaned_movie)
-                        updated_count += 1
-                    else:
-                        # Insertar nueva película
-                        insert_movie(cur, cleaned_movie)
-                        inserted_count += 1
-                    
+                    # Fila y géneros de la película (si el ID se repite en el fichero vale la última,
+                    # como cuando se actualizaba una a una)
+                    movie_rows[movie_id] = movie_row(cleaned_movie)
                     # Gestionar géneros (usar datos originales para géneros)
-                    update_movie_genres(cur, movie_id, movie.get('genres', []))
+                    movie_genres[movie_id] = movie.get('genres') or []
+                    movie_lists[movie_id] = {
+                        field: [item.get('name') for item in cleaned_movie[field]]
+                        for field in LIST_TABLES
+                    }
                     
                     processed_count += 1
+                    
+                    if len(movie_rows) >= LOAD_BATCH_SIZE:
+                        inserted, updated = save_batch(cur, movie_rows, movie_genres, movie_lists)
+                        inserted_count += inserted
+                        updated_count += updated
+                
+                if movie_rows:
+                    inserted, updated = save_batch(cur, movie_rows, movie_genres, movie_lists)
+                    inserted_count += inserted
+                    updated_count += updated
+                
+                # Anotar la carga para el refresco de las tablas de resumen (Base de Datos/analytics-views.sql)
+                cur.execute("SELECT mark_analytics_stale();")
+                # Marcar nueva versión de datos (invalida la caché de resultados de la API al hacer commit)
+                cur.execute("SELECT bump_data_version();")
             
             conn.commit()
             print(f"Procesamiento completado: {processed_count} películas ({inserted_count} insertadas, {updated_count} actualizadas)")
             
+            # Fuera de la transacción de la carga, para no bloquear a las demás lambdas
+            if refresh:
+                refresh_analytics(conn)
+            
         except Exception as e:
             conn.rollback()
             raise e
@@ -135,20 +187,30 @@ def process_movie_file(s3_client, bucket, key, rds_credentials):
         print(f"Error procesando {key}: {str(e)}")
         raise e
 
-def insert_movie(cursor, movie):
-    # Inserta una nueva película con todos los campos disponibles
-    cursor.execute("""
-        INSERT INTO peliculas (
-            movie_id, titulo, release_date, duracion, vote_average, vote_count,
-            origin_country, overview, revenue, budget, adult, belong_to_collection,
-            original_language, original_title, popularity,
-            production_companies, production_countries, spoken_languages,
-            status, tagline
-        ) VALUES (
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-        )
-    """, (
+def save_batch(cursor, movie_rows, movie_genres, movie_lists):
+    # Guarda un lote de películas en bloque: un INSERT ... ON CONFLICT DO UPDATE en lugar de
+    # SELECT + INSERT/UPDATE por película, sus géneros y sus compañías, países e idiomas
+    # (sustituyen a los anteriores). Vacía las estructuras y devuelve (insertadas, actualizadas)
+    counts = upsert_movies(cursor, movie_rows.values())
+    save_movie_genres(cursor, movie_genres)
+    save_movie_lists(cursor, movie_lists, replace=True)
+    movie_rows.clear()
+    movie_genres.clear()
+    movie_lists.clear()
+    return counts
+
+# Columnas de peliculas en el orden de movie_row
+MOVIE_COLUMNS = (
+    'movie_id', 'titulo', 'release_date', 'duracion', 'vote_average', 'vote_count',
+    'origin_country', 'overview', 'revenue', 'budget', 'adult', 'belong_to_collection',
+    'original_language', 'original_title', 'popularity',
+    'production_companies', 'production_countries', 'spoken_languages',
+    'status', 'tagline'
+)
+
+def movie_row(movie):
+    # Fila de peliculas con todos los campos disponibles, en el orden de MOVIE_COLUMNS
+    return (
         movie['id'],
         movie['title'],
         movie['release_date'],
@@ -169,79 +231,75 @@ def insert_movie(cursor, movie):
         ','.join([sl.get('name', '') for sl in movie['spoken_languages']]) if movie['spoken_languages'] else None,
         movie['status'],
         movie['tagline']
-    ))
+    )
 
-def update_movie(cursor, movie):
-    # Actualiza una película existente con los campos faltantes
-    cursor.execute("""
-        UPDATE peliculas SET
-            titulo = %s,
-            release_date = %s,
-            duracion = %s,
-            vote_average = %s,
-            vote_count = %s,
-            origin_country = %s,
-            overview = %s,
-            revenue = %s,
-            budget = %s,
-            adult = %s,
-            belong_to_collection = %s,
-            original_language = %s,
-            original_title = %s,
-            popularity = %s,
-            production_companies = %s,
-            production_countries = %s,
-            spoken_languages = %s,
-            status = %s,
-            tagline = %s
-        WHERE movie_id = %s
-    """, (
-        movie['title'],
-        movie['release_date'],
-        movie['runtime'],
-        movie['vote_average'],
-        movie['vote_count'],
-        ','.join([c for c in movie['origin_country'] if c]) if movie['origin_country'] else None,
-        movie['overview'],
-        movie['revenue'],
-        movie['budget'],
-        movie['adult'],
-        json.dumps(movie['belongs_to_collection']) if movie['belongs_to_collection'] else None,
-        movie['original_language'],
-        movie['original_title'],
-        movie['popularity'],
-        ','.join([pc.get('name', '') for pc in movie['production_companies']]) if movie['production_companies'] else None,
-        ','.join([pc.get('name', '') for pc in movie['production_countries']]) if movie['production_countries'] else None,
-        ','.join([sl.get('name', '') for sl in movie['spoken_languages']]) if movie['spoken_languages'] else None,
-        movie['status'],
-        movie['tagline'],
-        movie['id']
-    ))
+def upsert_movies(cursor, movie_rows):
+    # Inserta las películas nuevas y actualiza las existentes con una sola sentencia:
+    # COPY a una tabla temporal (sin WAL, se borra con el commit) y INSERT ... ON CONFLICT DO UPDATE.
+    # movie_rows no puede repetir movie_id (ON CONFLICT no actualiza dos veces la misma fila).
+    # Devuelve (insertadas, actualizadas): xmax = 0 en la fila devuelta solo si es nueva
+    columns = ', '.join(MOVIE_COLUMNS)
+    updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in MOVIE_COLUMNS[1:])
+    # Se llama una vez por lote dentro de la misma transacción: la tabla se reutiliza vaciada
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS peliculas_carga (LIKE peliculas) ON COMMIT DROP")
+    cursor.execute("TRUNCATE peliculas_carga")
+    with cursor.copy(f"COPY peliculas_carga ({columns}) FROM STDIN") as copy:
+        for row in movie_rows:
+            copy.write_row(row)
+    cursor.execute(f"""
+        INSERT INTO peliculas ({columns})
+        SELECT {columns} FROM peliculas_carga
+        ON CONFLICT (movie_id) DO UPDATE SET {updates}
+        RETURNING (xmax = 0) AS insertada
+    """)
+    results = [row[0] for row in cursor.fetchall()]
+    inserted = sum(results)
+    return inserted, len(results) - inserted
 
-def update_movie_genres(cursor, movie_id, genres):
-    # Actualiza la relación película-géneros
-    # Primero, eliminar géneros existentes para esta película
-    cursor.execute("DELETE FROM peliculas_generos WHERE movie_id = %s", (movie_id,))
+def save_movie_genres(cursor, movie_genres):
+    # Deja en peliculas_generos exactamente los géneros del fichero de cada película:
+    # los géneros se dan de alta una vez por fichero y las relaciones se comparan en bloque
+    # (se borran las que ya no están y se añaden las nuevas) en lugar de borrar y reinsertar una a una.
+    # movie_genres: {movie_id: [{'id': ..., 'name': ...}, ...]}
+    if not movie_genres:
+        return
+    genre_names = {}
+    pairs = set()
+    for movie_id, genres in movie_genres.items():
+        for genre in genres:
+            genre_id = genre.get('id')
+            genre_name = genre.get('name')
+            if genre_id and genre_name:
+                genre_names.setdefault(genre_id, genre_name)
+                pairs.add((movie_id, genre_id))
+    movie_ids = [movie_id for movie_id, _ in pairs]
+    genre_ids = [genre_id for _, genre_id in pairs]
     
-    # Insertar nuevos géneros
-    for genre in genres:
-        genre_id = genre.get('id')
-        genre_name = genre.get('name')
-        
-        if genre_id and genre_name:
-            # Asegurar que el género existe en la tabla géneros
-            cursor.execute("""
-                INSERT INTO generos (genero_id, nombre) 
-                VALUES (%s, %s) 
-                ON CONFLICT (genero_id) DO NOTHING
-            """, (genre_id, genre_name))
-            
-            # Insertar relación película-género
-            cursor.execute("""
-                INSERT INTO peliculas_generos (movie_id, genero_id)
-                VALUES (%s, %s)
-                ON CONFLICT DO NOTHING
-            """, (movie_id, genre_id))
+    # Asegurar que los géneros existen en la tabla géneros
+    if genre_names:
+        cursor.execute("""
+            INSERT INTO generos (genero_id, nombre)
+            SELECT * FROM unnest(%s::int[], %s::text[])
+            ON CONFLICT (genero_id) DO NOTHING
+        """, (list(genre_names), list(genre_names.values())))
+    
+    # Quitar las relaciones que ya no vienen en el fichero (también las de películas sin géneros)
+    cursor.execute("""
+        DELETE FROM peliculas_generos pg
+        WHERE pg.movie_id = ANY(%s)
+          AND NOT EXISTS (
+              SELECT 1 FROM unnest(%s::int[], %s::int[]) AS n(movie_id, genero_id)
+              WHERE n.movie_id = pg.movie_id AND n.genero_id = pg.genero_id
+          )
+    """, (list(movie_genres), movie_ids, genre_ids))
+    
+    # Insertar las relaciones nuevas
+    if pairs:
+        cursor.execute("""
+            INSERT INTO peliculas_generos (movie_id, genero_id)
+            SELECT * FROM unnest(%s::int[], %s::int[])
+            ON CONFLICT DO NOTHING
+        """, (movie_ids, genre_ids))
 
 # Funciones de validación y limpieza de datos
 def clean_and_validate_movie(movie):
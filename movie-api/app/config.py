@@ -1,13 +1,20 @@
 import os
 import json
-import boto3
-from botocore.exceptions import ClientError
+import asyncio
+import logging
+import time
 from dotenv import load_dotenv
 
 # Cargar variables del entorno
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 def get_db_key():
+    # boto3 tarda en importarse: solo se carga cuando hay que pedir el secreto
+    import boto3
+    from botocore.exceptions import ClientError
+
     secret_name = os.getenv("DB_KEY")
     region_name = os.getenv("AWS_REGION")
 
@@ -43,5 +50,115 @@ def get_db_key():
     except Exception as e:
         raise RuntimeError(f"Error inesperado al obtener el secreto: {e}")
 
-# Diccionario con la configuración de conexión
-DB_CONFIG = get_db_key()
\ No newline at end of file
+# Reintentos y caché del secreto de la BD
+SECRETS_FETCH_RETRIES = int(os.getenv("SECRETS_FETCH_RETRIES", "4"))
+SECRETS_FETCH_BACKOFF = float(os.getenv("SECRETS_FETCH_BACKOFF", "0.5"))
+SECRETS_CACHE_TTL = float(os.getenv("SECRETS_CACHE_TTL", "3600"))
+
+# Diccionario con la configuración de conexión. Ya no se pide al importar: se carga en el
+# lifespan (o en la primera consulta) y queda cacheado en el proceso
+_db_config = None
+_db_config_fetched_at = 0.0
+_db_config_lock = None
+
+async def load_db_config(force=False):
+    # Devuelve la configuración de la BD, pidiéndola a Secrets Manager en un hilo si no está
+    # cacheada o ha caducado. Los fallos se reintentan con backoff exponencial; si la renovación
+    # falla y hay una copia anterior, se sigue usando esa.
+    global _db_config, _db_config_fetched_at, _db_config_lock
+    if _db_config_lock is None:
+        _db_config_lock = asyncio.Lock()
+    async with _db_config_lock:
+        fresh = _db_config is not None and time.monotonic() - _db_config_fetched_at < SECRETS_CACHE_TTL
+        if fresh and not force:
+            return _db_config
+        for attempt in range(SECRETS_FETCH_RETRIES):
+            try:
+                _db_config = await asyncio.to_thread(get_db_key)
+                _db_config_fetched_at = time.monotonic()
+                return _db_config
+            except ValueError:
+                # Configuración incorrecta (DB_KEY ausente, JSON inválido): reintentar no sirve
+                raise
+            except Exception as e:
+                if attempt == SECRETS_FETCH_RETRIES - 1:
+                    if _db_config is not None:
+                        logger.warning(f"No se pudo renovar el secreto de la BD, se usa el anterior: {e}")
+                        return _db_config
+                    raise
+                delay = SECRETS_FETCH_BACKOFF * 2 ** attempt
+                logger.warning(f"Error obteniendo el secreto de la BD (intento {attempt + 1}), se reintenta en {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+
+# Configuración del pool de conexiones a la BD (compartido por todos los endpoints)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Segundos máximos esperando una conexión libre antes de fallar
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Las conexiones se reciclan pasado este tiempo (s) o tras estar ociosas demasiado
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+# Cada cuántos segundos se comprueban las conexiones ociosas del pool
+DB_POOL_HEALTHCHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTHCHECK_INTERVAL", "60"))
+
+# Tamaño de los pools para trabajo bloqueante fuera del event loop
+RENDER_POOL_SIZE = int(os.getenv("RENDER_POOL_SIZE", "2"))
+INFERENCE_POOL_SIZE = int(os.getenv("INFERENCE_POOL_SIZE", "4"))
+
+# Caché de resultados de execute_sql, invalidada por la versión de datos que suben las ETL
+RESULT_CACHE_MAX_SIZE = int(os.getenv("RESULT_CACHE_MAX_SIZE", "2000"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "86400"))
+# Cada cuántos segundos se relee la versión de datos además de escuchar NOTIFY
+DATA_VERSION_POLL_INTERVAL = float(os.getenv("DATA_VERSION_POLL_INTERVAL", "30"))
+
+# Caché de gráficos renderizados por /ask-visual
+CHART_CACHE_MAX_SIZE = int(os.getenv("CHART_CACHE_MAX_SIZE", "500"))
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+# max-age (s) de la cabecera Cache-Control de las imágenes; después el cliente revalida con el ETag
+CHART_CACHE_MAX_AGE = int(os.getenv("CHART_CACHE_MAX_AGE", "300"))
+
+# Películas por bloque en /predict/batch (una llamada al modelo por bloque)
+PREDICT_BATCH_CHUNK_SIZE = int(os.getenv("PREDICT_BATCH_CHUNK_SIZE", "1000"))
+# Filas por bloque al leer el cursor de servidor de /ask-text?stream=true
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "1000"))
+# Controles de la SQL generada por Gemini (ver app/utils/query_guard.py): coste máximo según
+# EXPLAIN (unidades del planificador de PostgreSQL), LIMIT que se añade si falta, LIMIT máximo
+# y statement_timeout de cada consulta (0 = sin límite)
+QUERY_MAX_COST = float(os.getenv("QUERY_MAX_COST", "1000000"))
+QUERY_DEFAULT_LIMIT = int(os.getenv("QUERY_DEFAULT_LIMIT", "100"))
+QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "1000"))
+QUERY_STATEMENT_TIMEOUT_MS = int(os.getenv("QUERY_STATEMENT_TIMEOUT_MS", "5000"))
+
+# Usar el bosque compilado (app/models/model_rf_compiled) en lugar de model_rf.pkl si existe
+USE_COMPILED_MODEL = os.getenv("USE_COMPILED_MODEL", "true").lower() in ("1", "true", "yes")
+
+# Registro de versiones del modelo de /predict (ver app/models/model_registry.py)
+MODEL_REGISTRY_DIR = os.getenv(
+    "MODEL_REGISTRY_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "models", "registry"))
+)
+# Cada cuántos segundos cada worker comprueba si ha cambiado la versión activa
+MODEL_REGISTRY_POLL_INTERVAL = float(os.getenv("MODEL_REGISTRY_POLL_INTERVAL", "10"))
+# Token para los endpoints /admin (sin token los endpoints quedan deshabilitados)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Llamadas a Gemini: tiempo máximo por pregunta (esperando un hueco incluido) y llamadas simultáneas
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "8"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+# Endpoint alternativo de la API (REST), p. ej. el servidor falso de app/tests/fake_llm_server.py
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+# Circuit breaker: con al menos MIN_CALLS de las últimas WINDOW llamadas, si la proporción de
+# fallos (errores, timeouts o llamadas más lentas que SLOW_CALL s) llega a FAILURE_RATIO se deja
+# de llamar a Gemini durante OPEN_SECONDS y las preguntas van directas a los fallbacks
+GEMINI_BREAKER_FAILURE_RATIO = float(os.getenv("GEMINI_BREAKER_FAILURE_RATIO", "0.5"))
+GEMINI_BREAKER_SLOW_CALL = float(os.getenv("GEMINI_BREAKER_SLOW_CALL", "5"))
+GEMINI_BREAKER_WINDOW = int(os.getenv("GEMINI_BREAKER_WINDOW", "20"))
+GEMINI_BREAKER_MIN_CALLS = int(os.getenv("GEMINI_BREAKER_MIN_CALLS", "5"))
+GEMINI_BREAKER_OPEN_SECONDS = float(os.getenv("GEMINI_BREAKER_OPEN_SECONDS", "30"))
+# Caché de contexto de Gemini para la parte fija del prompt (reglas + esquema). Desactivada por
+# defecto: Gemini solo la acepta con versiones fijas del modelo (gemini-1.5-flash-002, no el alias)
+# y a partir de un mínimo de tokens (32.768 en gemini-1.5) muy por encima del prefijo actual.
+# Si el prefijo no llega a GEMINI_CONTEXT_CACHE_MIN_TOKENS ni se intenta y va como system_instruction
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() in ("1", "true", "yes")
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "32768"))
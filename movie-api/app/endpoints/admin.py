@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+import hmac
+from app.config import ADMIN_TOKEN, MODEL_REGISTRY_DIR
+from app.endpoints import predict
+from app.models.model_registry import list_versions, previous_version, read_active, read_manifest, rollback, set_active
+
+router = APIRouter()
+
+def require_admin(x_admin_token: str = Header(None)):
+    # Los endpoints de administración exigen la cabecera X-Admin-Token
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Administración deshabilitada: configure ADMIN_TOKEN")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Token de administración inválido")
+
+@router.get("/admin/models", dependencies=[Depends(require_admin)])
+async def get_models():
+    """
+    Lista las versiones del registro de modelos, la versión activa y la cargada en este worker.
+    """
+    return {
+        "active": read_active(MODEL_REGISTRY_DIR),
+        "loaded": predict.bundle.info() if predict.bundle else None,
+        "versions": list_versions(MODEL_REGISTRY_DIR)
+    }
+
+@router.post("/admin/models/{version}/promote", dependencies=[Depends(require_admin)])
+async def promote_model(version: str):
+    """
+    Activa una versión del registro. Primero se carga y se verifican sus checksums en este
+    worker; solo si todo va bien se actualiza el puntero y el resto de workers la cargan en segundo plano.
+    """
+    try:
+        read_manifest(MODEL_REGISTRY_DIR, version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    try:
+        bundle = await predict.reload_model(version)
+    except Exception as e:
+        raise HTTPException(status_code=409, detail=f"No se pudo cargar la versión {version}: {e}")
+    state = set_active(MODEL_REGISTRY_DIR, version)
+    return {"active": state, "loaded": bundle.info()}
+
+@router.post("/admin/models/rollback", dependencies=[Depends(require_admin)])
+async def rollback_model():
+    """
+    Vuelve a la versión activa anterior.
+    """
+    try:
+        version = previous_version(MODEL_REGISTRY_DIR)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        bundle = await predict.reload_model(version)
+    except Exception as e:
+        raise HTTPException(status_code=409, detail=f"No se pudo cargar la versión {version}: {e}")
+    state = rollback(MODEL_REGISTRY_DIR)
+    return {"active": state, "loaded": bundle.info()}
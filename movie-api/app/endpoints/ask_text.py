@@ -1,8 +1,12 @@
 from fastapi import APIRouter, Query
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from pydantic import BaseModel
 from app.utils.sql_converter import generate_sql
-from app.models.sql_predictor import execute_sql
+from app.models.sql_predictor import execute_sql, stream_sql
+from app.utils.query_guard import QueryRejected
+from datetime import date, datetime
+from decimal import Decimal
+import json
 import re
 
 router = APIRouter()
@@ -235,6 +239,51 @@ def results_to_html(results, question=""):
     </div>
     """
 
+def json_default(value):
+    # Tipos de PostgreSQL que json.dumps no sabe serializar (como hace FastAPI en la respuesta normal)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+async def stream_results(question, sql_query):
+    # Respuesta NDJSON: una línea de cabecera, una línea por fila (array JSON) y una línea final.
+    # Las filas se leen del cursor de servidor por bloques y cada bloque se envía según llega
+    rows = stream_sql(sql_query)
+    # Los errores de la consulta (SQL inválida, BD caída) se detectan antes de empezar a responder
+    try:
+        columns, plan = await rows.__anext__()
+    except QueryRejected as e:
+        await rows.aclose()
+        return {"error": str(e), "sql_ejecutada": sql_query, "plan": e.report}
+    except Exception as e:
+        await rows.aclose()
+        print(f"Error en ask_text (stream): {e}")
+        return {
+            "error": f"Error al procesar tu consulta: {str(e)}",
+            "sugerencia": "Verifica que tu pregunta sea sobre datos de películas o géneros disponibles en la base de datos."
+        }
+
+    async def generate():
+        total = 0
+        try:
+            yield json.dumps({"pregunta_original": question, "sql_ejecutada": sql_query, "columnas": columns, "plan": plan}, ensure_ascii=False) + "\n"
+            async for batch in rows:
+                total += len(batch)
+                yield "".join(json.dumps(list(row), ensure_ascii=False, default=json_default) + "\n" for row in batch)
+            yield json.dumps({"success": True, "filas": total}) + "\n"
+        except Exception as e:
+            # La respuesta ya ha empezado: el error va como última línea
+            print(f"Error en ask_text (stream) tras {total} filas: {e}")
+            yield json.dumps({"success": False, "filas": total, "error": str(e)}, ensure_ascii=False) + "\n"
+        finally:
+            # Si el cliente se desconecta a mitad se cierra el cursor y se devuelve la conexión al pool
+            await rows.aclose()
+
+    print(f"Enviando resultados en streaming (columnas: {columns})")
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 def is_valid_sql(sql):
     return bool(re.match(r"(?i)^select\s.+\sfrom\s.+", sql.strip()))
 
@@ -280,7 +329,7 @@ async def ask_text_simple(
     print(f"Pregunta texto: {question}")
 
     # Generar SQL
-    sql_query = generate_sql(question)
+    sql_query = await generate_sql(question)
     print(f"SQL generada: {sql_query}")
 
     # Validación
@@ -300,7 +349,7 @@ async def ask_text_simple(
         """
 
     try:
-        results = execute_sql(sql_query)
+        results = await execute_sql(sql_query)
         print(f"Resultados obtenidos: {len(results) if results else 0}")
         
         if not results:
@@ -332,12 +381,19 @@ async def ask_text_simple(
         """
 
 @router.post("/ask-text")
-async def ask_text(data: Question):
+async def ask_text(
+    data: Question,
+    stream: bool = Query(False, description="Devolver las filas en streaming (NDJSON) en lugar de un único JSON")
+):
     """
     Endpoint para consultas de texto (JSON)
     
     Acepta JSON con estructura: {"question": "tu pregunta"}
     Devuelve JSON estructurado.
+    
+    Con `?stream=true` devuelve NDJSON en streaming: una línea con la pregunta, la SQL y las
+    columnas, una línea por fila (array JSON) y una línea final con el número de filas.
+    La memoria no depende del tamaño del resultado, útil cuando la consulta no tiene LIMIT.
     """
     question = data.question
     
@@ -349,7 +405,7 @@ async def ask_text(data: Question):
 
     print(f"Pregunta texto (JSON): {question}")
 
-    sql_query = generate_sql(question)
+    sql_query = await generate_sql(question)
     print(f"SQL generada: {sql_query}")
 
     if not sql_query or len(sql_query.strip()) < 10:
@@ -362,8 +418,11 @@ async def ask_text(data: Question):
             }
         }
 
+    if stream:
+        return await stream_results(question, sql_query)
+
     try:
-        results = execute_sql(sql_query)
+        results = await execute_sql(sql_query)
         print(f"Resultados obtenidos: {len(results) if results else 0}")
 
         if not results:
@@ -378,7 +437,18 @@ async def ask_text(data: Question):
             "success": True,
             "datos": results,
             "pregunta_original": question,
-            "sql_ejecutada": sql_query
+            "sql_ejecutada": sql_query,
+            # Coste estimado y LIMIT añadido o reducido por los controles de app/utils/query_guard.py
+            "plan": getattr(results, "guard", {})
+        }
+
+    except QueryRejected as e:
+        print(f"Consulta rechazada en ask_text: {e}")
+        return {
+            "error": str(e),
+            "sugerencia": "Acota la pregunta con un género, un año o un top N.",
+            "sql_ejecutada": sql_query,
+            "plan": e.report
         }
 
     except Exception as e:
@@ -1,18 +1,31 @@
 from fastapi import APIRouter, Query, Request, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
+from typing import Optional
 from app.utils.sql_converter import generate_sql
-from app.models.sql_predictor import execute_sql
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+from app.models.sql_predictor import execute_sql, get_data_version, normalize_sql
+from app.utils.query_guard import QueryRejected
+from app.utils.charts import render_chart_png
+from app.utils.executors import render_pool
+from app.utils.cache import create_cache
+from app.utils.single_flight import create_single_flight
+from app.config import CHART_CACHE_MAX_SIZE, CHART_CACHE_MAX_BYTES, CHART_CACHE_MAX_AGE
 import io
 import base64
-import matplotlib
-matplotlib.use('Agg')
+import hashlib
 
 router = APIRouter()
 
+# Caché de gráficos ya renderizados (PNG + ETag); la versión de datos forma parte de la clave
+chart_cache = create_cache(
+    "charts",
+    max_size=CHART_CACHE_MAX_SIZE,
+    ttl=86400,
+    max_bytes=CHART_CACHE_MAX_BYTES
+)
+# Gráficos que se están generando ahora mismo (consulta + renderizado), por clave de gráfico
+chart_flight = create_single_flight("charts")
+
 class VisualQuestion(BaseModel):
     question: str
 
@@ -30,68 +43,62 @@ def detect_chart_type(question, sql_query):
     else:
         return "bar"
 
-def create_chart(df, chart_type, question):
-    # Crea el gráfico basado en los datos y tipo
-    plt.figure(figsize=(12, 8))
-    plt.style.use('seaborn-v0_8' if 'seaborn-v0_8' in plt.style.available else 'default')
-    
-    if len(df.columns) == 1:
-        value_counts = df.iloc[:, 0].value_counts().head(10)
-        
-        if chart_type == "pie":
-            colors = plt.cm.Set3(range(len(value_counts)))
-            plt.pie(value_counts.values, labels=value_counts.index, autopct='%1.1f%%', colors=colors)
-            plt.title(f"{question}", fontsize=16, fontweight='bold', pad=20)
-        else:
-            bars = plt.bar(range(len(value_counts)), value_counts.values, color='steelblue', alpha=0.8)
-            plt.xticks(range(len(value_counts)), value_counts.index, rotation=45, ha='right')
-            plt.title(f"{question}", fontsize=16, fontweight='bold', pad=20)
-            plt.ylabel("Cantidad", fontsize=12)
-            plt.grid(axis='y', alpha=0.3)
-            
-            for bar in bars:
-                height = bar.get_height()
-                plt.text(bar.get_x() + bar.get_width()/2., height,
-                        f'{int(height)}', ha='center', va='bottom', fontweight='bold')
-        
-    elif len(df.columns) == 2:
-        if chart_type == "pie":
-            colors = plt.cm.Set3(range(len(df)))
-            plt.pie(df.iloc[:, 1], labels=df.iloc[:, 0], autopct='%1.1f%%', colors=colors)
-            plt.title(f"{question}", fontsize=16, fontweight='bold', pad=20)
-        elif chart_type == "line":
-            plt.plot(df.iloc[:, 0], df.iloc[:, 1], marker='o', linewidth=3, markersize=8, color='steelblue')
-            plt.title(f"📈 {question}", fontsize=16, fontweight='bold', pad=20)
-            plt.xlabel(df.columns[0], fontsize=12)
-            plt.ylabel(df.columns[1], fontsize=12)
-            plt.grid(True, alpha=0.3)
-        else:
-            bars = plt.bar(range(len(df)), df.iloc[:, 1], color='steelblue', alpha=0.8)
-            plt.xticks(range(len(df)), df.iloc[:, 0], rotation=45, ha='right')
-            plt.title(f"{question}", fontsize=16, fontweight='bold', pad=20)
-            plt.ylabel(df.columns[1], fontsize=12)
-            plt.grid(axis='y', alpha=0.3)
-            
-            for bar in bars:
-                height = bar.get_height()
-                plt.text(bar.get_x() + bar.get_width()/2., height,
-                        f'{height:.1f}', ha='center', va='bottom', fontweight='bold')
-            
-    elif len(df.columns) == 3:
-        bars = plt.bar(range(len(df)), df.iloc[:, 2], color='steelblue', alpha=0.8)
-        plt.xticks(range(len(df)), df.iloc[:, 0], rotation=45, ha='right')
-        plt.title(f"{question}", fontsize=16, fontweight='bold', pad=20)
-        plt.ylabel(df.columns[2], fontsize=12)
-        plt.grid(axis='y', alpha=0.3)
-        
-        for bar in bars:
-            height = bar.get_height()
-            plt.text(bar.get_x() + bar.get_width()/2., height,
-                    f'{height:.1f}', ha='center', va='bottom', fontweight='bold')
-    
-    plt.tight_layout()
+def chart_cache_key(sql_query, chart_type, data_version, question):
+    # Clave de la caché de gráficos
+    raw = f"{data_version}|{chart_type}|{normalize_sql(sql_query)}|{question}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def etag_matches(if_none_match, etag):
+    # Comprueba la cabecera If-None-Match (lista de ETags, débiles o fuertes, o "*")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+async def build_chart(sql_query, chart_type, question, chart_key, data_version):
+    # Ejecuta la consulta y renderiza el gráfico; None si la consulta no devuelve datos
+    results = await execute_sql(sql_query)
+    print(f"Resultados obtenidos: {len(results) if results else 0} filas")
+
+    if not results:
+        return None
+    plan = getattr(results, "guard", {})
 
-async def process_visual_question(question: str, return_image: bool = False):
+    # Normalizar resultados a filas
+    if isinstance(results[0], tuple):
+        num_cols = len(results[0])
+    else:
+        results = [(r,) for r in results]
+        num_cols = 1
+
+    # Crear columnas descriptivas
+    if num_cols == 1:
+        columns = ["Valor"]
+    elif num_cols == 2:
+        columns = ["Categoría", "Valor"]
+    elif num_cols == 3:
+        columns = ["Nombre", "Rating", "Cantidad"]
+    else:
+        columns = [f"Col_{i+1}" for i in range(num_cols)]
+
+    print(f"Datos para el gráfico: ({len(results)}, {num_cols})")
+
+    # Crear gráfico (top 10 filas) y convertir a imagen fuera del event loop;
+    # el DataFrame se construye en el proceso de renderizado
+    png_bytes = await render_pool.run(render_chart_png, results[:10], columns, chart_type, question)
+    chart = {
+        "png": png_bytes,
+        # ETag fuerte: hash del contenido de la imagen
+        "etag": f'"{hashlib.sha256(png_bytes).hexdigest()}"',
+        "datos_encontrados": len(results),
+        "columnas": columns,
+        "plan": plan
+    }
+    if chart_key and get_data_version() == data_version:
+        await chart_cache.set(chart_key, chart)
+    return chart
+
+async def process_visual_question(question: str, return_image: bool = False, if_none_match: Optional[str] = None):
     # Función común para procesar preguntas visuales
     
     if not question or len(question.strip()) < 3:
@@ -102,7 +109,8 @@ async def process_visual_question(question: str, return_image: bool = False):
     print(f"Pregunta visual: {question}")
 
     # Generar SQL
-    sql_query = generate_sql(question)
+    sql_query = await generate_sql(question)
+    print(f"SQL generada: {sql_query}")
     
     if not sql_query or not sql_query.strip().lower().startswith("select"):
         error_msg = "No se pudo generar una consulta SQL válida para visualización."
@@ -115,68 +123,50 @@ async def process_visual_question(question: str, return_image: bool = False):
         }
 
     try:
-        results = execute_sql(sql_query)
-        print(f"Resultados obtenidos: {len(results) if results else 0} filas")
-        
-        if not results:
-            error_msg = "No se encontraron datos para tu consulta."
-            if return_image:
-                raise HTTPException(status_code=404, detail=error_msg)
-            return {
-                "error": error_msg,
-                "suggestion": "Prueba con preguntas como: '¿Top géneros?' o '¿Mejores películas?'"
-            }
-
-        # Convertir resultados a DataFrame
-        if isinstance(results[0], tuple):
-            num_cols = len(results[0])
-        else:
-            results = [(r,) for r in results]
-            num_cols = 1
-
-        # Crear columnas descriptivas
-        if num_cols == 1:
-            columns = ["Valor"]
-        elif num_cols == 2:
-            columns = ["Categoría", "Valor"]
-        elif num_cols == 3:
-            columns = ["Nombre", "Rating", "Cantidad"]
-        else:
-            columns = [f"Col_{i+1}" for i in range(num_cols)]
-
-        df = pd.DataFrame(results, columns=columns)
-        print(f"DataFrame creado: {df.shape}")
-
-        # Limitar a top 10 para mejor visualización
-        df = df.head(10)
-
         # Detectar tipo de gráfico automáticamente
         chart_type = detect_chart_type(question, sql_query)
         print(f"Tipo de gráfico: {chart_type}")
 
-        # Crear gráfico mejorado
-        create_chart(df, chart_type, question)
+        # Buscar el gráfico ya renderizado para esta SQL, tipo, versión de datos y pregunta (va en el título)
+        data_version = get_data_version()
+        chart_key = chart_cache_key(sql_query, chart_type, data_version, question) if data_version is not None else None
+        chart = await chart_cache.get(chart_key) if chart_key else None
 
-        # Convertir a imagen
-        buf = io.BytesIO()
-        plt.savefig(buf, format="png", dpi=200, bbox_inches='tight', 
-                   facecolor='white', edgecolor='none')
-        plt.close()
-        buf.seek(0)
+        if chart is None:
+            # Si la misma gráfica ya se está generando para otra petición se espera esa
+            flight_key = chart_key or chart_cache_key(sql_query, chart_type, None, question)
+            chart = await chart_flight.do(flight_key, build_chart, sql_query, chart_type, question, chart_key, data_version)
+
+            if chart is None:
+                error_msg = "No se encontraron datos para tu consulta."
+                if return_image:
+                    raise HTTPException(status_code=404, detail=error_msg)
+                return {
+                    "error": error_msg,
+                    "suggestion": "Prueba con preguntas como: '¿Top géneros?' o '¿Mejores películas?'"
+                }
+        else:
+            print("Gráfico obtenido de la caché")
+
+        # Con versión de datos conocida el gráfico puede reutilizarse hasta la próxima carga
+        cache_control = f"public, max-age={CHART_CACHE_MAX_AGE}" if chart_key else "no-cache"
 
         if return_image:
+            headers = {"ETag": chart["etag"], "Cache-Control": cache_control}
+            if etag_matches(if_none_match, chart["etag"]):
+                return Response(status_code=304, headers=headers)
             # DEVOLVER IMAGEN DIRECTA
             return StreamingResponse(
-                io.BytesIO(buf.read()), 
+                io.BytesIO(chart["png"]), 
                 media_type="image/png",
                 headers={
                     "Content-Disposition": "inline; filename=chart.png",
-                    "Cache-Control": "no-cache"
+                    **headers
                 }
             )
         else:
             # DEVOLVER JSON CON BASE64
-            img_base64 = base64.b64encode(buf.read()).decode("utf-8")
+            img_base64 = base64.b64encode(chart["png"]).decode("utf-8")
             return {
                 "success": True,
                 "grafico": f"data:image/png;base64,{img_base64}",
@@ -184,12 +174,24 @@ async def process_visual_question(question: str, return_image: bool = False):
                 "detalles": {
                     "pregunta": question,
                     "tipo_grafico": chart_type,
-                    "datos_encontrados": len(results),
+                    "datos_encontrados": chart["datos_encontrados"],
                     "sql_ejecutada": sql_query,
-                    "columnas": columns
+                    "columnas": chart["columnas"],
+                    "plan": chart.get("plan", {})
                 }
             }
 
+    except QueryRejected as e:
+        # La consulta no ha pasado los controles de coste/tiempo (app/utils/query_guard.py)
+        print(f"Consulta rechazada en proceso visual: {e}")
+        if return_image:
+            raise HTTPException(status_code=422, detail=str(e))
+        return {
+            "error": str(e),
+            "suggestion": "Acota la pregunta, por ejemplo: '¿Top 10 películas de comedia de 2015?'",
+            "plan": e.report
+        }
+
     except Exception as e:
         print(f"Error en proceso visual: {e}")
         if return_image:
@@ -202,6 +204,7 @@ async def process_visual_question(question: str, return_image: bool = False):
 # ENDPOINT HÍBRIDO
 @router.get("/ask-visual")
 async def ask_visual_get(
+    request: Request,
     question: str = Query(
         ..., 
         description="Escribe tu pregunta sobre películas aquí",
@@ -236,9 +239,12 @@ async def ask_visual_get(
     **Datos NO disponibles en esta BD:**
     - Directores, actores
     
+    **Caché:** la imagen incluye `ETag`; si se envía `If-None-Match` con el mismo valor se responde 304 sin cuerpo.
+    
     """
     
-    return await process_visual_question(question, return_image=(format == "image"))
+    if_none_match = request.headers.get("if-none-match")
+    return await process_visual_question(question, return_image=(format == "image"), if_none_match=if_none_match)
 
 @router.post("/ask-visual")
 async def ask_visual_post(data: VisualQuestion):
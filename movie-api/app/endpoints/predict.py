@@ -1,13 +1,16 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+import asyncio
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import pickle
 import os
-import pandas as pd
 import numpy as np
 from typing import Dict, Any
 import logging
-import psycopg2  # Usar psycopg2 específicamente para este endpoint
-from app.config import DB_CONFIG
+import threading
+from app.config import (PREDICT_BATCH_CHUNK_SIZE, USE_COMPILED_MODEL,
+                        MODEL_REGISTRY_DIR, MODEL_REGISTRY_POLL_INTERVAL)
+from app.models.model_registry import load_bundle, load_version, read_active
+from app.utils.executors import inference_pool
 
 router = APIRouter()
 
@@ -16,37 +19,97 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-# Rutas para el modelo, scaler y features
+# Rutas para el modelo, scaler y features (se usan si el registro no tiene versión activa)
 MODELS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'models'))
 MODEL_PATH = os.path.join(MODELS_DIR, 'model_rf.pkl')
+# Bosque exportado con app.models.forest_engine (se usa en lugar del pickle si existe)
+COMPILED_MODEL_DIR = os.path.join(MODELS_DIR, 'model_rf_compiled')
 SCALER_PATH = os.path.join(MODELS_DIR, 'scaler_rf.pkl')
 FEATURES_PATH = os.path.join(MODELS_DIR, 'model_features.json')
 
-model = None
-scaler = None
-feature_columns = None
+# Versión activa (ModelBundle). Se sustituye con una sola asignación: cada predicción
+# toma la referencia una vez y usa modelo, scaler y features de la misma versión.
+bundle = None
+_reload_lock = None
+_watcher_task = None
+
+def load_active_bundle(version=None):
+    # Carga la versión indicada o la activa del registro; sin registro, los ficheros de app/models
+    if version is None:
+        state = read_active(MODEL_REGISTRY_DIR)
+        version = state["version"] if state else None
+    if version is None:
+        return load_bundle(MODELS_DIR, "legacy", prefer_compiled=USE_COMPILED_MODEL)
+    return load_version(MODEL_REGISTRY_DIR, version, prefer_compiled=USE_COMPILED_MODEL)
+
+def check_compatible(new_bundle):
+    # MovieInput se construye al arrancar: una versión con features nuevas necesita reiniciar
+    unknown = set(new_bundle.feature_columns) - set(FEATURES_LIST)
+    if unknown:
+        raise ValueError(f"La versión {new_bundle.version} usa features que la API no acepta: {sorted(unknown)[:5]}")
 
 def load_model():
-    # Carga el modelo, scaler y features
-    global model, scaler, feature_columns
+    # Carga síncrona del modelo, scaler y features (scripts y benchmarks; la API usa reload_model)
+    global bundle
     try:
-        with open(MODEL_PATH, 'rb') as f:
-            model = pickle.load(f)
-        with open(SCALER_PATH, 'rb') as f:
-            scaler = pickle.load(f)
-        with open(FEATURES_PATH, 'r', encoding='utf-8') as f:
-            import json
-            feature_columns = json.load(f)
-        logger.info(f"Modelo cargado desde {MODEL_PATH}")
-        logger.info(f"Scaler cargado desde {SCALER_PATH}")
-        logger.info(f"Features cargadas desde {FEATURES_PATH}")
+        bundle = load_active_bundle()
+        logger.info(f"Modelo {bundle.version} ({bundle.model_format}) cargado desde {bundle.path} en {bundle.load_seconds * 1000:.1f} ms")
         return True
     except Exception as e:
         logger.error(f"Error al cargar el modelo: {e}")
         return False
 
-# Cargar modelo al importar
-load_model()
+async def reload_model(version=None, only_if_missing=False):
+    # Carga la versión en segundo plano (pool de inferencia) y la activa de golpe si todo va bien;
+    # si falla, se sigue sirviendo la versión actual
+    global bundle, _reload_lock
+    if _reload_lock is None:
+        _reload_lock = asyncio.Lock()
+    async with _reload_lock:
+        if only_if_missing and bundle is not None:
+            return bundle
+        new_bundle = await inference_pool.run(load_active_bundle, version)
+        check_compatible(new_bundle)
+        previous = bundle.version if bundle else None
+        bundle = new_bundle
+        logger.info(f"Modelo {previous} -> {new_bundle.version} ({new_bundle.load_seconds * 1000:.1f} ms)")
+        return new_bundle
+
+async def ensure_model_loaded():
+    # Primera carga del modelo: la lanza el lifespan en segundo plano y, si una petición llega
+    # antes de que termine, espera a esa misma carga. Devuelve None si no se pudo cargar.
+    if bundle is None:
+        try:
+            await reload_model(only_if_missing=True)
+        except Exception as e:
+            logger.error(f"Error al cargar el modelo: {e}")
+    return bundle
+
+async def _watch_registry():
+    # Cada worker sigue el puntero active.json: una promoción hecha en un worker llega al resto
+    await ensure_model_loaded()
+    while True:
+        await asyncio.sleep(MODEL_REGISTRY_POLL_INTERVAL)
+        try:
+            state = read_active(MODEL_REGISTRY_DIR)
+            if state and (bundle is None or state["version"] != bundle.version):
+                await reload_model(state["version"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error recargando el modelo: {e}")
+
+def start_model_watcher():
+    # Se llama desde el lifespan de FastAPI
+    global _watcher_task
+    if _watcher_task is None:
+        _watcher_task = asyncio.create_task(_watch_registry())
+
+def stop_model_watcher():
+    global _watcher_task
+    if _watcher_task is not None:
+        _watcher_task.cancel()
+        _watcher_task = None
 
 # Leer las features desde el archivo JSON para crear el modelo dinámicamente
 import json
@@ -105,6 +168,47 @@ MovieInput = type('MovieInput', (BaseModel,), {
     }
 })
 
+# Fila reutilizable por hilo del pool de inferencia
+_row_buffers = threading.local()
+
+def scale_inplace(X, active):
+    # Aplica el StandardScaler plegado sobre el array (sin DataFrame ni validación de columnas)
+    if active.scaler_inv_scale is not None:
+        np.multiply(X, active.scaler_inv_scale, out=X)
+        np.add(X, active.scaler_offset, out=X)
+    return X
+
+def predict_success_probabilities(X, active):
+    # Escala (si corresponde) y devuelve la probabilidad de éxito de cada fila en una sola pasada
+    probabilidad_array = active.model.predict_proba(scale_inplace(X, active))
+    return probabilidad_array[:, 1]
+
+def predict_single(movie_data):
+    # Camino rápido para una película: solo se copian los campos enviados a una fila
+    # float64 preasignada (el resto de features valen 0)
+    active = bundle
+    n_features = len(active.feature_columns)
+    row = getattr(_row_buffers, 'row', None)
+    if row is None or row.shape[1] != n_features:
+        row = _row_buffers.row = np.empty((1, n_features), dtype=np.float64)
+    row.fill(0.0)
+    for name in movie_data.model_fields_set:
+        index = active.feature_index.get(name)
+        if index is not None:
+            row[0, index] = getattr(movie_data, name) or 0.0
+    return float(predict_success_probabilities(row, active)[0])
+
+def interpret_probability(probabilidad):
+    # Traduce la probabilidad a (predicción, confianza)
+    if probabilidad >= 0.7:
+        return "Alto potencial de éxito", "Alta"
+    elif probabilidad >= 0.5:
+        return "Potencial moderado de éxito", "Media"
+    elif probabilidad >= 0.3:
+        return "Bajo potencial de éxito", "Media"
+    else:
+        return "Muy bajo potencial de éxito", "Alta"
+
 class PredictionResponse(BaseModel):
     # Modelo de respuesta para predicción
     titulo: str
@@ -124,32 +228,16 @@ async def predict_movie_success(movie_data: MovieInput):
     Devuelve JSON estructurado.
     """
         
-    if model is None:
+    if await ensure_model_loaded() is None:
         raise HTTPException(
             status_code=500,
             detail="Modelo no disponible. Por favor, contacte al administrador."
         )
     try:
-        # Extraer las features en el orden correcto
-        X = pd.DataFrame([[getattr(movie_data, feat, 0.0) for feat in FEATURES_LIST]], columns=FEATURES_LIST)
-        # Escalar si corresponde
-        if scaler is not None:
-            X = scaler.transform(X)
-        probabilidad_array = model.predict_proba(X)
-        probabilidad = float(probabilidad_array[0][1])
+        # Escalado e inferencia en el pool de inferencia para no bloquear el event loop
+        probabilidad = await inference_pool.run(predict_single, movie_data)
         # Interpretar la probabilidad
-        if probabilidad >= 0.7:
-            prediccion = "Alto potencial de éxito"
-            confianza = "Alta"
-        elif probabilidad >= 0.5:
-            prediccion = "Potencial moderado de éxito"
-            confianza = "Media"
-        elif probabilidad >= 0.3:
-            prediccion = "Bajo potencial de éxito"
-            confianza = "Media"
-        else:
-            prediccion = "Muy bajo potencial de éxito"
-            confianza = "Alta"
+        prediccion, confianza = interpret_probability(probabilidad)
         return PredictionResponse(
             titulo=movie_data.titulo,
             probabilidad_exito=round(probabilidad, 3),
@@ -164,10 +252,117 @@ async def predict_movie_success(movie_data: MovieInput):
             detail=f"Error al procesar la predicción: {str(e)}"
         )
 
+async def iter_batch_rows(request: Request):
+    # Recorre las filas del cuerpo: NDJSON se procesa línea a línea según llega;
+    # un array JSON se parsea entero (para lotes muy grandes conviene NDJSON)
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
+    else:
+        try:
+            rows = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="El cuerpo debe ser un array JSON o NDJSON")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="El cuerpo debe ser un array JSON de películas")
+        for row in rows:
+            yield row
+
+def build_feature_matrix(movies, active):
+    # Matriz (n_películas x n_features) en el orden de features del modelo; las ausentes valen 0
+    X = np.zeros((len(movies), len(active.feature_columns)), dtype=np.float64)
+    for i, movie in enumerate(movies):
+        for name in movie.model_fields_set:
+            index = active.feature_index.get(name)
+            if index is not None:
+                X[i, index] = getattr(movie, name) or 0.0
+    return X
+
+async def predict_chunk(movies):
+    # Inferencia vectorizada de un bloque y serialización de sus resultados como NDJSON
+    active = bundle
+    X = build_feature_matrix(movies, active)
+    probabilidades = await inference_pool.run(predict_success_probabilities, X, active)
+    lines = []
+    for movie, probabilidad in zip(movies, probabilidades):
+        prediccion, confianza = interpret_probability(probabilidad)
+        lines.append(json.dumps({
+            "titulo": movie.titulo,
+            "probabilidad_exito": round(float(probabilidad), 3),
+            "prediccion": prediccion,
+            "confianza": confianza,
+            "success": True
+        }, ensure_ascii=False))
+    return "\n".join(lines) + "\n"
+
+@router.post("/predict/batch")
+async def predict_batch(request: Request):
+    """
+    Predicción de éxito para muchas películas a la vez.
+
+    Acepta un array JSON de películas (mismo formato que /predict) o NDJSON
+    (`Content-Type: application/x-ndjson`, una película por línea).
+    Las películas se agrupan en bloques y cada bloque se escala y predice en una sola llamada al modelo.
+
+    Devuelve NDJSON en streaming, una línea por película y en el mismo orden.
+    Las filas inválidas devuelven `{"index": i, "success": false, "error": "..."}`.
+    """
+
+    if await ensure_model_loaded() is None:
+        raise HTTPException(
+            status_code=500,
+            detail="Modelo no disponible. Por favor, contacte al administrador."
+        )
+
+    rows = iter_batch_rows(request)
+    # Para un array JSON los errores de formato se detectan antes de empezar a responder
+    try:
+        first_row = await rows.__anext__()
+    except StopAsyncIteration:
+        first_row = None
+
+    async def generate():
+        chunk = []
+        index = 0
+        if first_row is None:
+            return
+        async for row in _prepend(first_row, rows):
+            try:
+                if isinstance(row, (bytes, str)):
+                    row = json.loads(row)
+                chunk.append(MovieInput.model_validate(row))
+            except Exception as e:
+                # Se respeta el orden: primero los resultados pendientes del bloque
+                if chunk:
+                    yield await predict_chunk(chunk)
+                    chunk = []
+                yield json.dumps({"index": index, "success": False, "error": str(e)}, ensure_ascii=False) + "\n"
+            index += 1
+            if len(chunk) >= PREDICT_BATCH_CHUNK_SIZE:
+                yield await predict_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield await predict_chunk(chunk)
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+async def _prepend(first, rest):
+    yield first
+    async for item in rest:
+        yield item
+
 @router.get("/predict/health")
 async def check_model_health():
     # Verifica el estado del modelo de predicción
-    if model is None:
+    if await ensure_model_loaded() is None:
         return {
             "status": "error",
             "message": "Modelo no cargado",
@@ -178,5 +373,5 @@ async def check_model_health():
         "status": "ok", 
         "message": "Modelo de éxito cargado correctamente",
         "model_available": True,
-        "model_path": MODEL_PATH
+        **bundle.info()
     }
@@ -1,9 +1,46 @@
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
-from app.endpoints import ask_text, ask_visual, predict
+from app.endpoints import admin, ask_text, ask_visual, predict
+from app.models.sql_predictor import open_pool, close_pool, get_pool_stats, get_data_version
+from app.utils.executors import get_executor_stats, shutdown_executors
+from app.utils.cache import get_cache_stats
+from app.utils.analytics_routes import get_analytics_stats
+from app.utils.query_guard import get_guard_stats
+from app.utils.single_flight import get_single_flight_stats
+from app.utils.sql_converter import gemini_client, load_schema_prompt
+
+# Duración de cada fase del arranque (ms), expuesta en /health
+startup_timings = {}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Abre el pool de conexiones a la BD y sigue el registro de modelos; al apagar lo cierra
+    # todo junto con los pools de trabajo
+    start = time.perf_counter()
+    try:
+        # Incluye pedir el secreto de la BD a Secrets Manager (con reintentos)
+        await open_pool()
+        startup_timings["db_pool_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        # Esquema real de la BD para la parte fija del prompt de Gemini
+        await load_schema_prompt()
+        startup_timings["schema_ms"] = round((time.perf_counter() - start) * 1000 - startup_timings["db_pool_ms"], 1)
+    except Exception as e:
+        # La API arranca igualmente: el pool y el esquema se vuelven a intentar en la primera consulta
+        print(f"No se pudo conectar con la BD al arrancar: {e}")
+        startup_timings.setdefault("db_pool_ms", round((time.perf_counter() - start) * 1000, 1))
+    # El modelo se carga en segundo plano; /predict espera a esa carga si llega antes
+    predict.start_model_watcher()
+    startup_timings["lifespan_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    yield
+    predict.stop_model_watcher()
+    await close_pool()
+    shutdown_executors()
 
 app = FastAPI(
+    lifespan=lifespan,
     title="Movie Database API",
     description="""
 API DE BASE DE DATOS DE PELÍCULAS (TMDB)
@@ -28,6 +65,7 @@ TECNOLOGÍAS UTILIZADAS:
 app.include_router(ask_text.router, tags=["Text QA"])
 app.include_router(ask_visual.router, tags=["Visual QA"])
 app.include_router(predict.router, tags=["Predicción ML"])
+app.include_router(admin.router, tags=["Admin"])
 
 @app.get("/", response_class=HTMLResponse, tags=["Info"])
 async def root():
@@ -155,7 +193,19 @@ async def root():
 @app.get("/health", tags=["Info"])
 async def health_check():
     # Verificación de estado de la API
-    return {"status": "healthy", "message": "API funcionando correctamente"}
+    return {
+        "status": "healthy",
+        "message": "API funcionando correctamente",
+        "db_pool": get_pool_stats(),
+        "data_version": get_data_version(),
+        "executors": get_executor_stats(),
+        "caches": await get_cache_stats(),
+        "single_flight": get_single_flight_stats(),
+        "gemini": gemini_client.stats(),
+        "query_guard": get_guard_stats(),
+        "analytics": get_analytics_stats(),
+        "startup": startup_timings
+    }
 
 @app.get("/demo", response_class=HTMLResponse, tags=["Info"])
 async def demo_page():
@@ -0,0 +1,156 @@
+# Motor de inferencia compilado para el RandomForestClassifier de /predict.
+# El bosque se exporta a arrays NumPy contiguos (un .npy por array) que se cargan con
+# mmap: arrancar cuesta milisegundos y todos los workers de uvicorn comparten la misma
+# copia en la caché de páginas del sistema operativo en lugar de tener cada uno la suya.
+#
+# Exportar (desde movie-api/):
+#   python -m app.models.forest_engine app/models/model_rf.pkl app/models/model_rf_compiled
+import json
+import os
+import sys
+import numpy as np
+
+FORMAT_VERSION = 1
+ARRAYS = ("feature", "threshold", "children", "value", "roots")
+
+
+def export_forest(model, output_dir):
+    # Aplana todos los árboles en arrays globales. children guarda, para el nodo i, el hijo
+    # derecho en 2*i y el izquierdo en 2*i + 1 como índices absolutos (-1 en las hojas), de modo
+    # que el siguiente nodo es children[2*i + (x <= umbral)]. value guarda la probabilidad
+    # normalizada de cada nodo.
+    if getattr(model, "n_outputs_", 1) != 1:
+        raise ValueError("Solo se soportan bosques de una salida")
+
+    features, thresholds, children, values, roots = [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        left = tree.children_left.astype(np.int32)
+        right = tree.children_right.astype(np.int32)
+        is_leaf = left == -1
+        proba = tree.value[:, 0, :].astype(np.float64)
+        proba /= np.maximum(proba.sum(axis=1, keepdims=True), np.finfo(np.float64).tiny)
+
+        features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(tree.threshold.astype(np.float64))
+        children.append(np.stack([
+            np.where(is_leaf, -1, right + offset),
+            np.where(is_leaf, -1, left + offset)
+        ], axis=1).astype(np.int32).ravel())
+        values.append(proba.astype(np.float32))
+        roots.append(offset)
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    arrays = {
+        "feature": np.concatenate(features),
+        "threshold": np.concatenate(thresholds),
+        "children": np.concatenate(children),
+        "value": np.ascontiguousarray(np.concatenate(values)),
+        "roots": np.asarray(roots, dtype=np.int64),
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(output_dir, f"{name}.npy"), array)
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "n_features": int(model.n_features_in_),
+        "n_trees": len(model.estimators_),
+        "n_nodes": int(offset),
+        "max_depth": int(max_depth),
+        "classes": [c.item() if hasattr(c, "item") else c for c in model.classes_],
+    }
+    with open(os.path.join(output_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class CompiledForest:
+    # Recorrido por lotes de todos los árboles a la vez: en cada paso cada par
+    # (fila, árbol) que no está en una hoja baja un nivel, así que hay como mucho
+    # max_depth pasos vectorizados y cada uno solo toca los pares aún activos
+
+    def __init__(self, arrays, meta):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.children = arrays["children"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.meta = meta
+        self.n_features_in_ = meta["n_features"]
+        self.classes_ = np.asarray(meta["classes"])
+        self.max_depth = meta["max_depth"]
+
+    @classmethod
+    def load(cls, model_dir, mmap=True):
+        with open(os.path.join(model_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Versión de formato no soportada: {meta.get('format_version')}")
+        arrays = {
+            name: np.load(os.path.join(model_dir, f"{name}.npy"), mmap_mode="r" if mmap else None)
+            for name in ARRAYS
+        }
+        return cls(arrays, meta)
+
+    def predict_proba(self, X):
+        # sklearn compara en float32 contra umbrales float64; se replica para obtener el mismo camino
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Se esperaban {self.n_features_in_} features, se recibieron {X.shape}")
+        n_rows, n_trees = X.shape[0], len(self.roots)
+        flat_X = X.ravel()
+        # Pares (fila, árbol) aplanados; solo se siguen moviendo los que no han llegado a una hoja
+        nodes = np.tile(self.roots, n_rows)
+        row_offsets = np.repeat(np.arange(n_rows, dtype=np.int64) * self.n_features_in_, n_trees)
+        active = np.flatnonzero(self.children[2 * nodes + 1] != -1)
+        while active.size:
+            current = nodes[active]
+            go_left = flat_X[row_offsets[active] + self.feature[current]] <= self.threshold[current]
+            current = self.children[2 * current + go_left]
+            nodes[active] = current
+            active = active[self.children[2 * current + 1] != -1]
+        return self.value[nodes].reshape(n_rows, n_trees, -1).mean(axis=1, dtype=np.float64)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def verify_export(model, compiled, n_samples=2000, atol=1e-6, seed=0):
+    # Compara con predict_proba de sklearn en filas aleatorias construidas a partir de los umbrales
+    rng = np.random.default_rng(seed)
+    used = compiled.threshold[compiled.children[1::2] != -1]
+    scale = float(np.abs(used).max()) if used.size else 1.0
+    X = rng.normal(scale=scale / 3, size=(n_samples, compiled.n_features_in_))
+    expected = model.predict_proba(X)
+    actual = compiled.predict_proba(X)
+    max_diff = float(np.abs(expected - actual).max())
+    if max_diff > atol:
+        raise AssertionError(f"El modelo compilado difiere de sklearn (máx. diferencia {max_diff})")
+    return max_diff
+
+
+if __name__ == "__main__":
+    import pickle
+    import time
+
+    if len(sys.argv) != 3:
+        sys.exit("Uso: python -m app.models.forest_engine <model_rf.pkl> <directorio_salida>")
+    model_path, output_dir = sys.argv[1], sys.argv[2]
+
+    start = time.perf_counter()
+    with open(model_path, "rb") as f:
+        model = pickle.load(f)
+    pickle_ms = (time.perf_counter() - start) * 1000
+
+    meta = export_forest(model, output_dir)
+    start = time.perf_counter()
+    compiled = CompiledForest.load(output_dir)
+    load_ms = (time.perf_counter() - start) * 1000
+    max_diff = verify_export(model, compiled)
+
+    print(f"Exportados {meta['n_trees']} árboles ({meta['n_nodes']} nodos, profundidad {meta['max_depth']}) en {output_dir}")
+    print(f"Carga pickle: {pickle_ms:.1f} ms | carga compilada (mmap): {load_ms:.1f} ms")
+    print(f"Máxima diferencia con predict_proba: {max_diff:.2e}")
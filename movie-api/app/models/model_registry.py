@@ -0,0 +1,270 @@
+# Registro local de versiones del modelo de /predict.
+# Cada versión es un directorio con los mismos ficheros que app/models/ (model_rf.pkl,
+# model_rf_compiled/, scaler_rf.pkl, model_features.json) y un manifest.json con el sha256
+# de cada fichero. active.json apunta a la versión activa y guarda el historial para rollback;
+# se reescribe de forma atómica para que todos los workers vean siempre un puntero válido.
+#
+# Registrar una versión (desde movie-api/):
+#   python -m app.models.model_registry register <version> <model_rf.pkl> <scaler_rf.pkl> <model_features.json> [--compile]
+#   python -m app.models.model_registry promote <version>
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+from app.models.forest_engine import CompiledForest, export_forest
+
+MANIFEST_FILE = "manifest.json"
+ACTIVE_FILE = "active.json"
+MODEL_FILE = "model_rf.pkl"
+COMPILED_DIR = "model_rf_compiled"
+SCALER_FILE = "scaler_rf.pkl"
+FEATURES_FILE = "model_features.json"
+# Versiones anteriores que se recuerdan para poder hacer rollback
+MAX_HISTORY = 20
+
+
+def compile_scaler(scaler):
+    # Precalcula 1/scale_ y -mean_/scale_ para escalar arrays sin pasar por scaler.transform
+    n_features = scaler.n_features_in_
+    mean = getattr(scaler, 'mean_', None)
+    scale = getattr(scaler, 'scale_', None)
+    inv_scale = 1.0 / scale if scale is not None else np.ones(n_features)
+    offset = -mean * inv_scale if mean is not None else np.zeros(n_features)
+    return inv_scale.reshape(1, -1), offset.reshape(1, -1)
+
+
+class ModelBundle:
+    # Modelo, scaler y lista de features de una misma versión. Se sustituye entero al
+    # cambiar de versión, así una predicción nunca mezcla piezas de dos versiones.
+
+    def __init__(self, version, model, model_format, scaler, feature_columns, path, load_seconds):
+        self.version = version
+        self.model = model
+        self.model_format = model_format
+        self.scaler = scaler
+        self.feature_columns = feature_columns
+        self.feature_index = {feat: i for i, feat in enumerate(feature_columns)}
+        self.path = path
+        self.load_seconds = load_seconds
+        self.loaded_at = datetime.now(timezone.utc)
+        # StandardScaler plegado en x * scaler_inv_scale + scaler_offset
+        if scaler is not None:
+            self.scaler_inv_scale, self.scaler_offset = compile_scaler(scaler)
+        else:
+            self.scaler_inv_scale, self.scaler_offset = None, None
+
+    def info(self):
+        return {
+            "model_version": self.version,
+            "model_format": self.model_format,
+            "model_path": os.path.join(self.path, COMPILED_DIR if self.model_format == "compiled" else MODEL_FILE),
+            "loaded_at": self.loaded_at.isoformat(),
+            "load_time_ms": round(self.load_seconds * 1000, 1),
+        }
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json_atomic(path, data):
+    # Escribe en un temporal del mismo directorio y lo renombra (os.replace es atómico)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def version_dir(registry_dir, version):
+    if not version or os.sep in version or version.startswith("."):
+        raise ValueError(f"Nombre de versión inválido: {version}")
+    return os.path.join(registry_dir, version)
+
+
+def read_manifest(registry_dir, version):
+    path = os.path.join(version_dir(registry_dir, version), MANIFEST_FILE)
+    if not os.path.exists(path):
+        raise ValueError(f"La versión '{version}' no existe en el registro")
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_versions(registry_dir):
+    # Manifiestos de todas las versiones registradas, de la más antigua a la más reciente
+    if not os.path.isdir(registry_dir):
+        return []
+    manifests = []
+    for name in os.listdir(registry_dir):
+        if os.path.exists(os.path.join(registry_dir, name, MANIFEST_FILE)):
+            manifests.append(read_manifest(registry_dir, name))
+    return sorted(manifests, key=lambda m: m.get("created_at", ""))
+
+
+def read_active(registry_dir):
+    # {"version": ..., "history": [...]} o None si el registro no tiene versión activa
+    path = os.path.join(registry_dir, ACTIVE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def set_active(registry_dir, version):
+    # Marca la versión como activa y guarda la anterior en el historial
+    read_manifest(registry_dir, version)
+    state = read_active(registry_dir) or {"version": None, "history": []}
+    if state["version"] == version:
+        return state
+    history = state["history"] + ([state["version"]] if state["version"] else [])
+    state = {"version": version, "history": history[-MAX_HISTORY:],
+             "updated_at": datetime.now(timezone.utc).isoformat()}
+    _write_json_atomic(os.path.join(registry_dir, ACTIVE_FILE), state)
+    return state
+
+
+def previous_version(registry_dir):
+    # Versión a la que volvería un rollback
+    state = read_active(registry_dir)
+    if not state or not state["history"]:
+        raise ValueError("No hay una versión anterior a la que volver")
+    return state["history"][-1]
+
+
+def rollback(registry_dir):
+    # Vuelve a la versión anterior del historial (sin añadir la actual al historial)
+    version = previous_version(registry_dir)
+    state = read_active(registry_dir)
+    state = {"version": version, "history": state["history"][:-1],
+             "updated_at": datetime.now(timezone.utc).isoformat()}
+    _write_json_atomic(os.path.join(registry_dir, ACTIVE_FILE), state)
+    return state
+
+
+def _artifact_files(path):
+    # Rutas relativas de todos los ficheros de una versión salvo el propio manifest
+    files = []
+    for root, _, names in os.walk(path):
+        for name in names:
+            rel = os.path.relpath(os.path.join(root, name), path)
+            if rel != MANIFEST_FILE:
+                files.append(rel.replace(os.sep, "/"))
+    return sorted(files)
+
+
+def register_version(registry_dir, version, model_path, scaler_path, features_path, compile=False):
+    # Copia los artefactos a una nueva versión, opcionalmente exporta el bosque compilado,
+    # y escribe el manifest con los checksums. La versión no queda activa hasta promoverla.
+    path = version_dir(registry_dir, version)
+    if os.path.exists(path):
+        raise ValueError(f"La versión '{version}' ya existe en el registro")
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    shutil.copy2(model_path, os.path.join(tmp_path, MODEL_FILE))
+    shutil.copy2(scaler_path, os.path.join(tmp_path, SCALER_FILE))
+    shutil.copy2(features_path, os.path.join(tmp_path, FEATURES_FILE))
+    if compile:
+        with open(model_path, "rb") as f:
+            export_forest(pickle.load(f), os.path.join(tmp_path, COMPILED_DIR))
+    manifest = {
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "files": {rel: file_sha256(os.path.join(tmp_path, rel)) for rel in _artifact_files(tmp_path)},
+    }
+    _write_json_atomic(os.path.join(tmp_path, MANIFEST_FILE), manifest)
+    # El directorio solo aparece con su nombre definitivo cuando está completo
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def verify_checksums(path, manifest, files=None):
+    # Comprueba que están todos los ficheros del manifest y el sha256 de los de files (rutas
+    # relativas; las que terminan en "/" son directorios enteros). Sin files, el de todos
+    for rel, expected in manifest["files"].items():
+        file_path = os.path.join(path, *rel.split("/"))
+        if not os.path.exists(file_path):
+            raise ValueError(f"Falta el fichero {rel} de la versión {manifest['version']}")
+        if files is not None and not any(rel == f or (f.endswith("/") and rel.startswith(f)) for f in files):
+            continue
+        if file_sha256(file_path) != expected:
+            raise ValueError(f"Checksum incorrecto en {rel} de la versión {manifest['version']}")
+
+
+def load_bundle(path, version, manifest=None, prefer_compiled=True):
+    # Carga modelo, scaler y features de un directorio. Con manifest se comprueban antes
+    # los checksums, así un artefacto corrupto o a medio copiar nunca llega a activarse.
+    # Solo se calcula el de los ficheros que se van a abrir: con el bosque compilado no se lee
+    # model_rf.pkl (el fichero más grande), que se sigue comprobando al cargar en formato pickle.
+    start = time.perf_counter()
+    compiled_path = os.path.join(path, COMPILED_DIR)
+    use_compiled = prefer_compiled and os.path.exists(os.path.join(compiled_path, "meta.json"))
+    if manifest is not None:
+        model_files = [f"{COMPILED_DIR}/"] if use_compiled else [MODEL_FILE]
+        verify_checksums(path, manifest, model_files + [SCALER_FILE, FEATURES_FILE])
+    if use_compiled:
+        # Arrays en mmap: carga en milisegundos y memoria compartida entre workers
+        model = CompiledForest.load(compiled_path)
+        model_format = "compiled"
+    else:
+        with open(os.path.join(path, MODEL_FILE), "rb") as f:
+            model = pickle.load(f)
+        model_format = "pickle"
+    scaler_path = os.path.join(path, SCALER_FILE)
+    scaler = None
+    if os.path.exists(scaler_path):
+        with open(scaler_path, "rb") as f:
+            scaler = pickle.load(f)
+    with open(os.path.join(path, FEATURES_FILE), "r", encoding="utf-8") as f:
+        feature_columns = json.load(f)
+    if getattr(model, "n_features_in_", len(feature_columns)) != len(feature_columns):
+        raise ValueError(f"El modelo espera {model.n_features_in_} features y model_features.json tiene {len(feature_columns)}")
+    return ModelBundle(version, model, model_format, scaler, feature_columns, path, time.perf_counter() - start)
+
+
+def load_version(registry_dir, version, prefer_compiled=True):
+    manifest = read_manifest(registry_dir, version)
+    return load_bundle(version_dir(registry_dir, version), version, manifest, prefer_compiled)
+
+
+if __name__ == "__main__":
+    from app.config import MODEL_REGISTRY_DIR
+
+    usage = ("Uso: python -m app.models.model_registry register <version> <model_rf.pkl> <scaler_rf.pkl> <model_features.json> [--compile]\n"
+             "     python -m app.models.model_registry promote <version>\n"
+             "     python -m app.models.model_registry rollback\n"
+             "     python -m app.models.model_registry list")
+    args = sys.argv[1:]
+    if not args:
+        sys.exit(usage)
+    command = args[0]
+    try:
+        if command == "register" and len(args) in (5, 6):
+            manifest = register_version(MODEL_REGISTRY_DIR, *args[1:5], compile="--compile" in args[5:])
+            print(f"Versión {manifest['version']} registrada ({len(manifest['files'])} ficheros)")
+        elif command == "promote" and len(args) == 2:
+            # Se carga antes de promover para no activar una versión que no arranca
+            bundle = load_version(MODEL_REGISTRY_DIR, args[1])
+            set_active(MODEL_REGISTRY_DIR, args[1])
+            print(f"Versión {args[1]} activa (carga de prueba: {bundle.load_seconds * 1000:.1f} ms)")
+        elif command == "rollback" and len(args) == 1:
+            print(f"Versión {rollback(MODEL_REGISTRY_DIR)['version']} activa")
+        elif command == "list" and len(args) == 1:
+            active = (read_active(MODEL_REGISTRY_DIR) or {}).get("version")
+            for manifest in list_versions(MODEL_REGISTRY_DIR):
+                marker = "*" if manifest["version"] == active else " "
+                print(f"{marker} {manifest['version']}  {manifest['created_at']}")
+        else:
+            sys.exit(usage)
+    except ValueError as e:
+        sys.exit(str(e))
@@ -1,12 +1,334 @@
+import asyncio
+import logging
+import re
+import uuid
+from typing import Optional
+
 import psycopg
-from app.config import DB_CONFIG
+from psycopg_pool import AsyncConnectionPool
+from app.config import (
+    load_db_config,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_POOL_MAX_LIFETIME,
+    DB_POOL_MAX_IDLE,
+    DB_POOL_HEALTHCHECK_INTERVAL,
+    RESULT_CACHE_MAX_SIZE,
+    RESULT_CACHE_MAX_BYTES,
+    RESULT_CACHE_TTL,
+    DATA_VERSION_POLL_INTERVAL,
+    STREAM_BATCH_SIZE,
+)
+from app.utils.analytics_routes import rewrite_sql, route_template, set_analytics_views
+from app.utils.cache import create_cache
+from app.utils.query_guard import QueryRejected, QueryRows, check_query, record_timeout, set_statement_timeout
+from app.utils.query_templates import TemplateQuery
+from app.utils.single_flight import create_single_flight
+
+logger = logging.getLogger(__name__)
+
+# Pool de conexiones compartido por todos los endpoints
+_pool: Optional[AsyncConnectionPool] = None
+_pool_lock: Optional[asyncio.Lock] = None
+_healthcheck_task: Optional[asyncio.Task] = None
+_healthcheck_failures = 0
+
+# Caché de resultados por SQL normalizada. Las claves incluyen la versión de datos
+# que las ETL incrementan tras cada carga (tabla data_version), así que nunca se
+# sirven resultados anteriores a la última carga.
+result_cache = create_cache(
+    "results",
+    max_size=RESULT_CACHE_MAX_SIZE,
+    ttl=RESULT_CACHE_TTL,
+    max_bytes=RESULT_CACHE_MAX_BYTES
+)
+# Consultas en curso: la misma SQL pedida a la vez se ejecuta una sola vez en RDS
+query_flight = create_single_flight("sql")
+# None = versión desconocida (tabla sin crear o BD inaccesible): la caché no se usa
+_data_version: Optional[int] = None
+_version_tasks = []
+
+
+def _on_reconnect_failed(pool):
+    # Se llama cuando el pool no consigue reconectar con RDS durante reconnect_timeout
+    logger.error(f"El pool '{pool.name}' no pudo reconectar con la base de datos")
+
+
+async def _healthcheck_loop():
+    # Comprueba periódicamente las conexiones ociosas; las rotas se descartan y se reponen
+    global _healthcheck_failures
+    while True:
+        await asyncio.sleep(DB_POOL_HEALTHCHECK_INTERVAL)
+        try:
+            await _pool.check()
+        except Exception as e:
+            _healthcheck_failures += 1
+            logger.warning(f"Fallo en el health check del pool: {e}")
+
+
+def normalize_sql(sql_query):
+    # Normaliza la SQL para usarla como clave: espacios colapsados, sin ';' final y
+    # en minúsculas, salvo dentro de literales ('...') e identificadores entre comillas ("...")
+    parts = re.split(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""", sql_query.strip().rstrip(';').strip())
+    for i in range(0, len(parts), 2):
+        parts[i] = " ".join(parts[i].split()).lower()
+    return "".join(parts)
+
+
+def get_data_version():
+    return _data_version
+
+
+async def _set_data_version(version):
+    # Las versiones solo avanzan; al cambiar se vacía la caché de resultados
+    global _data_version
+    if version is not None and _data_version is not None and version <= _data_version:
+        return
+    if version != _data_version:
+        logger.info(f"Versión de datos: {_data_version} -> {version}")
+        _data_version = version
+        await result_cache.clear()
+
+
+async def _read_data_version(conn):
+    try:
+        cur = await conn.execute("SELECT version FROM data_version WHERE id = 1")
+        row = await cur.fetchone()
+        return row[0] if row else None
+    except psycopg.errors.UndefinedTable:
+        logger.warning("La tabla data_version no existe: la caché de resultados queda desactivada")
+        return None
+
+
+async def _read_analytics_views(conn):
+    # Tablas de resumen (vistas materializadas de analytics-views.sql) creadas y pobladas
+    cur = await conn.execute(
+        "SELECT matviewname FROM pg_matviews WHERE schemaname = 'public' AND ispopulated"
+    )
+    return [row[0] for row in await cur.fetchall()]
+
+
+async def _poll_data_version():
+    # Relee la versión periódicamente por si se pierde algún NOTIFY, y de paso qué tablas
+    # de resumen hay (se crean con una migración, no hace falta enterarse al instante)
+    global _data_version
+    while True:
+        try:
+            async with _pool.connection() as conn:
+                version = await _read_data_version(conn)
+                set_analytics_views(await _read_analytics_views(conn))
+            if version is None:
+                _data_version = None
+            else:
+                await _set_data_version(version)
+        except Exception as e:
+            logger.warning(f"No se pudo leer la versión de datos: {e}")
+            _data_version = None
+        await asyncio.sleep(DATA_VERSION_POLL_INTERVAL)
 
-def execute_sql(sql_query):
-    with psycopg.connect(**DB_CONFIG) as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql_query)
+
+async def _listen_data_version():
+    # Escucha el NOTIFY data_version que emite bump_data_version() al terminar cada carga
+    global _data_version
+    while True:
+        try:
+            conn = await psycopg.AsyncConnection.connect(autocommit=True, **(await load_db_config()))
+            async with conn:
+                await conn.execute("LISTEN data_version")
+                async for notify in conn.notifies():
+                    await _set_data_version(int(notify.payload))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Escucha de data_version interrumpida, se reintenta: {e}")
+            _data_version = None
+        await asyncio.sleep(5)
+
+
+async def open_pool():
+    # Crea y abre el pool (se llama desde el lifespan de FastAPI)
+    global _pool, _pool_lock, _healthcheck_task
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if _pool is not None:
+            return _pool
+        pool = AsyncConnectionPool(
+            kwargs=await load_db_config(),
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            timeout=DB_POOL_TIMEOUT,
+            max_lifetime=DB_POOL_MAX_LIFETIME,
+            max_idle=DB_POOL_MAX_IDLE,
+            reconnect_failed=_on_reconnect_failed,
+            name="movie-api",
+            open=False,
+        )
+        await pool.open()
+        _pool = pool
+        if DB_POOL_HEALTHCHECK_INTERVAL > 0:
+            _healthcheck_task = asyncio.create_task(_healthcheck_loop())
+        _version_tasks.extend([
+            asyncio.create_task(_poll_data_version()),
+            asyncio.create_task(_listen_data_version()),
+        ])
+        logger.info(f"Pool de conexiones abierto (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+        return _pool
+
+
+async def close_pool():
+    # Cierra el pool y detiene el health check
+    global _pool, _healthcheck_task, _data_version
+    if _healthcheck_task is not None:
+        _healthcheck_task.cancel()
+        _healthcheck_task = None
+    for task in _version_tasks:
+        task.cancel()
+    _version_tasks.clear()
+    _data_version = None
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+        logger.info("Pool de conexiones cerrado")
+
+
+async def get_pool():
+    # Devuelve el pool, abriéndolo si el lifespan no se ha ejecutado (p. ej. TestClient sin contexto)
+    if _pool is None:
+        return await open_pool()
+    return _pool
+
+
+def get_pool_stats():
+    # Estadísticas del pool para /health
+    if _pool is None:
+        return {"status": "closed"}
+    stats = _pool.get_stats()
+    return {
+        "status": "open",
+        "min_size": _pool.min_size,
+        "max_size": _pool.max_size,
+        "size": stats.get("pool_size", 0),
+        "available": stats.get("pool_available", 0),
+        "requests_waiting": stats.get("requests_waiting", 0),
+        "requests_num": stats.get("requests_num", 0),
+        "requests_errors": stats.get("requests_errors", 0),
+        "connections_lost": stats.get("connections_lost", 0),
+        "returns_bad": stats.get("returns_bad", 0),
+        "healthcheck_failures": _healthcheck_failures,
+    }
+
+
+def _analytics_route(sql_query):
+    # (consulta, parámetros, vista): la consulta equivalente sobre las tablas de resumen si la
+    # hay (ver app/utils/analytics_routes.py) o la original
+    if isinstance(sql_query, TemplateQuery):
+        route = route_template(sql_query.template_id, sql_query.params)
+        return (route[1] if route else sql_query.query), sql_query.params, route and route[0]
+    route = rewrite_sql(sql_query)
+    return (route[1] if route else sql_query), None, route and route[0]
+
+
+async def _run_query(sql_query):
+    # Ejecuta la consulta usando una conexión del pool.
+    # Las plantillas (TemplateQuery) se ejecutan con sus parámetros como prepared statements:
+    # cada conexión prepara la sentencia una vez y Postgres reutiliza el plan en las siguientes.
+    # La SQL de Gemini pasa antes por query_guard (LIMIT y EXPLAIN) y todas llevan statement_timeout.
+    # Las agregaciones que ya están precalculadas se leen de las tablas de resumen.
+    # Si la conexión estaba rota se reintenta una vez: el pool descarta la conexión mala y entrega otra.
+    pool = await get_pool()
+    for attempt in range(2):
+        conn = None
+        try:
+            async with pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await set_statement_timeout(cur)
+                    query, params, view = _analytics_route(sql_query)
+                    report = {}
+                    if isinstance(sql_query, TemplateQuery):
+                        await cur.execute(query, params or None, prepare=True)
+                    else:
+                        query, report = await check_query(cur, query)
+                        await cur.execute(query)
+                    if view:
+                        report = {**report, "tabla_resumen": view}
+                        if not isinstance(sql_query, TemplateQuery):
+                            report["sql_reescrita"] = query
+                    try:
+                        rows = await cur.fetchall()
+                    except Exception:
+                        rows = await cur.fetchone()
+            return QueryRows(rows, report) if isinstance(rows, list) else rows
+        except psycopg.errors.QueryCanceled as e:
+            record_timeout()
+            raise QueryRejected(
+                "La consulta ha superado el tiempo máximo de ejecución. Prueba a acotarla.",
+                {"statement_timeout": True}
+            ) from e
+        except psycopg.OperationalError as e:
+            if attempt == 1 or conn is None or not conn.broken:
+                raise
+            logger.warning(f"Conexión rota descartada, reintentando consulta: {e}")
+
+
+async def stream_sql(sql_query, batch_size=STREAM_BATCH_SIZE):
+    # Ejecuta la consulta con un cursor de servidor (DECLARE ... CURSOR) y la recorre por bloques:
+    # la memoria depende de batch_size y no del número de filas. Generador asíncrono: lo primero
+    # que devuelve son las columnas y después listas de como mucho batch_size filas.
+    # No pasa por la caché de resultados; la conexión queda ocupada hasta que se cierra el generador.
+    # Pasa por query_guard sin añadir LIMIT (el streaming es justo para resultados grandes): el
+    # primer elemento es (columnas, informe del plan). El EXPLAIN y el statement_timeout se
+    # ejecutan en un cursor normal de la misma transacción, antes de declarar el de servidor.
+    query, params, view = _analytics_route(sql_query)
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        report = {}
+        async with conn.cursor() as check:
+            await set_statement_timeout(check)
+            if not isinstance(sql_query, TemplateQuery):
+                query, report = await check_query(check, query, limit_rows=False)
+        if view:
+            report["tabla_resumen"] = view
+        async with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cur:
             try:
-                rows = cur.fetchall()
-            except Exception:
-                rows = cur.fetchone()
-    return rows
\ No newline at end of file
+                await cur.execute(query, params or None)
+                yield [column.name for column in cur.description], report
+                while True:
+                    rows = await cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+            except psycopg.errors.QueryCanceled as e:
+                record_timeout()
+                raise QueryRejected(
+                    "La consulta ha superado el tiempo máximo de ejecución. Prueba a acotarla.",
+                    {"statement_timeout": True}
+                ) from e
+
+
+async def execute_sql(sql_query, use_cache=True):
+    # Ejecuta la consulta, sirviendo desde la caché si la misma SQL (o la misma plantilla con los
+    # mismos parámetros) ya se ejecutó con la versión de datos actual
+    version = _data_version
+    if isinstance(sql_query, TemplateQuery):
+        query_key = sql_query.cache_key()
+    else:
+        query_key = normalize_sql(sql_query)
+    cache_key = f"{version}:{query_key}" if use_cache and version is not None else None
+    if cache_key:
+        cached = await result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    # La misma consulta pedida a la vez se ejecuta una sola vez. La versión forma parte de la
+    # clave: tras una carga no se comparte una consulta lanzada con los datos anteriores
+    if use_cache:
+        rows = await query_flight.do(f"{version}:{query_key}", _run_query, sql_query)
+    else:
+        rows = await _run_query(sql_query)
+
+    # Si ha llegado una carga nueva mientras se ejecutaba la consulta no se guarda
+    if cache_key and rows is not None and _data_version == version:
+        await result_cache.set(cache_key, rows)
+    return rows
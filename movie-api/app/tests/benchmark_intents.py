@@ -0,0 +1,225 @@
+# Micro-benchmark del clasificador de intenciones de los fallbacks de NL2SQL.
+# Compara la cascada anterior (if/elif con `in` sobre la pregunta, un .lower() por función
+# y un re.sub por género) con el clasificador compilado de app/utils/intent_matcher.py
+# sobre un corpus de preguntas reales, y comprueba que ambos eligen la misma plantilla con los
+# mismos parámetros (número, género), tanto en la clasificación completa como en cada fallback.
+# Uso (desde movie-api/): python -m app.tests.benchmark_intents [repeticiones]
+import re
+import sys
+import time
+from app.utils.intent_matcher import GENRE_MAPPING, classify_question, replace_genres
+from app.utils.sql_converter import create_better_fallback, generate_fallback_sql
+
+# Preguntas de la documentación, la demo y las pruebas, más variantes en inglés
+CORPUS = [
+    "¿Cuáles son las 5 películas mejor valoradas?",
+    "¿Cuáles son los top 5 géneros con mejores ratings?",
+    "¿Cuántas películas de acción hay?",
+    "¿Cuántas películas de comedia hay?",
+    "¿Cuántas películas hay de comedia?",
+    "¿Cuántas películas hay?",
+    "¿Distribución de géneros?",
+    "¿Distribución de películas por año?",
+    "¿Géneros disponibles?",
+    "¿Géneros más populares?",
+    "¿Mejores películas?",
+    "¿Películas con mayor presupuesto?",
+    "¿Películas con presupuesto mayor a 100M?",
+    "¿Películas de comedia más populares?",
+    "¿Películas de comedia?",
+    "¿Películas de drama más populares?",
+    "¿Películas de drama?",
+    "¿Películas de terror más populares?",
+    "¿Películas populares?",
+    "¿Qué géneros están disponibles?",
+    "¿Qué géneros existen?",
+    "¿Qué películas tienen mejor puntuación?",
+    "¿Rating promedio por género?",
+    "¿Top 10 géneros?",
+    "¿Top 10 películas mejor valoradas?",
+    "¿Top 10 películas más populares?",
+    "¿Top 10 películas populares?",
+    "¿Top 10 películas?",
+    "¿Top 5 películas mejor valoradas?",
+    "¿Top 5 películas más populares?",
+    "¿Top 5 películas?",
+    "¿Top géneros?",
+    "¿Top películas?",
+    "¿Películas más largas?",
+    "¿Películas más cortas de animación?",
+    "¿Películas con mayor recaudación en taquilla?",
+    "¿Películas más votadas?",
+    "¿Últimos estrenos por año?",
+    "¿Películas de ciencia ficción mejor valoradas?",
+    "¿Documentales de historia?",
+    "Top 20 movies by popularity",
+    "How many war movies are there?",
+    "Which genres are available?",
+    "Titles released in 2023",
+    "Highest rated sci-fi movies by score",
+    "¿Películas con mayor presupuesto de 2023?",
+    "Películas de 2023: top 5 más populares",
+    "Top 3 películas de 2023 con mejor rating",
+]
+
+SQL_SAMPLES = [
+    "SELECT p.titulo FROM peliculas p JOIN peliculas_generos pg ON p.movie_id = pg.movie_id "
+    "JOIN generos g ON pg.genero_id = g.genero_id WHERE g.nombre = 'comedia' LIMIT 10;",
+    "SELECT COUNT(*) FROM generos g WHERE g.nombre IN ('Acción', 'terror', 'Ciencia Ficción');",
+    "SELECT titulo, vote_average FROM peliculas ORDER BY vote_average DESC LIMIT 5;",
+]
+
+# --- Cascada anterior (referencia) ---
+
+def legacy_detect_genre_in_question(question):
+    question_lower = question.lower()
+    for keyword, genre in GENRE_MAPPING.items():
+        if keyword in question_lower:
+            return genre
+    return None
+
+def legacy_extract_number(text):
+    # Extrae número de la pregunta (ej: 'top 5' → 5)
+    numbers = re.findall(r'\d+', text)
+    return int(numbers[0]) if numbers else None
+
+def legacy_create_better_fallback(question):
+    # Elige la plantilla de fallback para la pregunta usando la estructura de la BD.
+    # Devuelve (template_id, params); ver app/utils/query_templates.py
+    question_lower = question.lower()
+    
+    if "mejor valorad" in question_lower or "rating" in question_lower or "highest rated" in question_lower:
+        return "top_rated", (legacy_extract_number(question) or 10,)
+    
+    elif "popular" in question_lower or "más popular" in question_lower:
+        return "top_popularity", (legacy_extract_number(question) or 10,)
+    
+    elif "votos" in question_lower or "más votad" in question_lower:
+        return "top_votes", (legacy_extract_number(question) or 10,)
+    
+    elif "presupuesto" in question_lower or "budget" in question_lower:
+        return "top_budget", (legacy_extract_number(question) or 10,)
+    
+    elif "recaudac" in question_lower or "revenue" in question_lower or "taquilla" in question_lower:
+        return "top_revenue", (legacy_extract_number(question) or 10,)
+    
+    elif "duración" in question_lower or "duration" in question_lower or "larga" in question_lower or "corta" in question_lower:
+        limit = legacy_extract_number(question) or 10
+        if "corta" in question_lower:
+            return "shortest", (limit,)
+        else:
+            return "longest", (limit,)
+    
+    elif "año" in question_lower or "estreno" in question_lower or "year" in question_lower:
+        return "latest_releases", (legacy_extract_number(question) or 10,)
+    
+    elif "género" in question_lower or "genre" in question_lower:
+        return "genre_list_distinct", ()
+    
+    else:
+        return "top_rated", (legacy_extract_number(question) or 10,)
+
+def legacy_generate_fallback_sql(question_en, original_question=""):
+    # Elige una plantilla usando patrones para preguntas comunes.
+    # Devuelve (template_id, params) o None si ningún patrón especializado encaja
+    question_lower = question_en.lower()
+    original_lower = original_question.lower()
+    
+    # Usar la pregunta original si está disponible para detectar mejor los patrones
+    combined_question = (question_lower + " " + original_lower).lower()
+    
+    if "titles" in question_lower and ("2023" in question_lower or "released" in question_lower):
+        return "titles_2023", ()
+    
+    # Distribución de géneros
+    elif ("distribución" in combined_question or "distribution" in question_lower) and ("género" in combined_question or "genres" in question_lower):
+        return "genre_distribution", ()
+    
+    # Contar películas por género específico
+    elif ("cuántas" in combined_question or "cuantas" in combined_question or "how many" in question_lower) and ("película" in combined_question or "movie" in question_lower):
+        detected_genre = legacy_detect_genre_in_question(combined_question)
+        if detected_genre:
+            return "count_by_genre", (detected_genre,)
+        return None
+    
+    # Top géneros por popularidad
+    elif ("genres" in question_lower or "géneros" in combined_question) and ("top" in question_lower or "popular" in question_lower):
+        return "top_genres_by_popularity", ()
+    
+    # Solo lista de géneros
+    elif ("genres" in question_lower or "géneros" in combined_question) and not ("distribución" in combined_question or "distribution" in question_lower):
+        return "genre_list", ()
+    elif "available" in question_lower:
+        return "genre_list", ()
+    
+    # Películas mejor valoradas
+    elif ("mejor valorad" in combined_question or "highest rated" in question_lower or "best rated" in question_lower or "better" in question_lower) and ("score" in question_lower or "rating" in question_lower):
+        return "top_rated", (legacy_extract_number(original_question or question_en) or 10,)
+    
+    elif "budget" in question_lower or "presupuesto" in combined_question:
+        return "top_budget", (legacy_extract_number(original_question or question_en) or 10,)
+    
+    elif "top" in question_lower and "popularity" in question_lower:
+        return "top_popularity", (legacy_extract_number(original_question or question_en) or 5,)
+    
+    # Buscar si algún género está mencionado en la pregunta
+    detected_genre = legacy_detect_genre_in_question(combined_question)
+    
+    # Películas por género específico
+    if detected_genre:
+        return "movies_by_genre", (detected_genre,)
+    
+    # Fallback inteligente basado en la pregunta original
+    if original_question:
+        return legacy_create_better_fallback(original_question)
+    
+    # Fallback por defecto
+    return "default_top_rated", ()
+
+def legacy_specialised(question):
+    # Solo las reglas especializadas: sin pregunta original la función anterior no encadena
+    # create_better_fallback y termina en default_top_rated (ahora None)
+    result = legacy_generate_fallback_sql(question)
+    return None if result == ("default_top_rated", ()) else result
+
+def legacy_replace_genres(sql_query):
+    for pattern, replacement in GENRE_MAPPING.items():
+        sql_query = re.sub(pattern, replacement, sql_query, flags=re.IGNORECASE)
+    return sql_query
+
+def legacy_classify(question):
+    # Camino anterior de generate_sql: reglas especializadas y, si no hay, las generales
+    return legacy_generate_fallback_sql(question, question) or legacy_create_better_fallback(question)
+
+def measure(fn, items, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for item in items:
+            fn(item)
+    return (time.perf_counter() - start) / (repeats * len(items)) * 1e6
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    # (template_id, params) completos: el número extraído también tiene que coincidir
+    pairs = [
+        (legacy_classify, classify_question),
+        (legacy_specialised, generate_fallback_sql),
+        (legacy_create_better_fallback, create_better_fallback),
+    ]
+    mismatches = [(q, legacy(q), new(q)) for legacy, new in pairs for q in CORPUS if legacy(q) != new(q)]
+    mismatches += [(s, legacy_replace_genres(s), replace_genres(s)) for s in SQL_SAMPLES
+                   if legacy_replace_genres(s) != replace_genres(s)]
+    for item, before, after in mismatches:
+        print(f"DIFERENCIA en {item!r}: {before} != {after}")
+
+    before = measure(legacy_classify, CORPUS, repeats)
+    # Sin la caché de preguntas repetidas: coste real del escaneo y las reglas
+    cold = measure(classify_question.__wrapped__, CORPUS, repeats)
+    warm = measure(classify_question, CORPUS, repeats)
+    print(f"Clasificación ({len(CORPUS)} preguntas): cascada {before:.2f} us | compilado {cold:.2f} us (x{before / cold:.1f}) "
+          f"| pregunta repetida {warm:.2f} us (x{before / warm:.1f})")
+    before = measure(legacy_replace_genres, SQL_SAMPLES, repeats)
+    after = measure(replace_genres, SQL_SAMPLES, repeats)
+    print(f"Géneros en la SQL ({len(SQL_SAMPLES)} consultas): re.sub por género {before:.2f} us | una pasada {after:.2f} us | x{before / after:.1f}")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,69 @@
+# Benchmark de latencia de /predict para una sola película (sin HTTP).
+# Compara el camino anterior (DataFrame de ~230 columnas + scaler.transform) con el
+# camino rápido (fila NumPy preasignada + scaler plegado).
+# Uso (desde movie-api/): python -m app.tests.benchmark_predict [iteraciones]
+import sys
+import time
+import numpy as np
+import pandas as pd
+from app.endpoints import predict
+
+PAYLOAD = {
+    "titulo": "Avatar: The Way of Water",
+    "budget": 460000000,
+    "duracion": 192,
+    "popularity": 85.0,
+    "vote_count": 11000,
+    "true_revenue": 2320000000,
+    "true_budget": 460000000,
+    "true_overview_len": 248,
+    "has_true_overview": 1,
+    "true_tagline_len": 26,
+    "has_true_tagline": 1,
+    "in_collection": 1,
+    "Action": 1,
+    "Adventure": 1,
+    "Drama": 1,
+    "Family": 1,
+    "Fantasy": 1,
+    "Science Fiction": 1,
+    "adult_False": 1,
+    "original_language_en": 1,
+    "spoken_languages_ENGLISH": 1,
+    "status_Released": 1,
+    "num_production_companies": 3,
+    "num_production_countries": 1,
+    "num_spoken_languages": 2,
+    "production_countries_UNITEDSTATESOFAMERICA": 1
+}
+
+def predict_with_dataframe(movie_data):
+    # Camino original de predict_movie_success
+    X = pd.DataFrame([[getattr(movie_data, feat, 0.0) for feat in predict.FEATURES_LIST]], columns=predict.FEATURES_LIST)
+    X = predict.bundle.scaler.transform(X)
+    return float(predict.bundle.model.predict_proba(X)[0][1])
+
+def measure(fn, movie_data, iterations):
+    for _ in range(20):
+        fn(movie_data)
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(movie_data)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    if not predict.load_model():
+        sys.exit(f"Modelo no disponible en {predict.MODEL_PATH}")
+
+    movie_data = predict.MovieInput(**PAYLOAD)
+    before = predict_with_dataframe(movie_data)
+    after = predict.predict_single(movie_data)
+    print(f"Probabilidad DataFrame: {before:.6f} | camino rápido: {after:.6f}")
+
+    for name, fn in [("DataFrame + scaler.transform", predict_with_dataframe),
+                     ("Fila NumPy + scaler plegado", predict.predict_single)]:
+        p50, p99 = measure(fn, movie_data, iterations)
+        print(f"{name:32s} p50={p50:.3f} ms  p99={p99:.3f} ms")
@@ -0,0 +1,153 @@
+# Tokens de entrada y latencia por pregunta del prompt de NL2SQL, antes y después de separarlo
+# en prefijo fijo (reglas + esquema compacto) y pregunta.
+# - Sin GEMINI_API_KEY: tokens estimados (~4 caracteres por token), sin latencia.
+# - Con GEMINI_API_KEY: tokens contados por Gemini (count_tokens) y, con --calls N, latencia
+#   y tokens facturados (usage_metadata) de N preguntas con cada prompt.
+# - Con GEMINI_API_ENDPOINT apuntando a app/tests/fake_llm_server.py se prueba todo sin red.
+# El esquema es el de respaldo salvo que se pase --live (lo lee de la BD).
+# Uso (desde movie-api/): python -m app.tests.benchmark_prompt [--calls N] [--live]
+import argparse
+import asyncio
+import os
+import time
+from app.tests.benchmark_intents import CORPUS
+from app.utils.gemini_client import GeminiClient, get_genai
+from app.utils.schema_prompt import FALLBACK_SCHEMA, build_prompt_prefix, build_question_prompt, fetch_schema
+from app.utils.sql_converter import GEMINI_MODEL
+
+# Esquema y prompt anteriores, tal cual se enviaban en cada llamada
+LEGACY_SCHEMA = """
+    Base de datos de películas - Esquema actualizado:
+
+    Tabla: peliculas
+    - movie_id (INTEGER, PRIMARY KEY)
+    - titulo (TEXT) - título de la película
+    - release_date (DATE) - fecha de estreno
+    - duracion (INTEGER) - duración en minutos
+    - vote_average (NUMERIC(3,1)) - puntuación promedio (0-10)
+    - vote_count (INTEGER) - número de votos
+    - origin_country (TEXT) - país de origen
+    - overview (TEXT) - sinopsis de la película
+    - revenue (BIGINT) - recaudación en dólares
+    - budget (BIGINT) - presupuesto en dólares
+    - adult (BOOLEAN) - contenido para adultos
+    - belong_to_collection (VARCHAR(1000)) - pertenece a colección
+    - original_language (VARCHAR) - idioma original
+    - original_title (VARCHAR(500)) - título original
+    - popularity (DOUBLE PRECISION) - índice de popularidad
+    - production_companies (TEXT) - compañías productoras
+    - production_countries (TEXT) - países de producción
+    - spoken_languages (TEXT) - idiomas hablados
+    - status (VARCHAR) - estado de la película
+    - tagline (VARCHAR(1000)) - eslogan de la película
+
+    Tabla: generos
+    - genero_id (INTEGER, PRIMARY KEY)
+    - nombre (VARCHAR(50)) - nombre del género (Comedy, Action, Drama, etc.)
+
+    Tabla: peliculas_generos (tabla de unión)
+    - movie_id (INTEGER, FOREIGN KEY -> peliculas.movie_id)
+    - genero_id (INTEGER, FOREIGN KEY -> generos.genero_id)
+    """
+
+
+def legacy_prompt(question, schema=LEGACY_SCHEMA):
+    return f"""
+        Eres un experto en SQL para PostgreSQL. Tu tarea es convertir preguntas en lenguaje natural a consultas SQL válidas.
+
+        ESQUEMA DE BASE DE DATOS:
+        {schema}
+
+        REGLAS IMPORTANTES:
+        1. Usa SOLO las tablas y columnas mencionadas en el esquema
+        2. Para filtros por género, SIEMPRE usa JOIN con las tablas generos y peliculas_generos
+        3. Usa LIMIT para controlar el número de resultados (máximo 20)
+        4. Para fechas, usa EXTRACT(YEAR FROM release_date) para obtener el año
+        5. IMPORTANTE: Para contar películas por género usa COUNT(*) desde peliculas_generos con JOIN a generos
+        6. Ordena por campos relevantes según el contexto:
+           - Para valoraciones: vote_average DESC
+           - Para popularidad: popularity DESC o vote_count DESC
+           - Para presupuesto: budget DESC
+           - Para recaudación: revenue DESC
+           - Para duración: duracion DESC
+        7. SIEMPRE incluye las columnas relevantes en SELECT:
+           - Para presupuesto: titulo, budget
+           - Para valoraciones: titulo, vote_average
+           - Para popularidad: titulo, popularity o vote_count
+           - Para recaudación: titulo, revenue
+           - Para duración: titulo, duracion
+           - Para año: titulo, EXTRACT(YEAR FROM release_date) as año
+        8. Usa filtros apropiados:
+           - budget > 0 para consultas de presupuesto
+           - revenue > 0 para consultas de recaudación
+           - vote_average IS NOT NULL para valoraciones
+           - adult = false para contenido familiar
+        9. Retorna SOLO la consulta SQL sin explicaciones adicionales
+        10. La consulta debe terminar con punto y coma (;)
+
+        PREGUNTA: {question}
+
+        SQL:
+        """
+
+
+def count_tokens(text, system_instruction=None):
+    # Tokens según Gemini si hay API key real; si no, estimación por caracteres
+    if os.getenv("GEMINI_API_KEY") and not os.getenv("GEMINI_API_ENDPOINT"):
+        genai = get_genai()
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        model = genai.GenerativeModel(GEMINI_MODEL, system_instruction=system_instruction)
+        return model.count_tokens(text).total_tokens
+    return (len(text) + len(system_instruction or "")) // 4
+
+
+async def measure_calls(client, prompts):
+    # Latencia media (ms) y tokens de entrada medios según usage_metadata
+    start = time.perf_counter()
+    for prompt in prompts:
+        await client.generate(prompt)
+    elapsed = (time.perf_counter() - start) / len(prompts)
+    return elapsed * 1000, client.stats()["avg_prompt_tokens"]
+
+
+async def main(calls, live):
+    schema = await fetch_schema() if live else FALLBACK_SCHEMA
+    prefix = build_prompt_prefix(schema)
+    questions = CORPUS[:10]
+    exact = bool(os.getenv("GEMINI_API_KEY")) and not os.getenv("GEMINI_API_ENDPOINT")
+    label = "contados por Gemini" if exact else "estimados, ~4 caracteres/token"
+
+    before = [count_tokens(legacy_prompt(q)) for q in questions]
+    prefix_tokens = count_tokens(prefix)
+    suffix = [count_tokens(build_question_prompt(q)) for q in questions]
+    avg_before = sum(before) / len(before)
+    avg_suffix = sum(suffix) / len(suffix)
+    print(f"Tokens de entrada por pregunta ({label}, {len(questions)} preguntas):")
+    print(f"  antes:  {avg_before:.0f} (prompt completo en cada llamada)")
+    print(f"  ahora:  {prefix_tokens + avg_suffix:.0f} = prefijo {prefix_tokens} + pregunta {avg_suffix:.0f} "
+          f"({1 - (prefix_tokens + avg_suffix) / avg_before:.0%} menos)")
+    print(f"  con caché de contexto solo la pregunta se procesa entera: {avg_suffix:.0f}")
+
+    if calls and os.getenv("GEMINI_API_KEY"):
+        endpoint = os.getenv("GEMINI_API_ENDPOINT")
+        prompts = (questions * calls)[:calls]
+        legacy_client = GeminiClient(os.getenv("GEMINI_API_KEY"), GEMINI_MODEL, timeout=30, endpoint=endpoint)
+        new_client = GeminiClient(os.getenv("GEMINI_API_KEY"), GEMINI_MODEL, timeout=30, endpoint=endpoint,
+                                  system_instruction=prefix, context_cache=True)
+        # Una llamada de calentamiento por cliente (import, canal, caché de contexto)
+        await legacy_client.generate(legacy_prompt(questions[0]))
+        await new_client.generate(build_question_prompt(questions[0]))
+        ms_before, tokens_before = await measure_calls(legacy_client, [legacy_prompt(q) for q in prompts])
+        ms_after, tokens_after = await measure_calls(new_client, [build_question_prompt(q) for q in prompts])
+        print(f"\nLlamadas a {endpoint or 'Gemini'} ({calls} por prompt):")
+        print(f"  antes:  {ms_before:.0f} ms, {tokens_before:.0f} tokens de entrada facturados")
+        print(f"  ahora:  {ms_after:.0f} ms, {tokens_after:.0f} tokens de entrada facturados "
+              f"(caché de contexto: {'sí' if new_client.context_cache_active else 'no'})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=0, help="Llamadas a Gemini por prompt para medir latencia")
+    parser.add_argument("--live", action="store_true", help="Leer el esquema de la BD en lugar del de respaldo")
+    args = parser.parse_args()
+    asyncio.run(main(args.calls, args.live))
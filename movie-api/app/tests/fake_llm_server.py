@@ -0,0 +1,115 @@
+# Servidor falso de la API REST de Gemini (POST /v1beta/models/<modelo>:generateContent) para
+# probar la API sin red ni cuota: latencia, proporción de errores y SQL devuelta configurables,
+# también en caliente (server.delay = 3). Se usa desde los tests como context manager o desde
+# la línea de comandos apuntando la API a él:
+#   python -m app.tests.fake_llm_server --port 8765 --delay 2 --error-rate 0.3
+#   GEMINI_API_KEY=fake GEMINI_API_ENDPOINT=http://127.0.0.1:8765 uvicorn app.main:app
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_SQL = "SELECT titulo, vote_average FROM peliculas WHERE vote_average IS NOT NULL ORDER BY vote_average DESC LIMIT 10;"
+
+
+def _prompt_chars(request):
+    # Caracteres de texto enviados (system_instruction + contenido)
+    items = [request.get("systemInstruction") or {}] + request.get("contents", [])
+    return sum(len(part.get("text", "")) for item in items for part in item.get("parts", []))
+
+
+class FakeLLMServer:
+
+    def __init__(self, port=0, delay=0.0, error_rate=0.0, error_status=503, sql=DEFAULT_SQL):
+        self.delay = delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.sql = sql
+        self.requests = 0
+        self.last_request = None
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if ":generateContent" not in self.path:
+                    # Sin caché de contexto ni el resto de la API: el cliente debe arreglárselas sin ellas
+                    self._reply(404, {"error": {"code": 404, "message": "No implementado en el servidor falso", "status": "NOT_FOUND"}})
+                    return
+                server.requests += 1
+                server.last_request = json.loads(body or b"{}")
+                prompt_chars = _prompt_chars(server.last_request)
+                if server.delay:
+                    time.sleep(server.delay)
+                if random.random() < server.error_rate:
+                    self._reply(server.error_status, {"error": {"code": server.error_status, "message": "Error simulado", "status": "UNAVAILABLE"}})
+                    return
+                self._reply(200, {"candidates": [{
+                    "content": {"parts": [{"text": f"```sql\n{server.sql}\n```"}], "role": "model"},
+                    "finishReason": "STOP",
+                    "index": 0
+                }], "usageMetadata": {
+                    # Estimación de ~4 caracteres por token (la API real cuenta con su tokenizador)
+                    "promptTokenCount": prompt_chars // 4,
+                    "candidatesTokenCount": len(server.sql) // 4,
+                    "totalTokenCount": (prompt_chars + len(server.sql)) // 4
+                }})
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # El cliente ya abandonó la petición por timeout
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor falso de la API de Gemini")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="Segundos de espera por respuesta")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Proporción de respuestas con error (0-1)")
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+    server = FakeLLMServer(args.port, args.delay, args.error_rate, args.error_status)
+    print(f"Servidor falso de Gemini en {server.url} (delay={args.delay}s, errores={args.error_rate:.0%})")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
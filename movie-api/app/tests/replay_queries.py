@@ -0,0 +1,140 @@
+# Reproduce contra una BD (normalmente una copia local) la SQL que la API ha dejado en el log
+# (líneas "SQL generada: ..." de /ask-text y /ask-visual) y muestra el plan de cada
+# consulta distinta: coste, tablas recorridas con Seq Scan e índices usados. Sirve para ver qué
+# preguntas reales siguen sin índice después de Base de Datos/migraciones/.
+# - Se aplica el mismo LIMIT que pone query_guard, para medir lo que la API ejecuta de verdad.
+# - Por defecto solo EXPLAIN (no ejecuta nada); con --analyze ejecuta cada consulta dentro de
+#   una transacción que se deshace y da el tiempo real.
+# - Los Seq Scan sobre tablas pequeñas (generos) no cuentan: ver --min-rows.
+# Uso (desde movie-api/):
+#   python -m app.tests.replay_queries api.log [--dsn "postgresql://postgres@localhost/TMDB"] [--analyze]
+# Sale con código 1 si alguna consulta hace Seq Scan sobre una tabla grande.
+import argparse
+import json
+import os
+import re
+import sys
+from collections import Counter
+
+import psycopg
+from app.utils.query_guard import QueryRejected, apply_row_limit
+
+LOG_MARKER = re.compile(r"SQL generada: ")
+DEFAULT_DSN = "postgresql://postgres@localhost:5432/TMDB"
+DEFAULT_MIN_ROWS = 10000
+
+
+def extract_queries(text):
+    # SQL de cada línea marcada, hasta el primer ';' (las plantillas ocupan varias líneas)
+    queries = []
+    for match in LOG_MARKER.finditer(text):
+        end = text.find(";", match.end())
+        sql = text[match.end():] if end == -1 else text[match.end():end + 1]
+        sql = " ".join(sql.split())
+        if sql.lower().startswith(("select", "with")):
+            queries.append(sql)
+    return queries
+
+
+def walk_plan(node, scans, indexes):
+    # Recorre el árbol del plan anotando los Seq Scan (tabla, filas estimadas) y los índices usados
+    if node["Node Type"] == "Seq Scan":
+        scans.append((node["Relation Name"], node.get("Plan Rows", 0)))
+    if "Index Name" in node:
+        indexes.add(node["Index Name"])
+    for child in node.get("Plans", []):
+        walk_plan(child, scans, indexes)
+
+
+def table_sizes(cur):
+    # Filas estimadas por tabla (pg_class.reltuples, lo que usa el planificador)
+    cur.execute("SELECT relname, reltuples::bigint FROM pg_class WHERE relkind IN ('r', 'm')")
+    return dict(cur.fetchall())
+
+
+def explain(conn, sql, analyze):
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    with conn.cursor() as cur:
+        try:
+            cur.execute(f"EXPLAIN ({options}) {sql.rstrip(';')}")
+            return cur.fetchone()[0][0]
+        finally:
+            # EXPLAIN ANALYZE ejecuta la consulta: nunca se deja nada hecho
+            conn.rollback()
+
+
+def replay(conn, queries, analyze=False, min_rows=DEFAULT_MIN_ROWS):
+    # Devuelve una fila por consulta distinta: veces, coste, ms, seq scans grandes, índices
+    with conn.cursor() as cur:
+        sizes = table_sizes(cur)
+    conn.rollback()
+    report = []
+    for sql, times in Counter(queries).most_common():
+        try:
+            limited, _ = apply_row_limit(sql)
+        except QueryRejected as e:
+            report.append({"sql": sql, "veces": times, "error": str(e)})
+            continue
+        try:
+            result = explain(conn, limited, analyze)
+        except Exception as e:
+            report.append({"sql": sql, "veces": times, "error": str(e).splitlines()[0]})
+            continue
+        scans, indexes = [], set()
+        walk_plan(result["Plan"], scans, indexes)
+        big_scans = sorted({table for table, _ in scans if sizes.get(table, 0) >= min_rows})
+        report.append({
+            "sql": limited,
+            "veces": times,
+            "coste": result["Plan"]["Total Cost"],
+            "ms": result.get("Execution Time"),
+            "seq_scan": big_scans,
+            "indices": sorted(indexes),
+        })
+    return report
+
+
+def print_report(report):
+    for row in report:
+        print(f"\n[{row['veces']}x] {row['sql'][:160]}")
+        if "error" in row:
+            print(f"  error: {row['error']}")
+            continue
+        timing = f", {row['ms']:.1f} ms" if row["ms"] is not None else ""
+        print(f"  coste {row['coste']:,.0f}{timing}")
+        print(f"  Seq Scan: {', '.join(row['seq_scan']) or '-'}  |  índices: {', '.join(row['indices']) or '-'}")
+    checked = [row for row in report if "error" not in row]
+    pending = [row for row in checked if row["seq_scan"]]
+    executions = sum(row["veces"] for row in pending)
+    print(f"\n{len(checked)} consultas distintas, {len(pending)} con Seq Scan sobre tablas grandes "
+          f"({executions} de {sum(row['veces'] for row in checked)} ejecuciones del log)")
+    tables = Counter(table for row in pending for table in row["seq_scan"])
+    for table, count in tables.most_common():
+        print(f"  {table}: {count} consultas")
+    return pending
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reproduce la SQL del log de la API y busca Seq Scan")
+    parser.add_argument("logs", nargs="+", help="Ficheros de log de la API")
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL", DEFAULT_DSN))
+    parser.add_argument("--analyze", action="store_true", help="Ejecutar las consultas (EXPLAIN ANALYZE, con rollback)")
+    parser.add_argument("--min-rows", type=int, default=DEFAULT_MIN_ROWS,
+                        help="Filas a partir de las que un Seq Scan cuenta como problema")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+
+    queries = []
+    for path in args.logs:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            queries.extend(extract_queries(f.read()))
+    if not queries:
+        sys.exit("No se ha encontrado SQL en los logs (líneas 'SQL generada: ...')")
+    with psycopg.connect(args.dsn) as conn:
+        report = replay(conn, queries, args.analyze, args.min_rows)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        pending = [row for row in report if row.get("seq_scan")]
+    else:
+        pending = print_report(report)
+    sys.exit(1 if pending else 0)
@@ -0,0 +1,67 @@
+# Perfil del tiempo de importación de app.main (python -X importtime en un proceso limpio).
+# Muestra el total, el desglose por paquete y los módulos de la app más lentos, y avisa si
+# alguna librería pesada se importa al arrancar en lugar de bajo demanda.
+# Uso (desde movie-api/): python -m app.tests.startup_profile [presupuesto_ms]
+# Sale con código 1 si se supera el presupuesto o se importa alguna librería pesada.
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+# Librerías que solo deben importarse cuando un endpoint las necesita
+HEAVY_MODULES = ["matplotlib", "seaborn", "pandas", "sklearn", "google.generativeai", "boto3"]
+DEFAULT_BUDGET_MS = 1500
+
+def profile_imports(target="app.main"):
+    # Devuelve (tiempo real en ms, [(módulo, self_us, cumulative_us, nivel)])
+    cwd = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=cwd, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"Error importando {target}:\n{result.stderr[-2000:]}")
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        level = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), level))
+    return wall_ms, entries
+
+def package_breakdown(entries):
+    # Tiempo propio acumulado por paquete de primer nivel
+    totals = defaultdict(int)
+    for name, self_us, _, _ in entries:
+        totals[name.split(".")[0]] += self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+if __name__ == "__main__":
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET_MS
+    wall_ms, entries = profile_imports()
+    imports_ms = sum(self_us for _, self_us, _, _ in entries) / 1000
+
+    print(f"Importación de app.main: {imports_ms:.0f} ms en imports ({wall_ms:.0f} ms con el arranque del intérprete)")
+    print("\nPor paquete:")
+    for package, self_us in package_breakdown(entries)[:15]:
+        print(f"  {package:30s} {self_us / 1000:8.1f} ms")
+    print("\nMódulos de la app (acumulado):")
+    for name, _, cumulative_us, _ in sorted((e for e in entries if e[0].startswith("app.")), key=lambda e: e[2], reverse=True):
+        print(f"  {name:30s} {cumulative_us / 1000:8.1f} ms")
+
+    loaded = {name for name, _, _, _ in entries}
+    eager = [m for m in HEAVY_MODULES if m in loaded]
+    failed = False
+    if eager:
+        print(f"\nLibrerías pesadas importadas al arrancar: {', '.join(eager)}")
+        failed = True
+    if imports_ms > budget_ms:
+        print(f"\nSe supera el presupuesto de arranque: {imports_ms:.0f} ms > {budget_ms:.0f} ms")
+        failed = True
+    if not failed:
+        print(f"\nDentro del presupuesto ({budget_ms:.0f} ms) y sin librerías pesadas al arrancar")
+    sys.exit(1 if failed else 0)
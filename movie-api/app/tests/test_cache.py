@@ -0,0 +1,47 @@
+import asyncio
+from app.utils.cache import Cache, MemoryBackend
+from app.utils.single_flight import SingleFlight
+from app.utils.sql_converter import normalize_question
+
+# Test para la normalización de preguntas usada como clave de la caché de SQL
+def test_normalize_question():
+    assert normalize_question("¿Top 10 películas más populares?") == normalize_question("top 10 peliculas mas populares")
+    assert normalize_question("¿Top 5 películas?") != normalize_question("¿Top 10 películas?")
+
+# Test para el desalojo LRU y los contadores de la caché en memoria
+def test_memory_cache_lru():
+    async def run():
+        cache = Cache("test", MemoryBackend(max_size=2, ttl=60))
+        await cache.set("a", 1)
+        await cache.set("b", 2)
+        await cache.get("a")
+        await cache.set("c", 3)
+        return await cache.get("a"), await cache.get("b"), await cache.stats()
+
+    a, b, stats = asyncio.run(run())
+    assert a == 1
+    assert b is None
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2 and stats["misses"] == 1
+
+# Test para la deduplicación de llamadas concurrentes con la misma clave
+def test_single_flight_coalesces():
+    calls = []
+
+    async def slow(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def run():
+        flight = SingleFlight("test")
+        results = await asyncio.gather(*(flight.do("k", slow, 21) for _ in range(5)), flight.do("otra", slow, 1))
+        # Terminada la llamada, la clave se libera y se vuelve a ejecutar
+        again = await flight.do("k", slow, 21)
+        return results, again, flight.stats()
+
+    results, again, stats = asyncio.run(run())
+    assert results == [42] * 5 + [2]
+    assert again == 42
+    assert calls == [21, 1, 21]
+    assert stats == {"in_flight": 0, "executions": 3, "coalesced": 4, "saved_ratio": 0.571}
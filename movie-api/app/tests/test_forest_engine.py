@@ -0,0 +1,17 @@
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from app.models.forest_engine import export_forest, CompiledForest
+
+# Test para comprobar que el bosque compilado reproduce predict_proba de sklearn
+def test_compiled_forest_matches_sklearn(tmp_path):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(500, 12))
+    y = (X[:, 0] + X[:, 3] > 0).astype(int)
+    model = RandomForestClassifier(n_estimators=15, random_state=0).fit(X, y)
+
+    export_forest(model, tmp_path)
+    compiled = CompiledForest.load(tmp_path)
+
+    X_test = rng.normal(size=(200, 12))
+    assert np.allclose(compiled.predict_proba(X_test), model.predict_proba(X_test), atol=1e-6)
+    assert (compiled.predict(X_test) == model.predict(X_test)).all()
@@ -1,6 +1,7 @@
 from fastapi.testclient import TestClient
 from app.main import app
 import os
+import json
 from datetime import datetime
 
 client = TestClient(app)
@@ -61,3 +62,29 @@ def test_predict_post():
     log_test_result("test_predict_post", response)
     assert response.status_code == 200
     assert "probabilidad_exito" in response.json() or "success" in response.json()
+
+# Test para el endpoint predict/batch con NDJSON en streaming
+def test_predict_batch_ndjson():
+    rows = [
+        {"titulo": "Película A", "budget": 1000000, "duracion": 90, "vote_count": 10},
+        {"titulo": "Película B", "budget": 200000000, "duracion": 150, "vote_count": 9000},
+        {"budget": 1}
+    ]
+    body = "\n".join(json.dumps(row) for row in rows)
+    response = client.post("/predict/batch", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 3
+    assert lines[0]["success"] and "probabilidad_exito" in lines[0]
+    assert lines[2] == {"index": 2, "success": False, "error": lines[2]["error"]}
+
+# Test para el endpoint ask-text en streaming (NDJSON: cabecera, filas y línea final)
+def test_ask_text_stream():
+    payload = {"question": "¿Top 10 películas mejor valoradas?"}
+    response = client.post("/ask-text?stream=true", json=payload)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert "columnas" in lines[0] and "sql_ejecutada" in lines[0] and "plan" in lines[0]
+    assert lines[-1] == {"success": True, "filas": len(lines) - 2}
+    assert all(isinstance(row, list) for row in lines[1:-1])
@@ -0,0 +1,59 @@
+import json
+import pickle
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+from app.models import model_registry
+
+def write_artifacts(path, seed):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(200, 4))
+    y = (X[:, 0] > 0).astype(int)
+    scaler = StandardScaler().fit(X)
+    model = RandomForestClassifier(n_estimators=5, random_state=seed).fit(scaler.transform(X), y)
+    paths = [path / f"model_{seed}.pkl", path / f"scaler_{seed}.pkl", path / f"features_{seed}.json"]
+    paths[0].write_bytes(pickle.dumps(model))
+    paths[1].write_bytes(pickle.dumps(scaler))
+    paths[2].write_text(json.dumps(["a", "b", "c", "d"]))
+    return [str(p) for p in paths]
+
+# Test para registrar, promover y hacer rollback de versiones del modelo
+def test_register_promote_rollback(tmp_path):
+    registry = str(tmp_path / "registry")
+    model_registry.register_version(registry, "v1", *write_artifacts(tmp_path, 1))
+    model_registry.register_version(registry, "v2", *write_artifacts(tmp_path, 2), compile=True)
+
+    model_registry.set_active(registry, "v1")
+    model_registry.set_active(registry, "v2")
+    bundle = model_registry.load_version(registry, "v2")
+    assert bundle.version == "v2" and bundle.model_format == "compiled"
+    assert bundle.feature_index == {"a": 0, "b": 1, "c": 2, "d": 3}
+
+    assert model_registry.rollback(registry)["version"] == "v1"
+    with pytest.raises(ValueError):
+        model_registry.rollback(registry)
+
+# Test para comprobar que un artefacto modificado no se carga
+def test_checksum_mismatch(tmp_path):
+    registry = tmp_path / "registry"
+    model_registry.register_version(str(registry), "v1", *write_artifacts(tmp_path, 1))
+    with open(registry / "v1" / "model_features.json", "a") as f:
+        f.write(" ")
+    with pytest.raises(ValueError, match="Checksum"):
+        model_registry.load_version(str(registry), "v1")
+
+# Test para la carga del bosque compilado: no calcula el checksum de model_rf.pkl, que no abre
+def test_checksum_only_opened_files(tmp_path, monkeypatch):
+    registry = tmp_path / "registry"
+    model_registry.register_version(str(registry), "v1", *write_artifacts(tmp_path, 1), compile=True)
+    hashed = []
+    file_sha256 = model_registry.file_sha256
+    monkeypatch.setattr(model_registry, "file_sha256", lambda path: hashed.append(path) or file_sha256(path))
+    assert model_registry.load_version(str(registry), "v1").model_format == "compiled"
+    assert hashed and not any(path.endswith("model_rf.pkl") for path in hashed)
+    with open(registry / "v1" / "model_rf.pkl", "ab") as f:
+        f.write(b" ")
+    model_registry.load_version(str(registry), "v1")
+    with pytest.raises(ValueError, match="Checksum"):
+        model_registry.load_version(str(registry), "v1", prefer_compiled=False)
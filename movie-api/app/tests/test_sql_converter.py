@@ -0,0 +1,174 @@
+import asyncio
+import time
+from app.utils.sql_converter import create_better_fallback, generate_fallback_sql
+from app.utils.query_templates import TemplateQuery
+from app.utils.query_guard import QueryRejected, QueryRows, apply_row_limit
+
+# Test para comprobar que los fallbacks devuelven plantilla y parámetros en lugar de SQL
+def test_fallback_templates():
+    assert create_better_fallback("¿Top 5 películas más populares?") == ("top_popularity", (5,))
+    assert generate_fallback_sql("¿Películas de drama?", "¿Películas de drama?") == ("movies_by_genre", ("Drama",))
+    assert generate_fallback_sql("¿Cuántas películas hay?", "¿Cuántas películas hay?") is None
+
+# Test para la SQL que se muestra de una plantilla (los parámetros nunca se concatenan al ejecutar)
+def test_template_query_display():
+    query = TemplateQuery("movies_by_genre", ("O'Hara",))
+    assert "g.nombre = 'O''Hara'" in query
+    assert query.query.count("%s") == 1 and query.params == ("O'Hara",)
+    assert TemplateQuery("top_rated", (5,)).cache_key() != TemplateQuery("top_rated", (10,)).cache_key()
+
+# Test para el clasificador compilado: palabras contenidas en otras, prioridad de géneros y números
+def test_intent_matcher():
+    from app.utils.intent_matcher import classify_question, replace_genres, scan_question
+    assert classify_question("Top 20 movies by popularity") == ("top_popularity", (20,))
+    assert classify_question("Titles released in 2023") == ("titles_2023", ())
+    # "2023" es palabra clave y también el primer número de la pregunta, como en la cascada anterior
+    assert generate_fallback_sql("¿Películas con mayor presupuesto de 2023?") == ("top_budget", (2023,))
+    assert classify_question("Películas de 2023: top 5 más populares") == ("top_popularity", (2023,))
+    assert scan_question("¿Películas de acción o comedia?").genre == "Comedy"
+    assert replace_genres("WHERE g.nombre = 'Ciencia Ficción'") == "WHERE g.nombre = 'Science Fiction'"
+
+# Test para el circuit breaker: se abre con fallos, rechaza, y una prueba correcta lo cierra
+def test_circuit_breaker():
+    from app.utils.circuit_breaker import CircuitBreaker
+    breaker = CircuitBreaker("test", failure_ratio=0.5, slow_call_seconds=1.0, window=4, min_calls=2, open_seconds=0.05)
+    assert breaker.allow()
+    breaker.record(True, 0.1)
+    breaker.record(True, 2.0)  # lenta: cuenta como fallo
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow() and not breaker.allow()  # una sola llamada de prueba
+    breaker.record(True, 0.1)
+    assert breaker.state == "closed" and breaker.stats()["rejected"] == 2
+
+# Test del cliente de Gemini contra el servidor falso: respuesta, error, timeout y circuito abierto
+def test_gemini_client_fake_server():
+    from app.tests.fake_llm_server import DEFAULT_SQL, FakeLLMServer
+    from app.utils.circuit_breaker import CircuitBreaker
+    from app.utils.gemini_client import GeminiClient
+    from app.utils.sql_converter import generate_sql_with_gemini
+
+    async def run(server):
+        breaker = CircuitBreaker("test", failure_ratio=0.6, window=4, min_calls=3, open_seconds=60)
+        client = GeminiClient("fake", "gemini-1.5-flash", timeout=5, max_concurrency=2, endpoint=server.url, breaker=breaker)
+        ok = await generate_sql_with_gemini("¿Mejores películas?", client)
+        server.error_rate = 1.0
+        error = await generate_sql_with_gemini("¿Mejores películas?", client)
+        server.error_rate, server.delay, client.timeout = 0.0, 1.0, 0.2
+        start = time.perf_counter()
+        slow = await generate_sql_with_gemini("¿Mejores películas?", client)
+        elapsed = time.perf_counter() - start
+        requests = server.requests
+        rejected = await generate_sql_with_gemini("¿Mejores películas?", client)
+        return ok, error, slow, elapsed, rejected, server.requests - requests, client.stats()
+
+    with FakeLLMServer() as server:
+        ok, error, slow, elapsed, rejected, new_requests, stats = asyncio.run(run(server))
+    assert ok == DEFAULT_SQL
+    assert error is None and slow is None and elapsed < 0.5
+    assert rejected is None and new_requests == 0
+    assert stats["errors"] == 1 and stats["timeouts"] == 1
+    assert stats["circuit"]["state"] == "open" and stats["circuit"]["rejected"] == 1
+
+# Test para la creación del modelo de Gemini: una sola para las peticiones simultáneas, dentro del
+# plazo de cada pregunta, y sin caché de contexto con prefijos pequeños o alias del modelo
+def test_gemini_client_model_build():
+    from app.utils.gemini_client import GeminiClient
+
+    client = GeminiClient("fake", "gemini-1.5-flash", system_instruction="x" * 1400, context_cache=True)
+    assert "mínimo" in client._context_cache_skip_reason()
+    client.system_instruction = "x" * 200000
+    assert "versión fija" in client._context_cache_skip_reason()
+    client.model_name = "gemini-1.5-flash-002"
+    assert client._context_cache_skip_reason() is None
+
+    builds = []
+
+    def slow_build():
+        builds.append(1)
+        time.sleep(0.5)
+
+    async def run():
+        client = GeminiClient("fake", "gemini-1.5-flash", timeout=0.1)
+        client._build_model = slow_build
+        start = time.perf_counter()
+        results = await asyncio.gather(client.generate("a"), client.generate("b"), return_exceptions=True)
+        return results, time.perf_counter() - start, client.stats()
+
+    results, elapsed, stats = asyncio.run(run())
+    assert all(isinstance(r, asyncio.TimeoutError) for r in results)
+    assert elapsed < 0.4 and len(builds) == 1 and stats["timeouts"] == 2
+
+# Test para el esquema compacto del prompt generado a partir de information_schema
+def test_format_schema():
+    from app.utils.schema_prompt import LIST_TABLES_HINT, format_schema
+    columns = [
+        ("generos", "genero_id", "integer", None),
+        ("generos", "nombre", "character varying", None),
+        ("peliculas", "movie_id", "integer", None),
+        ("peliculas", "duracion", "integer", None),
+        ("peliculas_generos", "movie_id", "integer", None),
+        ("data_version", "version", "bigint", None),
+    ]
+    keys = [
+        ("PRIMARY KEY", "generos", "genero_id", None, None),
+        ("PRIMARY KEY", "peliculas", "movie_id", None, None),
+        ("PRIMARY KEY", "peliculas_generos", "movie_id", None, None),
+        ("FOREIGN KEY", "peliculas_generos", "movie_id", "peliculas", "movie_id"),
+    ]
+    schema = format_schema(columns, keys, ["Action", "Comedy"])
+    assert schema.splitlines() == [
+        "generos: genero_id int PK, nombre varchar",
+        "peliculas: movie_id int PK, duracion int (minutos)",
+        "peliculas_generos: movie_id int -> peliculas.movie_id",
+        "Valores de generos.nombre: Action, Comedy",
+    ]
+    columns.append(("peliculas_companias", "compania_id", "integer", None))
+    assert format_schema(columns, keys).splitlines()[-1] == LIST_TABLES_HINT
+
+# Test para el LIMIT obligatorio: se añade si falta, se reduce si es excesivo y se ignoran los de subconsultas y comentarios
+def test_apply_row_limit():
+    assert apply_row_limit("SELECT titulo FROM peliculas;", 100, 1000) == ("SELECT titulo FROM peliculas LIMIT 100;", "added")
+    assert apply_row_limit("SELECT titulo FROM peliculas LIMIT 5000", 100, 1000) == ("SELECT titulo FROM peliculas LIMIT 1000;", "reduced")
+    assert apply_row_limit("SELECT titulo FROM peliculas LIMIT 20;", 100, 1000) == ("SELECT titulo FROM peliculas LIMIT 20;", None)
+    sql, change = apply_row_limit("SELECT * FROM (SELECT titulo FROM peliculas LIMIT 5) t WHERE titulo <> 'limit 3'", 100, 1000)
+    assert change == "added" and sql.endswith(") t WHERE titulo <> 'limit 3' LIMIT 100;")
+    # Los comentarios no cuentan: ni el LIMIT se añade dentro de uno ni un "limit" comentado vale como LIMIT
+    assert apply_row_limit("SELECT titulo FROM peliculas ORDER BY budget DESC -- mayores presupuestos", 100, 1000) == (
+        "SELECT titulo FROM peliculas ORDER BY budget DESC LIMIT 100;", "added")
+    assert apply_row_limit("SELECT titulo FROM peliculas /* limit 5 */ ORDER BY budget DESC", 100, 1000) == (
+        "SELECT titulo FROM peliculas /* limit 5 */ ORDER BY budget DESC LIMIT 100;", "added")
+    assert apply_row_limit("SELECT titulo FROM peliculas LIMIT 5; -- top 5", 100, 1000) == ("SELECT titulo FROM peliculas LIMIT 5;", None)
+    try:
+        apply_row_limit("SELECT 1; DROP TABLE peliculas;", 100, 1000)
+        assert False, "Se esperaba QueryRejected"
+    except QueryRejected:
+        pass
+    rows = QueryRows([(1,)], {"coste_estimado": 1.5})
+    assert rows == [(1,)] and rows.guard["coste_estimado"] == 1.5
+
+# Test para el enrutado a las tablas de resumen: solo se reescribe lo que da el mismo resultado
+def test_analytics_routes():
+    from app.utils.analytics_routes import rewrite_sql, route_template, set_analytics_views
+    assert rewrite_sql("SELECT g.nombre, COUNT(*) FROM generos g JOIN peliculas_generos pg ON g.genero_id = pg.genero_id GROUP BY g.nombre") is None
+    set_analytics_views({"resumen_generos", "resumen_anios", "top_peliculas"})
+    try:
+        view, sql = rewrite_sql(
+            "SELECT g.nombre, COUNT(*) AS total FROM peliculas_generos pg JOIN generos g ON pg.genero_id = g.genero_id "
+            "GROUP BY g.nombre ORDER BY total DESC LIMIT 10;"
+        )
+        assert view == "resumen_generos"
+        assert sql == "SELECT nombre AS nombre, num_peliculas AS total FROM resumen_generos WHERE num_peliculas > 0 ORDER BY total desc LIMIT 10;"
+        view, sql = rewrite_sql("SELECT EXTRACT(YEAR FROM release_date) AS año, COUNT(*) FROM peliculas GROUP BY año ORDER BY año")
+        assert view == "resumen_anios" and sql == "SELECT anio AS año, num_peliculas AS count FROM resumen_anios ORDER BY año;"
+        # Filtros que cambian las medias, HAVING y LEFT JOIN con COUNT(*) se ejecutan tal cual
+        assert rewrite_sql("SELECT g.nombre, AVG(p.budget) FROM generos g JOIN peliculas_generos pg ON g.genero_id = pg.genero_id "
+                           "JOIN peliculas p ON pg.movie_id = p.movie_id WHERE p.budget > 0 GROUP BY g.nombre") is None
+        assert rewrite_sql("SELECT g.nombre, COUNT(*) FROM peliculas_generos pg JOIN generos g ON pg.genero_id = g.genero_id "
+                           "GROUP BY g.nombre HAVING COUNT(*) > 10") is None
+        assert rewrite_sql("SELECT g.nombre, COUNT(*) FROM generos g LEFT JOIN peliculas_generos pg ON g.genero_id = pg.genero_id GROUP BY g.nombre") is None
+        assert route_template("top_rated", (10,))[0] == "top_peliculas"
+        assert route_template("top_rated", (500,)) is None
+        assert route_template("movies_by_genre", ("Drama",)) is None
+    finally:
+        set_analytics_views(set())
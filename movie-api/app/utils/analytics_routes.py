@@ -0,0 +1,251 @@
+# Enrutado de las preguntas agregadas a las tablas de resumen (Base de Datos/analytics-views.sql).
+# Las vistas materializadas se recalculan en cada carga, así que agregar todo peliculas +
+# peliculas_generos en cada petición se sustituye por leer unas pocas filas indexadas:
+# - las plantillas de los fallbacks tienen su equivalente sobre las vistas (ANALYTICS_TEMPLATES);
+# - la SQL de Gemini se reescribe si es un GROUP BY por género o por año de estreno con
+#   COUNT/AVG que las vistas ya tienen calculado. Si no encaja exactamente se ejecuta tal cual.
+# Las vistas disponibles las fija sql_predictor al leer pg_matviews: sin ellas no se enruta nada.
+import re
+
+# Posiciones guardadas por métrica en top_peliculas
+ANALYTICS_TOP_N = 100
+
+# Plantilla -> (vista, SQL equivalente con los mismos parámetros y columnas)
+ANALYTICS_TEMPLATES = {
+    "genre_distribution": ("resumen_generos", """
+        SELECT nombre, num_peliculas AS cantidad_peliculas
+        FROM resumen_generos
+        ORDER BY cantidad_peliculas DESC
+        LIMIT 10;
+        """),
+    "count_by_genre": ("resumen_generos", """
+        SELECT COALESCE(SUM(num_peliculas), 0)::bigint AS total_peliculas
+        FROM resumen_generos
+        WHERE nombre = %s;
+        """),
+    "top_genres_by_popularity": ("resumen_generos", """
+        SELECT nombre, num_peliculas AS total_peliculas, avg_vote_count AS popularidad_promedio
+        FROM resumen_generos
+        ORDER BY popularidad_promedio DESC
+        LIMIT 5;
+        """),
+}
+
+# Plantillas top_* -> (métrica en top_peliculas, columna devuelta con su tipo original)
+TOP_TEMPLATES = {
+    "top_rated": ("vote_average", "valor::numeric AS vote_average"),
+    "top_popularity": ("popularity", "valor AS popularity"),
+    "top_votes": ("vote_count", "valor::int AS vote_count"),
+    "top_budget": ("budget", "valor::bigint AS budget"),
+    "top_revenue": ("revenue", "valor::bigint AS revenue"),
+    "longest": ("duracion", "valor::int AS duracion"),
+    "shortest": ("duracion_asc", "valor::int AS duracion"),
+}
+for _template_id, (_metric, _column) in TOP_TEMPLATES.items():
+    ANALYTICS_TEMPLATES[_template_id] = ("top_peliculas", f"""
+        SELECT titulo, {_column}
+        FROM top_peliculas
+        WHERE metrica = '{_metric}'
+        ORDER BY posicion
+        LIMIT %s;
+        """)
+
+# Columnas de peliculas con su media precalculada (avg_<columna>) en las vistas de resumen
+METRIC_COLUMNS = {"vote_average", "vote_count", "popularity", "duracion", "budget", "revenue"}
+
+_available_views = set()
+analytics_stats = {"templates": 0, "gemini": 0, "gemini_not_matched": 0}
+
+_AGGREGATE = re.compile(
+    r"^select (?P<items>.+?) from (?P<source>.+?)(?: where (?P<where>.+?))? group by (?P<group>.+?)"
+    r"(?: order by (?P<order>.+?))?(?: limit (?P<limit>\d+))?$"
+)
+_ITEM = re.compile(r"^(?P<expr>.+?)(?:(?: as)? (?P<alias>\w+))?$")
+_COLUMN = r"(?:\w+\.)?(?P<column>\w+)"
+_NAME = re.compile(rf"^{_COLUMN}$")
+_COUNT = re.compile(r"^count\((?:\*|(?:distinct )?(?:\w+\.)?movie_id)\)$")
+_AVG = re.compile(rf"^avg\({_COLUMN}\)$")
+_ROUND_AVG = re.compile(rf"^round\(avg\({_COLUMN}\)(?:::numeric)?, ?(?P<digits>\d)\)$")
+_YEAR = re.compile(r"^extract\(year from (?:\w+\.)?release_date\)$")
+_YEAR_FILTER = re.compile(r"^extract\(year from (?:\w+\.)?release_date\) ?(?P<op>=|<>|!=|>=|<=|>|<) ?(?P<year>\d{4})$")
+_NOT_NULL_DATE = re.compile(r"^(?:\w+\.)?release_date is not null$")
+_ORDER = re.compile(r"^(?P<expr>.+?)(?P<direction> asc| desc)?(?P<nulls> nulls first| nulls last)?$")
+_TABLES = re.compile(r"(?:^|join )(\w+)")
+_JOIN_ON = re.compile(r" on (.+?)(?= (?:left |left outer |inner )?join |$)")
+_JOIN_KEY = re.compile(r"^\w+\.(genero_id|movie_id) ?= ?\w+\.\1$")
+
+
+def set_analytics_views(views):
+    # Vistas de resumen presentes y pobladas en la BD (las lee sql_predictor de pg_matviews)
+    global _available_views
+    views = set(views)
+    if views != _available_views:
+        print(f"Tablas de resumen disponibles: {', '.join(sorted(views)) or 'ninguna'}")
+    _available_views = views
+
+
+def route_template(template_id, params):
+    # (vista, SQL) equivalente a la plantilla, o None si la vista no está o los tops no llegan
+    route = ANALYTICS_TEMPLATES.get(template_id)
+    if route is None or route[0] not in _available_views:
+        return None
+    if template_id in TOP_TEMPLATES and (not params or params[0] > ANALYTICS_TOP_N):
+        return None
+    analytics_stats["templates"] += 1
+    return route
+
+
+def _split(text, separator=","):
+    # Parte por separator solo en el nivel superior (fuera de paréntesis)
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(text[start:i].strip())
+            start = i + 1
+    parts.append(text[start:].strip())
+    return parts
+
+
+def _map_expression(expr, dimension):
+    # Expresión de la consulta original -> (expresión sobre la vista, nombre de columna por defecto)
+    if dimension == "genre" and (m := _NAME.match(expr)) and m.group("column") == "nombre":
+        return "nombre", "nombre"
+    if dimension == "year" and _YEAR.match(expr):
+        return "anio", "extract"
+    if _COUNT.match(expr):
+        return "num_peliculas", "count"
+    if (m := _AVG.match(expr)) and m.group("column") in METRIC_COLUMNS:
+        return f"avg_{m.group('column')}", "avg"
+    if (m := _ROUND_AVG.match(expr)) and m.group("column") in METRIC_COLUMNS:
+        return f"round(avg_{m.group('column')}::numeric, {m.group('digits')})", "round"
+    return None
+
+
+def _year_filters(where):
+    # Condiciones sobre el año de estreno, las únicas que se pueden aplicar sobre resumen_anios
+    filters = []
+    for condition in where.split(" and "):
+        if _NOT_NULL_DATE.match(condition):
+            filters.append("anio IS NOT NULL")
+        elif m := _YEAR_FILTER.match(condition):
+            filters.append(f"anio {m.group('op')} {m.group('year')}")
+        else:
+            return None
+    return filters
+
+
+def _top_level(text):
+    # Mismo texto con el interior de los paréntesis tapado, para buscar las cláusulas
+    # (FROM, WHERE...) solo en el nivel superior; las posiciones coinciden con el original
+    masked, depth = [], 0
+    for char in text:
+        if char == ")":
+            depth -= 1
+        masked.append("_" if depth > 0 else char)
+        if char == "(":
+            depth += 1
+    return "".join(masked)
+
+
+def _rewrite(sql):
+    if "'" in sql or '"' in sql or ";" in sql:
+        return None
+    masked = _AGGREGATE.match(_top_level(sql))
+    if not masked or "(" in masked.group("source"):
+        return None
+    match = {name: sql[slice(*masked.span(name))] if masked.group(name) is not None else None
+             for name in _AGGREGATE.groupindex}
+    source = match["source"]
+    tables = set(_TABLES.findall(source))
+    if re.search(r"\b(?:right|full|cross|natural|using)\b|,", source):
+        return None
+
+    filters = []
+    if tables == {"peliculas"} and "join" not in source:
+        dimension, view = "year", "resumen_anios"
+        if match["where"]:
+            filters = _year_filters(match["where"])
+            if filters is None:
+                return None
+    elif tables in ({"generos", "peliculas_generos"}, {"generos", "peliculas_generos", "peliculas"}):
+        dimension, view = "genre", "resumen_generos"
+        if match["where"] or not all(_JOIN_KEY.match(c) for c in _JOIN_ON.findall(source)):
+            return None
+        inner = bool(re.search(r"(?<!left )join ", source.replace("left outer join", "left join")))
+    else:
+        return None
+    if view not in _available_views:
+        return None
+
+    select, by_alias = [], {}
+    for item in _split(match["items"]):
+        m = _ITEM.match(item)
+        mapped = _map_expression(m.group("expr"), dimension)
+        if mapped is None:
+            return None
+        expression, default_name = mapped
+        if dimension == "genre" and expression.startswith(("avg_", "round(")) and "peliculas" not in tables:
+            return None
+        if dimension == "genre" and expression == "num_peliculas" and not inner and m.group("expr").startswith("count(*)"):
+            # Con LEFT JOIN, COUNT(*) cuenta 1 para un género sin películas; la vista cuenta 0
+            return None
+        alias = m.group("alias") or default_name
+        by_alias[alias] = expression
+        select.append(f"{expression} AS {alias}")
+
+    group = match["group"]
+    if dimension == "genre":
+        grouped = (m := _NAME.match(group)) and m.group("column") == "nombre"
+    else:
+        grouped = bool(_YEAR.match(group)) or by_alias.get(group) == "anio" or group == "1" and select[0].startswith("anio ")
+    if not grouped:
+        return None
+    if dimension == "genre" and inner:
+        filters.append("num_peliculas > 0")
+
+    order = []
+    for item in _split(match["order"] or ""):
+        if not item:
+            continue
+        m = _ORDER.match(item)
+        expr = m.group("expr")
+        if expr in by_alias or expr.isdigit():
+            target = expr
+        else:
+            mapped = _map_expression(expr, dimension)
+            if mapped is None:
+                return None
+            target = mapped[0]
+        order.append(target + (m.group("direction") or "") + (m.group("nulls") or ""))
+
+    rewritten = f"SELECT {', '.join(select)} FROM {view}"
+    if filters:
+        rewritten += " WHERE " + " AND ".join(filters)
+    if order:
+        rewritten += " ORDER BY " + ", ".join(order)
+    if match["limit"]:
+        rewritten += f" LIMIT {match['limit']}"
+    return view, rewritten + ";"
+
+
+def rewrite_sql(sql):
+    # (vista, SQL sobre la vista) si la consulta de Gemini es una agregación que las tablas de
+    # resumen ya tienen calculada; None en otro caso. Solo se reescribe lo que da el mismo resultado
+    if not _available_views:
+        return None
+    normalized = " ".join(sql.strip().rstrip(";").split()).lower()
+    route = _rewrite(normalized)
+    if route is None:
+        analytics_stats["gemini_not_matched"] += 1
+        return None
+    analytics_stats["gemini"] += 1
+    return route
+
+
+def get_analytics_stats():
+    # Contadores para /health
+    return {"views": sorted(_available_views), **analytics_stats}
@@ -0,0 +1,196 @@
+import logging
+import pickle
+import sys
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Cachés registradas, para exponer sus métricas en /health
+_caches = []
+
+
+def estimate_size(value):
+    # Tamaño aproximado en bytes de un resultado (listas/tuplas de valores simples)
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            size += estimate_size(item)
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            size += estimate_size(k) + estimate_size(v)
+    return size
+
+
+class MemoryBackend:
+    # Caché en memoria del proceso con expiración (TTL) y desalojo LRU por número de entradas
+    # y, opcionalmente, por presupuesto de memoria (max_bytes)
+
+    def __init__(self, max_size=1000, ttl=3600, max_bytes=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._data = OrderedDict()
+        self.evictions = 0
+
+    async def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value, nbytes = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key, value):
+        nbytes = estimate_size(value) if self.max_bytes else 0
+        # Un único valor que no cabe en el presupuesto no se cachea
+        if self.max_bytes and nbytes > self.max_bytes:
+            return
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = (time.monotonic() + self.ttl, value, nbytes)
+        self.current_bytes += nbytes
+        while len(self._data) > self.max_size or (self.max_bytes and self.current_bytes > self.max_bytes):
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, _, nbytes = self._data.pop(key)
+        self.current_bytes -= nbytes
+
+    async def clear(self):
+        self._data.clear()
+        self.current_bytes = 0
+
+    async def size(self):
+        return len(self._data)
+
+
+class RedisBackend:
+    # Caché en un servidor compatible con Redis (Redis, Valkey, KeyDB...) compartida entre workers.
+    # Cada entrada expira con su TTL y un sorted set con el último acceso mantiene el límite LRU.
+
+    def __init__(self, url, namespace, max_size=1000, ttl=3600):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("El backend 'redis' de la caché requiere el paquete 'redis' (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.namespace = namespace
+        self.max_size = max_size
+        self.ttl = ttl
+        self.evictions = 0
+        self._lru_key = f"{namespace}:__lru__"
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key):
+        raw = await self.client.get(self._key(key))
+        if raw is None:
+            return None
+        await self.client.zadd(self._lru_key, {key: time.time()})
+        return pickle.loads(raw)
+
+    async def set(self, key, value):
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.set(self._key(key), pickle.dumps(value), ex=self.ttl)
+            pipe.zadd(self._lru_key, {key: time.time()})
+            pipe.zcard(self._lru_key)
+            _, _, size = await pipe.execute()
+        overflow = size - self.max_size
+        if overflow > 0:
+            oldest = await self.client.zpopmin(self._lru_key, overflow)
+            if oldest:
+                await self.client.delete(*[self._key(k.decode()) for k, _ in oldest])
+                self.evictions += len(oldest)
+
+    async def clear(self):
+        keys = [k async for k in self.client.scan_iter(match=f"{self.namespace}:*")]
+        if keys:
+            await self.client.delete(*keys)
+
+    async def size(self):
+        return await self.client.zcard(self._lru_key)
+
+
+class Cache:
+    # Fachada común sobre el backend: cuenta aciertos y fallos.
+    # Un error del backend nunca rompe la petición: se trata como un fallo de caché.
+
+    def __init__(self, name, backend):
+        self.name = name
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def get(self, key):
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Error leyendo la caché '{self.name}': {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key, value):
+        try:
+            await self.backend.set(key, value)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Error escribiendo en la caché '{self.name}': {e}")
+
+    async def clear(self):
+        await self.backend.clear()
+
+    async def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "size": await self.backend.size(),
+            "max_size": self.backend.max_size,
+            "ttl": self.backend.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "evictions": self.backend.evictions,
+            "errors": self.errors,
+            **({"bytes": self.backend.current_bytes, "max_bytes": self.backend.max_bytes}
+               if getattr(self.backend, "max_bytes", None) else {}),
+        }
+
+
+def create_cache(name, backend="memory", max_size=1000, ttl=3600, redis_url=None, max_bytes=None):
+    # Crea y registra una caché con el backend indicado ("memory" o "redis").
+    # max_bytes solo aplica al backend en memoria; en Redis manda el maxmemory del servidor.
+    if backend == "redis":
+        store = RedisBackend(redis_url or "redis://localhost:6379/0", namespace=f"movie-api:{name}",
+                             max_size=max_size, ttl=ttl)
+    elif backend == "memory":
+        store = MemoryBackend(max_size=max_size, ttl=ttl, max_bytes=max_bytes)
+    else:
+        raise ValueError(f"Backend de caché desconocido: {backend}")
+    cache = Cache(name, store)
+    _caches.append(cache)
+    return cache
+
+
+async def get_cache_stats():
+    # Métricas de todas las cachés registradas
+    stats = {}
+    for cache in _caches:
+        try:
+            stats[cache.name] = await cache.stats()
+        except Exception as e:
+            stats[cache.name] = {"error": str(e)}
+    return stats
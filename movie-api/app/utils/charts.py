@@ -0,0 +1,86 @@
+# Renderizado de gráficos. Este módulo solo depende de matplotlib/pandas
+# para que los procesos del pool de renderizado arranquen rápido y sin tocar la BD.
+# Ambos se importan dentro de las funciones: el proceso de la API solo necesita
+# referenciar render_chart_png y nunca carga matplotlib ni pandas.
+import io
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+def create_chart(df, chart_type, question):
+    # Crea el gráfico basado en los datos y tipo
+    plt = _pyplot()
+    plt.figure(figsize=(12, 8))
+    plt.style.use('seaborn-v0_8' if 'seaborn-v0_8' in plt.style.available else 'default')
+    
+    if len(df.columns) == 1:
+        value_counts = df.iloc[:, 0].value_counts().head(10)
+        
+        if chart_type == "pie":
+            colors = plt.cm.Set3(range(len(value_counts)))
+            plt.pie(value_counts.values, labels=value_counts.index, autopct='%1.1f%%', colors=colors)
+            plt.title(f"{question}", fontsize=16, fontweight='bold', pad=20)
+        else:
+            bars = plt.bar(range(len(value_counts)), value_counts.values, color='steelblue', alpha=0.8)
+            plt.xticks(range(len(value_counts)), value_counts.index, rotation=45, ha='right')
+            plt.title(f"{question}", fontsize=16, fontweight='bold', pad=20)
+            plt.ylabel("Cantidad", fontsize=12)
+            plt.grid(axis='y', alpha=0.3)
+            
+            for bar in bars:
+                height = bar.get_height()
+                plt.text(bar.get_x() + bar.get_width()/2., height,
+                        f'{int(height)}', ha='center', va='bottom', fontweight='bold')
+        
+    elif len(df.columns) == 2:
+        if chart_type == "pie":
+            colors = plt.cm.Set3(range(len(df)))
+            plt.pie(df.iloc[:, 1], labels=df.iloc[:, 0], autopct='%1.1f%%', colors=colors)
+            plt.title(f"{question}", fontsize=16, fontweight='bold', pad=20)
+        elif chart_type == "line":
+            plt.plot(df.iloc[:, 0], df.iloc[:, 1], marker='o', linewidth=3, markersize=8, color='steelblue')
+            plt.title(f"📈 {question}", fontsize=16, fontweight='bold', pad=20)
+            plt.xlabel(df.columns[0], fontsize=12)
+            plt.ylabel(df.columns[1], fontsize=12)
+            plt.grid(True, alpha=0.3)
+        else:
+            bars = plt.bar(range(len(df)), df.iloc[:, 1], color='steelblue', alpha=0.8)
+            plt.xticks(range(len(df)), df.iloc[:, 0], rotation=45, ha='right')
+            plt.title(f"{question}", fontsize=16, fontweight='bold', pad=20)
+            plt.ylabel(df.columns[1], fontsize=12)
+            plt.grid(axis='y', alpha=0.3)
+            
+            for bar in bars:
+                height = bar.get_height()
+                plt.text(bar.get_x() + bar.get_width()/2., height,
+                        f'{height:.1f}', ha='center', va='bottom', fontweight='bold')
+            
+    elif len(df.columns) == 3:
+        bars = plt.bar(range(len(df)), df.iloc[:, 2], color='steelblue', alpha=0.8)
+        plt.xticks(range(len(df)), df.iloc[:, 0], rotation=45, ha='right')
+        plt.title(f"{question}", fontsize=16, fontweight='bold', pad=20)
+        plt.ylabel(df.columns[2], fontsize=12)
+        plt.grid(axis='y', alpha=0.3)
+        
+        for bar in bars:
+            height = bar.get_height()
+            plt.text(bar.get_x() + bar.get_width()/2., height,
+                    f'{height:.1f}', ha='center', va='bottom', fontweight='bold')
+    
+    plt.tight_layout()
+
+def render_chart_png(rows, columns, chart_type, question):
+    # Crea el gráfico con las 10 primeras filas y lo devuelve como bytes PNG
+    # (se ejecuta en el pool de renderizado)
+    import pandas as pd
+    df = pd.DataFrame(rows, columns=columns).head(10)
+    create_chart(df, chart_type, question)
+    plt = _pyplot()
+    buf = io.BytesIO()
+    plt.savefig(buf, format="png", dpi=200, bbox_inches='tight', 
+               facecolor='white', edgecolor='none')
+    plt.close()
+    return buf.getvalue()
@@ -0,0 +1,76 @@
+import time
+from collections import deque
+
+
+class CircuitOpenError(Exception):
+    # Se lanza cuando el circuito está abierto y la llamada ni siquiera se intenta
+    pass
+
+
+class CircuitBreaker:
+    # Circuit breaker por proporción de fallos en una ventana de las últimas llamadas.
+    # closed: las llamadas pasan y se anota su resultado (error, timeout y llamada lenta
+    #   cuentan como fallo); si la proporción de fallos llega al umbral se abre.
+    # open: se rechaza todo durante open_seconds.
+    # half_open: pasa una única llamada de prueba; si va bien se cierra, si no se vuelve a abrir.
+
+    def __init__(self, name, failure_ratio=0.5, slow_call_seconds=5.0, window=20, min_calls=5, open_seconds=30.0):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def allow(self):
+        # True si la llamada puede hacerse; cada llamada permitida debe terminar con record()
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                self.rejected += 1
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record(self, ok, seconds):
+        failed = not ok or seconds >= self.slow_call_seconds
+        self.calls += 1
+        self.failures += failed
+        if self.state == "half_open":
+            self._probe_in_flight = False
+            if failed:
+                self._open()
+            else:
+                self.state = "closed"
+                self._outcomes.clear()
+            return
+        self._outcomes.append(failed)
+        if len(self._outcomes) >= self.min_calls and sum(self._outcomes) / len(self._outcomes) >= self.failure_ratio:
+            self._open()
+
+    def _open(self):
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.times_opened += 1
+        print(f"Circuito '{self.name}' abierto durante {self.open_seconds:g}s")
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "calls": self.calls,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "times_opened": self.times_opened,
+        }
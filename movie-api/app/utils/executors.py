@@ -0,0 +1,92 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from app.config import RENDER_POOL_SIZE, INFERENCE_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedExecutor:
+    # Pool de tamaño fijo para sacar trabajo bloqueante del event loop.
+    # Lleva la cuenta de tareas en curso y en cola para exponerlas en /health.
+
+    def __init__(self, name, max_workers, kind="thread"):
+        self.name = name
+        self.max_workers = max_workers
+        self.kind = kind
+        self._executor = None
+        self._in_flight = 0
+        self._max_queue_depth = 0
+        self._completed = 0
+        self._failed = 0
+
+    def _get_executor(self):
+        # El pool se crea en el primer uso para no lanzar procesos al importar
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn evita heredar locks e hilos del proceso de uvicorn
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=self.name
+                )
+        return self._executor
+
+    @property
+    def queue_depth(self):
+        # Tareas enviadas que todavía no tienen un worker libre
+        return max(0, self._in_flight - self.max_workers)
+
+    async def run(self, fn, *args, **kwargs):
+        # Ejecuta fn(*args, **kwargs) en el pool y espera el resultado sin bloquear el loop
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        self._in_flight += 1
+        self._max_queue_depth = max(self._max_queue_depth, self.queue_depth)
+        try:
+            result = await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+            self._completed += 1
+            return result
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._in_flight -= 1
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self._max_queue_depth,
+            "completed": self._completed,
+            "failed": self._failed,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Renderizado de gráficos (CPU y estado global de pyplot): procesos separados
+render_pool = BoundedExecutor("render", RENDER_POOL_SIZE, kind="process")
+# Inferencia del modelo ML (numpy/sklearn liberan el GIL en gran parte): hilos
+inference_pool = BoundedExecutor("inference", INFERENCE_POOL_SIZE, kind="thread")
+
+
+def get_executor_stats():
+    # Métricas de todos los pools para /health
+    return {pool.name: pool.stats() for pool in (render_pool, inference_pool)}
+
+
+def shutdown_executors():
+    for pool in (render_pool, inference_pool):
+        pool.shutdown()
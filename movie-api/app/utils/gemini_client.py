@@ -0,0 +1,214 @@
+import asyncio
+import re
+import time
+from datetime import timedelta
+from app.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+_genai = None
+# Versión fija del modelo (gemini-1.5-flash-002): la caché de contexto no admite los alias
+_VERSIONED_MODEL = re.compile(r"-\d{3}$")
+
+
+def get_genai():
+    # google.generativeai tarda ~1 s en importarse: se carga en la primera pregunta
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        _genai = genai
+    return _genai
+
+
+class GeminiClient:
+    # Cliente de Gemini de larga vida: el GenerativeModel (y su canal) se crea una sola vez.
+    # Cada llamada tiene un plazo total (esperar hueco + respuesta), como mucho max_concurrency
+    # llamadas a la vez, y el circuit breaker corta las llamadas mientras Gemini falla o va lento.
+    # Con endpoint se usa la API REST en ese servidor (el cliente asíncrono de la librería
+    # solo funciona por gRPC, así que la llamada REST se hace en un hilo).
+    # La parte fija del prompt va como system_instruction; con context_cache se intenta subir
+    # a la caché de contexto de Gemini para que no se procese (ni se facture entera) en cada
+    # llamada. Solo se intenta si el prefijo llega a context_cache_min_tokens y el modelo es una
+    # versión fija; si no, o si la API la rechaza, se sigue enviando como system_instruction.
+    # El modelo (y la caché) se crea en un hilo, una sola vez para todas las peticiones que
+    # llegan a la vez, y cada una espera como mucho su propio plazo.
+
+    def __init__(self, api_key, model_name, timeout=8.0, max_concurrency=8, endpoint=None, breaker=None,
+                 system_instruction=None, context_cache=False, context_cache_ttl=3600, context_cache_min_tokens=32768):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.endpoint = endpoint
+        self.breaker = breaker or CircuitBreaker("gemini")
+        self.system_instruction = system_instruction
+        self.context_cache = context_cache
+        self.context_cache_ttl = context_cache_ttl
+        self.context_cache_min_tokens = context_cache_min_tokens
+        self.context_cache_active = False
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._build_task = None
+        self._model = None
+        self._model_expires_at = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.queue_timeouts = 0
+        self._latency_total = 0.0
+        self._latency_count = 0
+        self._prompt_tokens = 0
+        self._cached_tokens = 0
+        self._output_tokens = 0
+        self._usage_count = 0
+
+    def set_system_instruction(self, text):
+        # Cambia la parte fija del prompt; el modelo se rehace en la siguiente llamada
+        if text != self.system_instruction:
+            self.system_instruction = text
+            self._model = None
+
+    def _needs_model(self):
+        return self._model is None or (self._model_expires_at is not None and time.monotonic() >= self._model_expires_at)
+
+    def _context_cache_skip_reason(self):
+        # Por qué no se intenta la caché de contexto (None si se puede intentar). El tamaño se
+        # estima con ~4 caracteres por token para no gastar una llamada en contarlo
+        tokens = len(self.system_instruction) // 4
+        if tokens < self.context_cache_min_tokens:
+            return f"el prefijo (~{tokens} tokens) no llega al mínimo de {self.context_cache_min_tokens}"
+        if not _VERSIONED_MODEL.search(self.model_name):
+            return f"{self.model_name} no es una versión fija del modelo (p. ej. {self.model_name}-002)"
+        return None
+
+    def _start_build(self):
+        # Tarea compartida que crea el modelo; si la anterior terminó (bien o con error) se lanza otra
+        if self._build_task is None or self._build_task.done():
+            self._build_task = asyncio.ensure_future(asyncio.to_thread(self._build_model))
+            # Si todas las peticiones que la esperaban se han rendido, el error no queda sin recoger
+            self._build_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self._build_task
+
+    def _build_model(self):
+        genai = get_genai()
+        if self.endpoint:
+            genai.configure(api_key=self.api_key, transport="rest", client_options={"api_endpoint": self.endpoint})
+        else:
+            genai.configure(api_key=self.api_key)
+        model = None
+        expires_at = None
+        skip_reason = self._context_cache_skip_reason() if self.context_cache and self.system_instruction else None
+        if skip_reason:
+            print(f"Sin caché de contexto de Gemini, el prefijo va como system_instruction: {skip_reason}")
+            self.context_cache_active = False
+        elif self.context_cache and self.system_instruction:
+            try:
+                cached = genai.caching.CachedContent.create(
+                    model=f"models/{self.model_name}",
+                    system_instruction=self.system_instruction,
+                    ttl=timedelta(seconds=self.context_cache_ttl),
+                )
+                model = genai.GenerativeModel.from_cached_content(cached)
+                # Se renueva un poco antes de que caduque en el servidor
+                expires_at = time.monotonic() + self.context_cache_ttl * 0.9
+                self.context_cache_active = True
+            except Exception as e:
+                print(f"Caché de contexto de Gemini no disponible, el prefijo va como system_instruction: {e}")
+                self.context_cache = False
+                self.context_cache_active = False
+        if model is None:
+            model = genai.GenerativeModel(self.model_name, system_instruction=self.system_instruction)
+        self._model = model
+        self._model_expires_at = expires_at
+        print(f"Gemini configurado correctamente ({self.model_name})")
+
+    async def generate(self, prompt):
+        # Texto de la respuesta. Lanza CircuitOpenError si el circuito está abierto y
+        # asyncio.TimeoutError si se agota el plazo (esperando hueco o esperando a Gemini)
+        deadline = time.monotonic() + self.timeout
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            # Saturación local, no un fallo de Gemini: no cuenta para el circuito
+            self.queue_timeouts += 1
+            raise
+        finally:
+            self.waiting -= 1
+        try:
+            if self._needs_model():
+                # La primera vez se importa la librería y se crea el modelo sin bloquear el event loop,
+                # dentro del plazo de la pregunta (la creación sigue para las siguientes si se agota)
+                try:
+                    await asyncio.wait_for(asyncio.shield(self._start_build()), max(deadline - time.monotonic(), 0.001))
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    raise
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Circuito '{self.breaker.name}' abierto")
+            return await self._call(prompt, deadline)
+        finally:
+            self._semaphore.release()
+
+    async def _call(self, prompt, deadline):
+        remaining = max(deadline - time.monotonic(), 0.001)
+        start = time.perf_counter()
+        ok = False
+        self.in_flight += 1
+        try:
+            model = self._model
+            # Sin reintentos dentro de la librería: el plazo es de la pregunta entera y el
+            # fallback de plantillas hace de reintento
+            request_options = {"timeout": remaining, "retry": None}
+            if self.endpoint:
+                call = asyncio.to_thread(model.generate_content, prompt, request_options=request_options)
+            else:
+                call = model.generate_content_async(prompt, request_options=request_options)
+            response = await asyncio.wait_for(call, remaining)
+            text = response.text
+            ok = True
+            self._record_usage(response, time.perf_counter() - start)
+            return text
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            elapsed = time.perf_counter() - start
+            self._latency_total += elapsed
+            self._latency_count += 1
+            self.breaker.record(ok, elapsed)
+
+    def _record_usage(self, response, elapsed):
+        # Tokens de la llamada según Gemini (los de la caché de contexto van aparte)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        prompt_tokens = usage.prompt_token_count
+        cached_tokens = getattr(usage, "cached_content_token_count", 0)
+        output_tokens = usage.candidates_token_count
+        self._prompt_tokens += prompt_tokens
+        self._cached_tokens += cached_tokens
+        self._output_tokens += output_tokens
+        self._usage_count += 1
+        print(f"Gemini: {prompt_tokens} tokens de entrada ({cached_tokens} de la caché de contexto), "
+              f"{output_tokens} de salida, {elapsed * 1000:.0f} ms")
+
+    def stats(self):
+        usage_count = self._usage_count or 1
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "timeout_s": self.timeout,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "queue_timeouts": self.queue_timeouts,
+            "avg_latency_ms": round(self._latency_total / self._latency_count * 1000, 1) if self._latency_count else None,
+            "avg_prompt_tokens": round(self._prompt_tokens / usage_count, 1),
+            "avg_cached_tokens": round(self._cached_tokens / usage_count, 1),
+            "avg_output_tokens": round(self._output_tokens / usage_count, 1),
+            "context_cache": self.context_cache_active,
+            "circuit": self.breaker.stats(),
+        }
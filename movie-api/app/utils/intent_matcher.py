@@ -0,0 +1,209 @@
+# Clasificador de intenciones de los fallbacks de NL2SQL.
+# Todas las palabras clave (intenciones, géneros y números) se compilan al importar en una
+# única expresión regular con forma de trie. Una sola pasada (findall, en C) devuelve las
+# palabras clave presentes y el primer número; cada palabra encontrada aporta también las que
+# contiene ("popularity" -> "popular"), así que el resultado es el mismo que comprobar
+# `palabra in pregunta` una por una salvo dos palabras clave solapadas entre sí en el texto.
+# Las reglas se evalúan después con operaciones de conjuntos.
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+# Mismo diccionario (y mismo orden de prioridad) que usaba detect_genre_in_question
+GENRE_MAPPING = {
+    "comedy": "Comedy",
+    "comedia": "Comedy",
+    "action": "Action",
+    "acción": "Action",
+    "drama": "Drama",
+    "horror": "Horror",
+    "terror": "Horror",
+    "thriller": "Thriller",
+    "romance": "Romance",
+    "romántica": "Romance",
+    "adventure": "Adventure",
+    "aventura": "Adventure",
+    "animation": "Animation",
+    "animación": "Animation",
+    "documentary": "Documentary",
+    "documental": "Documentary",
+    "fantasy": "Fantasy",
+    "fantasía": "Fantasy",
+    "science fiction": "Science Fiction",
+    "ciencia ficción": "Science Fiction",
+    "sci-fi": "Science Fiction",
+    "mystery": "Mystery",
+    "misterio": "Mystery",
+    "crime": "Crime",
+    "crimen": "Crime",
+    "war": "War",
+    "guerra": "War",
+    "western": "Western",
+    "family": "Family",
+    "familiar": "Family",
+    "music": "Music",
+    "música": "Music",
+    "history": "History",
+    "historia": "History",
+    "tv movie": "TV Movie"
+}
+
+# Palabras clave de las intenciones (las que comprobaban generate_fallback_sql y create_better_fallback)
+INTENT_KEYWORDS = [
+    "titles", "released", "distribución", "distribution", "género", "genre", "genres",
+    "géneros", "cuántas", "cuantas", "how many", "película", "movie", "top", "popular",
+    "popularity", "más popular", "available", "mejor valorad", "highest rated", "best rated",
+    "better", "score", "rating", "budget", "presupuesto", "votos", "más votad", "recaudac",
+    "revenue", "taquilla", "duración", "duration", "larga", "corta", "año", "estreno", "year",
+]
+
+
+def _trie_pattern(words):
+    # Alternancia con forma de trie: en cada posición se descarta en cuanto no hay prefijo
+    # común, en vez de probar todas las palabras una detrás de otra
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        end = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Se prefiere la palabra más larga; si no sigue, vale la palabra terminada aquí
+        return f"(?:{body})?" if end else body
+
+    return build(trie)
+
+
+# Los géneros van primero para que su bit indique la prioridad de GENRE_MAPPING;
+# "2023" no está en el trie: se busca dentro de los números
+KEYWORDS = list(dict.fromkeys(list(GENRE_MAPPING) + INTENT_KEYWORDS + ["2023"]))
+BIT = {keyword: 1 << i for i, keyword in enumerate(KEYWORDS)}
+# Cada palabra encontrada activa también los bits de las palabras clave que contiene
+# ("popularity" -> "popular", "géneros" -> "género")
+_IMPLIED = {word: sum(BIT[other] for other in KEYWORDS if other in word) for word in KEYWORDS}
+_GENRE_BITS = sum(BIT[keyword] for keyword in GENRE_MAPPING)
+_GENRE_BY_BIT = {BIT[keyword]: genre for keyword, genre in GENRE_MAPPING.items()}
+_SCANNER = re.compile(rf"{_trie_pattern([k for k in KEYWORDS if k != '2023'])}|\d+")
+# Sustitución de géneros en la SQL de Gemini en una sola pasada (antes, un re.sub por género)
+_GENRE_SQL = re.compile("|".join(re.escape(k) for k in sorted(GENRE_MAPPING, key=len, reverse=True)), re.IGNORECASE)
+
+
+def _mask(*words):
+    return sum(BIT[word] for word in words)
+
+
+# Grupos de sinónimos de las reglas
+_TITLES = _mask("titles")
+_TITLES_2023 = _mask("2023", "released")
+_DISTRIBUTION = _mask("distribución", "distribution")
+_GENRE_FOR_DISTRIBUTION = _mask("género", "genres")
+_HOW_MANY = _mask("cuántas", "cuantas", "how many")
+_MOVIE = _mask("película", "movie")
+_GENRES = _mask("genres", "géneros")
+_TOP_OR_POPULAR = _mask("top", "popular")
+_AVAILABLE = _mask("available")
+_BEST_RATED = _mask("mejor valorad", "highest rated", "best rated", "better")
+_SCORE = _mask("score", "rating")
+_BUDGET = _mask("budget", "presupuesto")
+_TOP = _mask("top")
+_POPULARITY = _mask("popularity")
+_RATED = _mask("mejor valorad", "rating", "highest rated")
+_POPULAR = _mask("popular", "más popular")
+_VOTES = _mask("votos", "más votad")
+_REVENUE = _mask("recaudac", "revenue", "taquilla")
+_DURATION = _mask("duración", "duration", "larga", "corta")
+_SHORT = _mask("corta")
+_YEAR = _mask("año", "estreno", "year")
+_GENRE = _mask("género", "genre")
+
+
+class QuestionScan(NamedTuple):
+    # found: máscara de bits de las palabras clave presentes (ver BIT)
+    found: int
+    genre: Optional[str]
+    number: Optional[int]
+
+
+def scan_question(question):
+    # Palabras clave presentes, género detectado y primer número de la pregunta en una pasada
+    found = 0
+    number = None
+    for token in _SCANNER.findall(question.lower()):
+        # Los números van antes que _IMPLIED: "2023" es palabra clave y también puede ser el primer número
+        if token.isdigit():
+            if number is None:
+                number = int(token)
+            if "2023" in token:
+                found |= BIT["2023"]
+        else:
+            found |= _IMPLIED[token]
+    genres = found & _GENRE_BITS
+    # El bit más bajo es el género que aparece antes en GENRE_MAPPING
+    genre = _GENRE_BY_BIT[genres & -genres] if genres else None
+    return QuestionScan(found, genre, number)
+
+
+def match_fallback(found, genre, number):
+    # Reglas especializadas (antes generate_fallback_sql). Devuelve (template_id, params) o None
+    if found & _TITLES and found & _TITLES_2023:
+        return "titles_2023", ()
+    elif found & _DISTRIBUTION and found & _GENRE_FOR_DISTRIBUTION:
+        return "genre_distribution", ()
+    elif found & _HOW_MANY and found & _MOVIE:
+        return ("count_by_genre", (genre,)) if genre else None
+    elif found & _GENRES and found & _TOP_OR_POPULAR:
+        return "top_genres_by_popularity", ()
+    elif found & _GENRES and not found & _DISTRIBUTION:
+        return "genre_list", ()
+    elif found & _AVAILABLE:
+        return "genre_list", ()
+    elif found & _BEST_RATED and found & _SCORE:
+        return "top_rated", (number or 10,)
+    elif found & _BUDGET:
+        return "top_budget", (number or 10,)
+    elif found & _TOP and found & _POPULARITY:
+        return "top_popularity", (number or 5,)
+    if genre:
+        return "movies_by_genre", (genre,)
+    return None
+
+
+def match_simple(found, number):
+    # Reglas generales (antes create_better_fallback). Siempre devuelve una plantilla
+    limit = number or 10
+    if found & _RATED:
+        return "top_rated", (limit,)
+    elif found & _POPULAR:
+        return "top_popularity", (limit,)
+    elif found & _VOTES:
+        return "top_votes", (limit,)
+    elif found & _BUDGET:
+        return "top_budget", (limit,)
+    elif found & _REVENUE:
+        return "top_revenue", (limit,)
+    elif found & _DURATION:
+        return ("shortest" if found & _SHORT else "longest"), (limit,)
+    elif found & _YEAR:
+        return "latest_releases", (limit,)
+    elif found & _GENRE:
+        return "genre_list_distinct", ()
+    return "top_rated", (limit,)
+
+
+@lru_cache(maxsize=4096)
+def classify_question(question):
+    # Plantilla de fallback para la pregunta: (template_id, params).
+    # Las preguntas repetidas (enlaces de la demo, reintentos) no vuelven a escanearse
+    found, genre, number = scan_question(question)
+    return match_fallback(found, genre, number) or match_simple(found, number)
+
+
+def replace_genres(sql_query):
+    # Traduce los nombres de género (en español o inglés) al valor de la tabla generos
+    return _GENRE_SQL.sub(lambda m: GENRE_MAPPING[m.group(0).lower()], sql_query)
@@ -0,0 +1,155 @@
+# Controles previos a ejecutar la SQL generada por Gemini:
+# - una sola sentencia;
+# - LIMIT obligatorio: si falta se añade QUERY_DEFAULT_LIMIT y si es mayor que QUERY_MAX_ROWS se reduce;
+# - EXPLAIN (sin ANALYZE, no ejecuta nada) y rechazo si el coste estimado supera QUERY_MAX_COST;
+# - statement_timeout por petición (SET LOCAL: solo dura la transacción de la consulta).
+# Las plantillas de los fallbacks son SQL nuestra y solo llevan el statement_timeout.
+import re
+import time
+from app.config import QUERY_MAX_COST, QUERY_MAX_ROWS, QUERY_DEFAULT_LIMIT, QUERY_STATEMENT_TIMEOUT_MS
+
+# Literales, identificadores entre comillas y comentarios (-- hasta fin de línea y /* */, también sin cerrar)
+_STRINGS = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?(?:\*/|\Z)", re.DOTALL)
+_PARENS = re.compile(r"\([^()]*\)")
+_TOP_LIMIT = re.compile(r"\blimit\s+(\d+|all)\b", re.IGNORECASE)
+_TOP_FETCH = re.compile(r"\bfetch\s+(?:first|next)\b", re.IGNORECASE)
+
+guard_stats = {
+    "checked": 0,
+    "rejected": 0,
+    "limit_added": 0,
+    "limit_reduced": 0,
+    "timeouts": 0,
+    "max_cost": 0.0,
+    "_explained": 0,
+    "_cost_total": 0.0,
+    "_explain_seconds": 0.0,
+}
+
+
+class QueryRejected(Exception):
+    # La consulta no se ejecuta (coste excesivo, varias sentencias o statement_timeout)
+    def __init__(self, message, report=None):
+        super().__init__(message)
+        self.report = report or {}
+
+
+class QueryRows(list):
+    # Filas de una consulta con el informe de query_guard (coste, LIMIT añadido...). Es una
+    # lista normal para quien no lo use y se guarda tal cual en la caché de resultados
+    def __init__(self, rows=(), guard=None):
+        super().__init__(rows)
+        self.guard = guard or {}
+
+
+def _mask(sql):
+    # Sustituye literales, comentarios y paréntesis (subconsultas, funciones) por espacios de la misma
+    # longitud, así lo que queda es el nivel superior de la consulta y las posiciones siguen valiendo
+    masked = _STRINGS.sub(lambda m: " " * len(m.group(0)), sql)
+    previous = None
+    while previous != masked:
+        previous = masked
+        masked = _PARENS.sub(lambda m: " " * len(m.group(0)), masked)
+    return masked
+
+
+def _strip_tail(sql):
+    # Quita el ; final y los comentarios y espacios de alrededor (un LIMIT añadido detrás de un
+    # "-- comentario" quedaría comentado). Devuelve (sql, sql enmascarada)
+    uncommented = _STRINGS.sub(lambda m: " " * len(m.group(0)) if m.group(0)[0] in "-/" else m.group(0), sql)
+    end = len(uncommented.rstrip())
+    if end and uncommented[end - 1] == ";":
+        end = len(uncommented[:end - 1].rstrip())
+    start = len(sql) - len(sql.lstrip())
+    return sql[start:end], _mask(sql)[start:end]
+
+
+def apply_row_limit(sql, default_limit=QUERY_DEFAULT_LIMIT, max_rows=QUERY_MAX_ROWS):
+    # Devuelve (sql, cambio): cambio es "added", "reduced" o None
+    sql, masked = _strip_tail(sql)
+    if ";" in masked:
+        raise QueryRejected("Solo se permite una consulta por pregunta")
+    if _TOP_FETCH.search(masked):
+        return sql + ";", None
+    match = None
+    for match in _TOP_LIMIT.finditer(masked):
+        pass
+    if match is None:
+        return f"{sql} LIMIT {default_limit};", "added"
+    value = match.group(1)
+    if value.lower() == "all" or int(value) > max_rows:
+        start, end = match.span(1)
+        return f"{sql[:start]}{max_rows}{sql[end:]};", "reduced"
+    return sql + ";", None
+
+
+async def set_statement_timeout(cur, timeout_ms=QUERY_STATEMENT_TIMEOUT_MS):
+    # SET LOCAL con parámetros (SET no los admite): solo afecta a la transacción actual
+    if timeout_ms > 0:
+        await cur.execute("SELECT set_config('statement_timeout', %s, true)", (str(int(timeout_ms)),))
+
+
+async def check_query(cur, sql, limit_rows=True, max_cost=QUERY_MAX_COST):
+    # Aplica los controles y devuelve (sql a ejecutar, informe para la respuesta).
+    # Lanza QueryRejected si la consulta no debe ejecutarse
+    guard_stats["checked"] += 1
+    report = {}
+    try:
+        if limit_rows:
+            sql, change = apply_row_limit(sql)
+            if change == "added":
+                guard_stats["limit_added"] += 1
+                report["limite_añadido"] = QUERY_DEFAULT_LIMIT
+            elif change == "reduced":
+                guard_stats["limit_reduced"] += 1
+                report["limite_reducido"] = QUERY_MAX_ROWS
+            if change:
+                report["sql_reescrita"] = sql
+        elif ";" in _strip_tail(sql)[1]:
+            raise QueryRejected("Solo se permite una consulta por pregunta")
+
+        start = time.perf_counter()
+        await cur.execute(f"EXPLAIN (FORMAT JSON) {sql.strip().rstrip(';')}")
+        plan = (await cur.fetchone())[0][0]["Plan"]
+        guard_stats["_explain_seconds"] += time.perf_counter() - start
+        guard_stats["_explained"] += 1
+        cost = float(plan["Total Cost"])
+        report.update({
+            "coste_estimado": round(cost, 1),
+            "filas_estimadas": int(plan["Plan Rows"]),
+            "nodo_principal": plan["Node Type"],
+        })
+        guard_stats["_cost_total"] += cost
+        guard_stats["max_cost"] = max(guard_stats["max_cost"], cost)
+        if cost > max_cost:
+            raise QueryRejected(
+                f"La consulta es demasiado costosa (coste estimado {cost:,.0f}, máximo {max_cost:,.0f}). "
+                "Prueba a acotarla con un género, un año o un top N.",
+                report
+            )
+        return sql, report
+    except QueryRejected as e:
+        guard_stats["rejected"] += 1
+        e.report = {**report, **e.report, "rechazada": True}
+        print(f"Consulta rechazada: {e}")
+        raise
+
+
+def record_timeout():
+    guard_stats["timeouts"] += 1
+
+
+def get_guard_stats():
+    # Contadores para /health
+    explained = guard_stats["_explained"] or 1
+    stats = {k: v for k, v in guard_stats.items() if not k.startswith("_")}
+    stats["max_cost"] = round(stats["max_cost"], 1)
+    stats["avg_cost"] = round(guard_stats["_cost_total"] / explained, 1)
+    stats["avg_explain_ms"] = round(guard_stats["_explain_seconds"] / explained * 1000, 2)
+    stats["budgets"] = {
+        "max_cost": QUERY_MAX_COST,
+        "max_rows": QUERY_MAX_ROWS,
+        "default_limit": QUERY_DEFAULT_LIMIT,
+        "statement_timeout_ms": QUERY_STATEMENT_TIMEOUT_MS,
+    }
+    return stats
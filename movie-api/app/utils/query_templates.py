@@ -0,0 +1,84 @@
+# Consultas parametrizadas de los fallbacks de NL2SQL.
+# Cada plantilla tiene un id fijo y marcadores %s en lugar de valores concatenados, así que
+# todas las variantes ("top 5", "top 20", "Drama", "Comedia"...) son la misma sentencia:
+# se ejecutan como prepared statements en las conexiones del pool (Postgres reutiliza el
+# plan) y la caché de resultados usa como clave el id de la plantilla más los parámetros.
+
+QUERY_TEMPLATES = {
+    "titles_2023": "SELECT titulo FROM peliculas WHERE EXTRACT(YEAR FROM release_date) = 2023;",
+    "genre_distribution": """
+        SELECT g.nombre, COUNT(DISTINCT pg.movie_id) as cantidad_peliculas
+        FROM generos g
+        LEFT JOIN peliculas_generos pg ON g.genero_id = pg.genero_id
+        GROUP BY g.nombre
+        ORDER BY cantidad_peliculas DESC
+        LIMIT 10;
+        """,
+    "count_by_genre": """
+            SELECT COUNT(*) as total_peliculas
+            FROM peliculas_generos pg
+            JOIN generos g ON pg.genero_id = g.genero_id
+            WHERE g.nombre = %s;
+            """,
+    "top_genres_by_popularity": """
+        SELECT g.nombre, COUNT(pg.movie_id) as total_peliculas,
+               AVG(p.vote_count) as popularidad_promedio
+        FROM generos g
+        LEFT JOIN peliculas_generos pg ON g.genero_id = pg.genero_id
+        LEFT JOIN peliculas p ON pg.movie_id = p.movie_id
+        GROUP BY g.nombre
+        ORDER BY popularidad_promedio DESC
+        LIMIT 5;
+        """,
+    "genre_list": "SELECT nombre FROM generos ORDER BY nombre;",
+    "genre_list_distinct": "SELECT DISTINCT nombre FROM generos ORDER BY nombre;",
+    "movies_by_genre": """
+        SELECT p.titulo, p.vote_average, p.vote_count
+        FROM peliculas p
+        LEFT JOIN peliculas_generos pg ON p.movie_id = pg.movie_id
+        LEFT JOIN generos g ON pg.genero_id = g.genero_id
+        WHERE g.nombre = %s
+        ORDER BY p.vote_count DESC
+        LIMIT 10;
+        """,
+    "top_rated": "SELECT titulo, vote_average FROM peliculas WHERE vote_average IS NOT NULL ORDER BY vote_average DESC LIMIT %s;",
+    "top_popularity": "SELECT titulo, popularity FROM peliculas WHERE popularity IS NOT NULL ORDER BY popularity DESC LIMIT %s;",
+    "top_votes": "SELECT titulo, vote_count FROM peliculas WHERE vote_count IS NOT NULL ORDER BY vote_count DESC LIMIT %s;",
+    "top_budget": "SELECT titulo, budget FROM peliculas WHERE budget > 0 ORDER BY budget DESC LIMIT %s;",
+    "top_revenue": "SELECT titulo, revenue FROM peliculas WHERE revenue > 0 ORDER BY revenue DESC LIMIT %s;",
+    "longest": "SELECT titulo, duracion FROM peliculas WHERE duracion IS NOT NULL ORDER BY duracion DESC LIMIT %s;",
+    "shortest": "SELECT titulo, duracion FROM peliculas WHERE duracion IS NOT NULL ORDER BY duracion ASC LIMIT %s;",
+    "latest_releases": "SELECT titulo, EXTRACT(YEAR FROM release_date) as año FROM peliculas WHERE release_date IS NOT NULL ORDER BY release_date DESC LIMIT %s;",
+    "default_top_rated": "SELECT titulo FROM peliculas ORDER BY vote_average DESC LIMIT 10;",
+}
+
+
+def sql_literal(value):
+    # Literal SQL de un parámetro, solo para mostrar la consulta (nunca se ejecuta así)
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return str(value)
+
+
+class TemplateQuery(str):
+    # Consulta de plantilla. El valor del str es la SQL con los parámetros ya sustituidos,
+    # para logs, respuestas y detección del tipo de gráfico; execute_sql usa template_id,
+    # query y params para ejecutarla como prepared statement.
+
+    def __new__(cls, template_id, params=()):
+        if template_id not in QUERY_TEMPLATES:
+            raise ValueError(f"Plantilla de consulta desconocida: {template_id}")
+        params = tuple(params)
+        query = QUERY_TEMPLATES[template_id]
+        text = query % tuple(sql_literal(p) for p in params) if params else query
+        instance = super().__new__(cls, text)
+        instance.template_id = template_id
+        instance.query = query
+        instance.params = params
+        return instance
+
+    def cache_key(self):
+        return f"tpl:{self.template_id}:{self.params!r}"
+
+    def __reduce__(self):
+        return (TemplateQuery, (self.template_id, self.params))
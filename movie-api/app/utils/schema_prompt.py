@@ -0,0 +1,149 @@
+# Prompt de NL2SQL en dos partes:
+# - prefijo estático (reglas + esquema), idéntico en todas las preguntas: va como
+#   system_instruction de Gemini y, si la API lo permite, en su caché de contexto;
+# - sufijo mínimo con la pregunta.
+# El esquema se lee de information_schema al arrancar, así que refleja las tablas y columnas
+# reales sin mantenerlo a mano. Los comentarios de columna de la BD (COMMENT ON COLUMN) o, si
+# no hay, COLUMN_HINTS añaden las unidades y rangos que Gemini necesita para elegir columnas.
+from app.models.sql_predictor import get_pool
+
+SQL_RULES = """Eres un experto en SQL para PostgreSQL. Convierte cada pregunta (en español) en UNA consulta SELECT para este esquema.
+
+ESQUEMA:
+{schema}
+
+REGLAS:
+- Usa solo las tablas y columnas del esquema.
+- Géneros: JOIN con peliculas_generos y generos (generos.nombre está en inglés). Para contar películas por género, COUNT(*) desde peliculas_generos.
+- LIMIT de 20 como máximo. Año: EXTRACT(YEAR FROM release_date) AS año.
+- Selecciona titulo y la columna por la que se pregunta, y ordena por ella DESC: vote_average (valoración), popularity o vote_count (popularidad), budget, revenue, duracion.
+- Filtros: budget > 0, revenue > 0, vote_average IS NOT NULL; adult = false para contenido familiar.
+- Responde solo con la SQL, sin explicaciones, terminada en punto y coma."""
+
+QUESTION_TEMPLATE = "PREGUNTA: {question}\nSQL:"
+
+# Tablas internas que no deben aparecer en el prompt
+EXCLUDED_TABLES = {"data_version", "schema_migrations", "peliculas_listas_features"}
+
+# Tablas de unión de las listas (migración 002): si están, Gemini debe usarlas en vez de
+# buscar con LIKE en las columnas de texto separadas por comas
+LIST_TABLES_HINT = (
+    "Compañías, países de producción e idiomas: JOIN de peliculas con peliculas_companias/companias, "
+    "peliculas_paises/paises o peliculas_idiomas/idiomas por nombre (en inglés); "
+    "no uses LIKE sobre production_companies, production_countries ni spoken_languages."
+)
+
+COLUMN_HINTS = {
+    ("peliculas", "duracion"): "minutos",
+    ("peliculas", "vote_average"): "0-10",
+    ("peliculas", "revenue"): "recaudación, dólares",
+    ("peliculas", "budget"): "presupuesto, dólares",
+    ("peliculas", "popularity"): "índice de popularidad",
+    ("peliculas", "origin_country"): "país de origen",
+}
+
+# Esquema de respaldo, solo mientras no se haya podido leer el de la BD
+FALLBACK_SCHEMA = """peliculas: movie_id int PK, titulo text, release_date date, duracion int (minutos), vote_average numeric (0-10), vote_count int, origin_country text (país de origen), overview text, revenue bigint (recaudación, dólares), budget bigint (presupuesto, dólares), adult bool, belong_to_collection varchar, original_language varchar, original_title varchar, popularity float (índice de popularidad), production_companies text, production_countries text, spoken_languages text, status varchar, tagline varchar
+generos: genero_id int PK, nombre varchar
+peliculas_generos: movie_id int -> peliculas.movie_id, genero_id int -> generos.genero_id
+companias: compania_id int PK, nombre text
+paises: pais_id int PK, nombre text
+idiomas: idioma_id int PK, nombre text
+peliculas_companias: movie_id int -> peliculas.movie_id, compania_id int -> companias.compania_id
+peliculas_paises: movie_id int -> peliculas.movie_id, pais_id int -> paises.pais_id
+peliculas_idiomas: movie_id int -> peliculas.movie_id, idioma_id int -> idiomas.idioma_id
+""" + LIST_TABLES_HINT
+
+COLUMNS_QUERY = """
+    SELECT c.table_name, c.column_name, c.data_type,
+           col_description(format('%I.%I', c.table_schema, c.table_name)::regclass, c.ordinal_position)
+    FROM information_schema.columns c
+    JOIN information_schema.tables t
+      ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+    WHERE c.table_schema = 'public' AND t.table_type IN ('BASE TABLE', 'VIEW')
+    ORDER BY c.table_name, c.ordinal_position;
+"""
+
+KEYS_QUERY = """
+    SELECT tc.constraint_type, kcu.table_name, kcu.column_name, ccu.table_name, ccu.column_name
+    FROM information_schema.table_constraints tc
+    JOIN information_schema.key_column_usage kcu
+      ON kcu.constraint_name = tc.constraint_name AND kcu.table_schema = tc.table_schema
+    LEFT JOIN information_schema.constraint_column_usage ccu
+      ON tc.constraint_type = 'FOREIGN KEY'
+     AND ccu.constraint_name = tc.constraint_name AND ccu.table_schema = tc.table_schema
+    WHERE tc.table_schema = 'public' AND tc.constraint_type IN ('PRIMARY KEY', 'FOREIGN KEY');
+"""
+
+GENRES_QUERY = "SELECT nombre FROM generos ORDER BY nombre;"
+
+# Nombres cortos de los tipos de information_schema (menos tokens, mismo significado)
+SHORT_TYPES = {
+    "integer": "int",
+    "smallint": "smallint",
+    "bigint": "bigint",
+    "character varying": "varchar",
+    "character": "char",
+    "double precision": "float",
+    "real": "float",
+    "boolean": "bool",
+    "timestamp without time zone": "timestamp",
+    "timestamp with time zone": "timestamptz",
+}
+
+
+def format_schema(columns, keys, genres=None):
+    # Una línea por tabla: "tabla: columna tipo [PK|-> tabla.columna] [(nota)], ..."
+    primary = set()
+    foreign = {}
+    for constraint_type, table, column, ref_table, ref_column in keys:
+        if constraint_type == "PRIMARY KEY":
+            primary.add((table, column))
+        elif ref_table:
+            foreign[(table, column)] = f"{ref_table}.{ref_column}"
+
+    tables = {}
+    for table, column, data_type, comment in columns:
+        if table in EXCLUDED_TABLES:
+            continue
+        parts = [column, SHORT_TYPES.get(data_type, data_type)]
+        # En las tablas de unión la clave primaria son las dos claves ajenas: basta con la FK
+        if (table, column) in foreign:
+            parts.append(f"-> {foreign[(table, column)]}")
+        elif (table, column) in primary:
+            parts.append("PK")
+        note = comment or COLUMN_HINTS.get((table, column))
+        if note:
+            parts.append(f"({note})")
+        tables.setdefault(table, []).append(" ".join(parts))
+
+    lines = [f"{table}: {', '.join(cols)}" for table, cols in tables.items()]
+    if genres:
+        lines.append(f"Valores de generos.nombre: {', '.join(genres)}")
+    if "peliculas_companias" in tables:
+        lines.append(LIST_TABLES_HINT)
+    return "\n".join(lines)
+
+
+async def fetch_schema():
+    # Lee tablas, columnas, claves y géneros de la BD y devuelve el esquema compacto
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(COLUMNS_QUERY)
+            columns = await cur.fetchall()
+            await cur.execute(KEYS_QUERY)
+            keys = await cur.fetchall()
+            genres = None
+            if any(table == "generos" for table, _, _, _ in columns):
+                await cur.execute(GENRES_QUERY)
+                genres = [row[0] for row in await cur.fetchall()]
+    return format_schema(columns, keys, genres)
+
+
+def build_prompt_prefix(schema):
+    return SQL_RULES.format(schema=schema)
+
+
+def build_question_prompt(question):
+    return QUESTION_TEMPLATE.format(question=question)
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Grupos registrados, para exponer sus contadores en /health
+_groups = []
+
+
+class SingleFlight:
+    # Agrupa llamadas concurrentes con la misma clave: la primera lanza el cálculo y las que
+    # llegan mientras está en curso esperan ese mismo resultado (o excepción) en vez de repetirlo.
+    # El cálculo corre en su propia tarea, así que si la petición que lo lanzó se cancela
+    # (cliente desconectado) las demás siguen esperándolo.
+
+    def __init__(self, name):
+        self.name = name
+        self._in_flight = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn, *args, **kwargs):
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Marca la excepción como recuperada aunque todos los que esperaban se hayan cancelado
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Cálculo compartido '{self.name}' fallido: {task.exception()}")
+
+    def stats(self):
+        total = self.executions + self.coalesced
+        return {
+            "in_flight": len(self._in_flight),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "saved_ratio": round(self.coalesced / total, 3) if total else 0.0,
+        }
+
+
+def create_single_flight(name):
+    group = SingleFlight(name)
+    _groups.append(group)
+    return group
+
+
+def get_single_flight_stats():
+    # Contadores de todos los grupos: "coalesced" son las llamadas a Gemini, RDS o al
+    # renderizador que se han ahorrado
+    return {group.name: group.stats() for group in _groups}
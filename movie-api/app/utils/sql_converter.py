@@ -1,9 +1,31 @@
 
-import google.generativeai as genai
+import asyncio
 import re
 import os
+import time
+import unicodedata
 from typing import Optional
 from dotenv import load_dotenv
+from app.config import (
+    GEMINI_TIMEOUT,
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_API_ENDPOINT,
+    GEMINI_BREAKER_FAILURE_RATIO,
+    GEMINI_BREAKER_SLOW_CALL,
+    GEMINI_BREAKER_WINDOW,
+    GEMINI_BREAKER_MIN_CALLS,
+    GEMINI_BREAKER_OPEN_SECONDS,
+    GEMINI_CONTEXT_CACHE,
+    GEMINI_CONTEXT_CACHE_TTL,
+    GEMINI_CONTEXT_CACHE_MIN_TOKENS,
+)
+from app.utils.cache import create_cache
+from app.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.utils.gemini_client import GeminiClient
+from app.utils.schema_prompt import FALLBACK_SCHEMA, build_prompt_prefix, build_question_prompt, fetch_schema
+from app.utils.single_flight import create_single_flight
+from app.utils.query_templates import TemplateQuery
+from app.utils.intent_matcher import GENRE_MAPPING, classify_question, match_fallback, match_simple, replace_genres, scan_question
 
 # Cargar variables de entorno
 load_dotenv()
@@ -12,146 +34,89 @@ load_dotenv()
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 print(f"API Key detectada: {'Sí' if GEMINI_API_KEY else 'No'}")
 
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    print("Gemini configurado correctamente")
-else:
+if not GEMINI_API_KEY:
     print("GEMINI_API_KEY no encontrada en variables de entorno")
 
 # Modelo Gemini
 GEMINI_MODEL = "gemini-1.5-flash"
+# Segundos entre reintentos de leer el esquema de la BD si falló al arrancar
+SCHEMA_RETRY_INTERVAL = 60
+
+# Cliente compartido por todas las peticiones (plazo por llamada, límite de concurrencia y circuit breaker)
+gemini_client = GeminiClient(
+    GEMINI_API_KEY,
+    GEMINI_MODEL,
+    timeout=GEMINI_TIMEOUT,
+    max_concurrency=GEMINI_MAX_CONCURRENCY,
+    endpoint=GEMINI_API_ENDPOINT,
+    system_instruction=build_prompt_prefix(FALLBACK_SCHEMA),
+    context_cache=GEMINI_CONTEXT_CACHE,
+    context_cache_ttl=GEMINI_CONTEXT_CACHE_TTL,
+    context_cache_min_tokens=GEMINI_CONTEXT_CACHE_MIN_TOKENS,
+    breaker=CircuitBreaker(
+        "gemini",
+        failure_ratio=GEMINI_BREAKER_FAILURE_RATIO,
+        slow_call_seconds=GEMINI_BREAKER_SLOW_CALL,
+        window=GEMINI_BREAKER_WINDOW,
+        min_calls=GEMINI_BREAKER_MIN_CALLS,
+        open_seconds=GEMINI_BREAKER_OPEN_SECONDS
+    )
+)
+
+# Caché pregunta -> SQL delante de Gemini ("memory" por proceso o "redis" compartida entre workers)
+sql_cache = create_cache(
+    "nl2sql",
+    backend=os.getenv("SQL_CACHE_BACKEND", "memory"),
+    max_size=int(os.getenv("SQL_CACHE_MAX_SIZE", "1000")),
+    ttl=int(os.getenv("SQL_CACHE_TTL", "86400")),
+    redis_url=os.getenv("CACHE_REDIS_URL")
+)
+
+# Llamadas a Gemini en curso por pregunta normalizada (misma clave que sql_cache)
+question_flight = create_single_flight("nl2sql")
+
+# Esquema de la BD para el prompt, leído de information_schema (ver app/utils/schema_prompt.py)
+_schema = None
+_schema_attempt_at = None
 
 def get_database_schema():
-    # Retorna el esquema actualizado de la base de datos para el contexto de Gemini
-    return """
-    Base de datos de películas - Esquema actualizado:
-    
-    Tabla: peliculas
-    - movie_id (INTEGER, PRIMARY KEY)
-    - titulo (TEXT) - título de la película
-    - release_date (DATE) - fecha de estreno
-    - duracion (INTEGER) - duración en minutos
-    - vote_average (NUMERIC(3,1)) - puntuación promedio (0-10)
-    - vote_count (INTEGER) - número de votos
-    - origin_country (TEXT) - país de origen
-    - overview (TEXT) - sinopsis de la película
-    - revenue (BIGINT) - recaudación en dólares
-    - budget (BIGINT) - presupuesto en dólares
-    - adult (BOOLEAN) - contenido para adultos
-    - belong_to_collection (VARCHAR(1000)) - pertenece a colección
-    - original_language (VARCHAR) - idioma original
-    - original_title (VARCHAR(500)) - título original
-    - popularity (DOUBLE PRECISION) - índice de popularidad
-    - production_companies (TEXT) - compañías productoras
-    - production_countries (TEXT) - países de producción
-    - spoken_languages (TEXT) - idiomas hablados
-    - status (VARCHAR) - estado de la película
-    - tagline (VARCHAR(1000)) - eslogan de la película
-    
-    Tabla: generos  
-    - genero_id (INTEGER, PRIMARY KEY)
-    - nombre (VARCHAR(50)) - nombre del género (Comedy, Action, Drama, etc.)
-    
-    Tabla: peliculas_generos (tabla de unión)
-    - movie_id (INTEGER, FOREIGN KEY -> peliculas.movie_id)
-    - genero_id (INTEGER, FOREIGN KEY -> generos.genero_id)
-    """
+    # Retorna el esquema de la base de datos para el contexto de Gemini (el de respaldo si aún no se ha leído)
+    return _schema or FALLBACK_SCHEMA
 
-# Diccionario global de géneros
-GENRE_MAPPING = {
-    "comedy": "Comedy",
-    "comedia": "Comedy",
-    "action": "Action",
-    "acción": "Action",
-    "drama": "Drama",
-    "horror": "Horror",
-    "terror": "Horror",
-    "thriller": "Thriller",
-    "romance": "Romance",
-    "romántica": "Romance",
-    "adventure": "Adventure",
-    "aventura": "Adventure",
-    "animation": "Animation",
-    "animación": "Animation",
-    "documentary": "Documentary",
-    "documental": "Documentary",
-    "fantasy": "Fantasy",
-    "fantasía": "Fantasy",
-    "science fiction": "Science Fiction",
-    "ciencia ficción": "Science Fiction",
-    "sci-fi": "Science Fiction",
-    "mystery": "Mystery",
-    "misterio": "Mystery",
-    "crime": "Crime",
-    "crimen": "Crime",
-    "war": "War",
-    "guerra": "War",
-    "western": "Western",
-    "family": "Family",
-    "familiar": "Family",
-    "music": "Music",
-    "música": "Music",
-    "history": "History",
-    "historia": "History",
-    "tv movie": "TV Movie"
-}
+async def load_schema_prompt():
+    # Lee el esquema real y rehace la parte fija del prompt (se llama al arrancar)
+    global _schema, _schema_attempt_at
+    _schema_attempt_at = time.monotonic()
+    schema = await fetch_schema()
+    _schema = schema
+    gemini_client.set_system_instruction(build_prompt_prefix(schema))
+    print(f"Esquema para Gemini leído de la BD ({len(schema)} caracteres)")
+    return schema
+
+async def ensure_schema_prompt():
+    # Si al arrancar no se pudo leer el esquema se reintenta, como mucho una vez por minuto
+    if _schema is not None or (_schema_attempt_at is not None and time.monotonic() - _schema_attempt_at < SCHEMA_RETRY_INTERVAL):
+        return
+    try:
+        await load_schema_prompt()
+    except Exception as e:
+        print(f"No se pudo leer el esquema de la BD, se usa el de respaldo: {e}")
 
 # Función auxiliar para detectar género en una pregunta
 def detect_genre_in_question(question: str) -> Optional[str]:
-    question_lower = question.lower()
-    for keyword, genre in GENRE_MAPPING.items():
-        if keyword in question_lower:
-            return genre
-    return None
+    return scan_question(question).genre
 
-def generate_sql_with_gemini(question: str, schema: str) -> Optional[str]:
-    # Genera SQL usando Gemini AI
-    if not GEMINI_API_KEY:
+async def generate_sql_with_gemini(question: str, client: Optional[GeminiClient] = None) -> Optional[str]:
+    # Genera SQL usando Gemini AI con el cliente asíncrono (no bloquea el event loop).
+    # Las reglas y el esquema ya están en el cliente (system_instruction): solo se envía la pregunta.
+    # None si Gemini falla, tarda más que el plazo o tiene el circuito abierto
+    client = client or gemini_client
+    if not client.api_key:
         return None
         
     try:
-        model = genai.GenerativeModel(GEMINI_MODEL)
-        
-        prompt = f"""
-        Eres un experto en SQL para PostgreSQL. Tu tarea es convertir preguntas en lenguaje natural a consultas SQL válidas.
-
-        ESQUEMA DE BASE DE DATOS:
-        {schema}
-
-        REGLAS IMPORTANTES:
-        1. Usa SOLO las tablas y columnas mencionadas en el esquema
-        2. Para filtros por género, SIEMPRE usa JOIN con las tablas generos y peliculas_generos
-        3. Usa LIMIT para controlar el número de resultados (máximo 20)
-        4. Para fechas, usa EXTRACT(YEAR FROM release_date) para obtener el año
-        5. IMPORTANTE: Para contar películas por género usa COUNT(*) desde peliculas_generos con JOIN a generos
-        6. Ordena por campos relevantes según el contexto:
-           - Para valoraciones: vote_average DESC
-           - Para popularidad: popularity DESC o vote_count DESC
-           - Para presupuesto: budget DESC
-           - Para recaudación: revenue DESC
-           - Para duración: duracion DESC
-        7. SIEMPRE incluye las columnas relevantes en SELECT:
-           - Para presupuesto: titulo, budget
-           - Para valoraciones: titulo, vote_average
-           - Para popularidad: titulo, popularity o vote_count
-           - Para recaudación: titulo, revenue
-           - Para duración: titulo, duracion
-           - Para año: titulo, EXTRACT(YEAR FROM release_date) as año
-        8. Usa filtros apropiados:
-           - budget > 0 para consultas de presupuesto
-           - revenue > 0 para consultas de recaudación
-           - vote_average IS NOT NULL para valoraciones
-           - adult = false para contenido familiar
-        9. Retorna SOLO la consulta SQL sin explicaciones adicionales
-        10. La consulta debe terminar con punto y coma (;)
-
-        PREGUNTA: {question}
-
-        SQL:
-        """
-        
-        response = model.generate_content(prompt)
-        sql_query = response.text.strip()
+        prompt = build_question_prompt(question)
+        sql_query = (await client.generate(prompt)).strip()
         
         # Limpiar la respuesta si viene con markdown
         if sql_query.startswith('```sql'):
@@ -162,6 +127,12 @@ def generate_sql_with_gemini(question: str, schema: str) -> Optional[str]:
         print(f"SQL generada por Gemini: {sql_query}")
         return sql_query
         
+    except CircuitOpenError:
+        print("Gemini no responde bien últimamente (circuito abierto), usando fallbacks...")
+        return None
+    except asyncio.TimeoutError:
+        print(f"Gemini no respondió en {client.timeout:g}s, usando fallbacks...")
+        return None
     except Exception as e:
         print(f"Error usando Gemini: {e}")
         return None
@@ -171,47 +142,23 @@ def extract_number(text):
     numbers = re.findall(r'\d+', text)
     return int(numbers[0]) if numbers else None
 
+def normalize_question(question):
+    # Clave de caché: sin mayúsculas, tildes ni puntuación, y con los números
+    # (el primero es el que extract_number usa como LIMIT) separados del texto.
+    # "¿Top 10 películas más populares?" y "top 10 peliculas mas populares" dan la misma clave.
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    numbers = [str(int(n)) for n in re.findall(r'\d+', text)]
+    text = re.sub(r'\d+', ' # ', text)
+    text = re.sub(r'[^\w#\s]|_', ' ', text)
+    text = " ".join(text.split())
+    return f"{text}|{','.join(numbers)}"
+
 def create_better_fallback(question):
-    # Crea consultas SQL más inteligentes como fallback usando la estructura de la BD
-    question_lower = question.lower()
-    
-    if "mejor valorad" in question_lower or "rating" in question_lower or "highest rated" in question_lower:
-        limit = extract_number(question) or 10
-        return f"SELECT titulo, vote_average FROM peliculas WHERE vote_average IS NOT NULL ORDER BY vote_average DESC LIMIT {limit};"
-    
-    elif "popular" in question_lower or "más popular" in question_lower:
-        limit = extract_number(question) or 10
-        return f"SELECT titulo, popularity FROM peliculas WHERE popularity IS NOT NULL ORDER BY popularity DESC LIMIT {limit};"
-    
-    elif "votos" in question_lower or "más votad" in question_lower:
-        limit = extract_number(question) or 10
-        return f"SELECT titulo, vote_count FROM peliculas WHERE vote_count IS NOT NULL ORDER BY vote_count DESC LIMIT {limit};"
-    
-    elif "presupuesto" in question_lower or "budget" in question_lower:
-        limit = extract_number(question) or 10
-        return f"SELECT titulo, budget FROM peliculas WHERE budget > 0 ORDER BY budget DESC LIMIT {limit};"
-    
-    elif "recaudac" in question_lower or "revenue" in question_lower or "taquilla" in question_lower:
-        limit = extract_number(question) or 10
-        return f"SELECT titulo, revenue FROM peliculas WHERE revenue > 0 ORDER BY revenue DESC LIMIT {limit};"
-    
-    elif "duración" in question_lower or "duration" in question_lower or "larga" in question_lower or "corta" in question_lower:
-        limit = extract_number(question) or 10
-        if "corta" in question_lower:
-            return f"SELECT titulo, duracion FROM peliculas WHERE duracion IS NOT NULL ORDER BY duracion ASC LIMIT {limit};"
-        else:
-            return f"SELECT titulo, duracion FROM peliculas WHERE duracion IS NOT NULL ORDER BY duracion DESC LIMIT {limit};"
-    
-    elif "año" in question_lower or "estreno" in question_lower or "year" in question_lower:
-        limit = extract_number(question) or 10
-        return f"SELECT titulo, EXTRACT(YEAR FROM release_date) as año FROM peliculas WHERE release_date IS NOT NULL ORDER BY release_date DESC LIMIT {limit};"
-    
-    elif "género" in question_lower or "genre" in question_lower:
-        return "SELECT DISTINCT nombre FROM generos ORDER BY nombre;"
-    
-    else:
-        limit = extract_number(question) or 10
-        return f"SELECT titulo, vote_average FROM peliculas WHERE vote_average IS NOT NULL ORDER BY vote_average DESC LIMIT {limit};"
+    # Elige la plantilla de fallback general para la pregunta usando la estructura de la BD.
+    # Devuelve (template_id, params); ver app/utils/query_templates.py
+    scan = scan_question(question)
+    return match_simple(scan.found, scan.number)
 
 def is_valid_sql(sql_query):
     # Valida si la SQL es correcta
@@ -265,123 +212,52 @@ def post_process_sql(sql_query):
         return ""
     
     
-    for pattern, replacement in GENRE_MAPPING.items():
-        sql_query = re.sub(pattern, replacement, sql_query, flags=re.IGNORECASE)
-    
-    return sql_query
+    return replace_genres(sql_query)
 
-def generate_sql(question, tables_dict=None):
-    print("Pregunta recibida:", question)
+async def sql_from_gemini(question, cache_key):
+    # Pide la SQL a Gemini y la guarda en la caché si es válida; None si hay que usar fallbacks
+    if not gemini_client.api_key:
+        print("Gemini no disponible (falta API key), usando fallbacks...")
+        return None
 
-    # Enviar la pregunta directamente en español a Gemini
-    if GEMINI_API_KEY:
-        print("Intentando generar SQL con Gemini...")
-        schema = get_database_schema()
-        gemini_sql = generate_sql_with_gemini(question, schema)
+    print("Intentando generar SQL con Gemini...")
+    await ensure_schema_prompt()
+    gemini_sql = await generate_sql_with_gemini(question)
 
-        if gemini_sql and is_valid_sql(gemini_sql):
-            print("SQL válida generada por Gemini")
-            return gemini_sql
-        else:
-            print("Gemini no pudo generar SQL válida, usando fallbacks...")
-    else:
-        print("Gemini no disponible (falta API key), usando fallbacks...")
+    if gemini_sql and is_valid_sql(gemini_sql):
+        print("SQL válida generada por Gemini")
+        # Solo se cachea la SQL de Gemini: los fallbacks son baratos y no deben
+        # ocupar la entrada si Gemini falló de forma puntual
+        await sql_cache.set(cache_key, gemini_sql)
+        return gemini_sql
+    print("Gemini no pudo generar SQL válida, usando fallbacks...")
+    return None
+
+async def generate_sql(question, tables_dict=None):
+    print("Pregunta recibida:", question)
+
+    # OPCIÓN 0: SQL ya generada por Gemini para una pregunta equivalente
+    cache_key = normalize_question(question)
+    cached_sql = await sql_cache.get(cache_key)
+    if cached_sql:
+        print("SQL obtenida de la caché")
+        return cached_sql
 
-    # OPCIÓN 2: Intentar fallback inteligente para preguntas comunes
-    fallback_result = generate_fallback_sql(question, question)
-    if "JOIN" in fallback_result or "WHERE" in fallback_result or "GROUP BY" in fallback_result or "ORDER BY" in fallback_result:
-        print("Usando fallback inteligente especializado")
-        return fallback_result
+    # OPCIÓN 1: Gemini, con la pregunta directamente en español. Si llegan a la vez varias
+    # preguntas equivalentes (misma clave de caché) se hace una sola llamada y todas la esperan
+    gemini_sql = await question_flight.do(cache_key, sql_from_gemini, question, cache_key)
+    if gemini_sql:
+        return gemini_sql
 
-    # OPCIÓN 3: Fallback simple si todo lo demás falla
-    print("Usando fallback simple...")
-    smart_fallback = create_better_fallback(question)
-    print(f"Fallback final: {smart_fallback}")
-    return smart_fallback
+    # OPCIÓN 2: Fallback por plantillas: una sola pasada del clasificador de intenciones
+    # (reglas especializadas y, si ninguna encaja, las generales). Se calcula con la pregunta
+    # original de cada petición, no con la que lanzó la llamada compartida
+    fallback_query = TemplateQuery(*classify_question(question))
+    print(f"Usando fallback {fallback_query.template_id}: {fallback_query}")
+    return fallback_query
 
 def generate_fallback_sql(question_en, original_question=""):
-    # Genera SQL usando patrones para preguntas comunes
-    question_lower = question_en.lower()
-    original_lower = original_question.lower()
-    
-    # Usar la pregunta original si está disponible para detectar mejor los patrones
-    combined_question = (question_lower + " " + original_lower).lower()
-    
-    if "titles" in question_lower and ("2023" in question_lower or "released" in question_lower):
-        return "SELECT titulo FROM peliculas WHERE EXTRACT(YEAR FROM release_date) = 2023;"
-    
-    # Distribución de géneros
-    elif ("distribución" in combined_question or "distribution" in question_lower) and ("género" in combined_question or "genres" in question_lower):
-        return """
-        SELECT g.nombre, COUNT(DISTINCT pg.movie_id) as cantidad_peliculas
-        FROM generos g 
-        LEFT JOIN peliculas_generos pg ON g.genero_id = pg.genero_id 
-        GROUP BY g.nombre 
-        ORDER BY cantidad_peliculas DESC
-        LIMIT 10;
-        """
-    
-    # Contar películas por género específico
-    elif ("cuántas" in combined_question or "cuantas" in combined_question or "how many" in question_lower) and ("película" in combined_question or "movie" in question_lower):
-        detected_genre = detect_genre_in_question(combined_question)
-        if detected_genre:
-            return f"""
-            SELECT COUNT(*) as total_peliculas
-            FROM peliculas_generos pg
-            JOIN generos g ON pg.genero_id = g.genero_id 
-            WHERE g.nombre = '{detected_genre}';
-            """
-    
-    # Top géneros por popularidad
-    elif ("genres" in question_lower or "géneros" in combined_question) and ("top" in question_lower or "popular" in question_lower):
-        return """
-        SELECT g.nombre, COUNT(pg.movie_id) as total_peliculas, 
-               AVG(p.vote_count) as popularidad_promedio
-        FROM generos g 
-        LEFT JOIN peliculas_generos pg ON g.genero_id = pg.genero_id 
-        LEFT JOIN peliculas p ON pg.movie_id = p.movie_id
-        GROUP BY g.nombre 
-        ORDER BY popularidad_promedio DESC 
-        LIMIT 5;
-        """
-    
-    # Solo lista de géneros
-    elif ("genres" in question_lower or "géneros" in combined_question) and not ("distribución" in combined_question or "distribution" in question_lower):
-        return "SELECT nombre FROM generos ORDER BY nombre;"
-    elif "available" in question_lower:
-        return "SELECT nombre FROM generos ORDER BY nombre;"
-    
-    # Películas mejor valoradas
-    elif ("mejor valorad" in combined_question or "highest rated" in question_lower or "best rated" in question_lower or "better" in question_lower) and ("score" in question_lower or "rating" in question_lower):
-        limit = extract_number(original_question or question_en) or 10
-        return f"SELECT titulo, vote_average FROM peliculas WHERE vote_average IS NOT NULL ORDER BY vote_average DESC LIMIT {limit};"
-    
-    elif "budget" in question_lower or "presupuesto" in combined_question:
-        limit = extract_number(original_question or question_en) or 10
-        return f"SELECT titulo, budget FROM peliculas WHERE budget > 0 ORDER BY budget DESC LIMIT {limit};"
-    
-    elif "top" in question_lower and "popularity" in question_lower:
-        limit = extract_number(original_question or question_en) or 5
-        return f"SELECT titulo, popularity FROM peliculas WHERE popularity IS NOT NULL ORDER BY popularity DESC LIMIT {limit};"
-    
-    # Buscar si algún género está mencionado en la pregunta
-    detected_genre = detect_genre_in_question(combined_question)
-    
-    # Películas por género específico
-    if detected_genre:
-        return f"""
-        SELECT p.titulo, p.vote_average, p.vote_count 
-        FROM peliculas p 
-        LEFT JOIN peliculas_generos pg ON p.movie_id = pg.movie_id 
-        LEFT JOIN generos g ON pg.genero_id = g.genero_id 
-        WHERE g.nombre = '{detected_genre}'
-        ORDER BY p.vote_count DESC 
-        LIMIT 10;
-        """
-    
-    # Fallback inteligente basado en la pregunta original
-    if original_question:
-        return create_better_fallback(original_question)
-    
-    # Fallback por defecto
-    return "SELECT titulo FROM peliculas ORDER BY vote_average DESC LIMIT 10;"
\ No newline at end of file
+    # Elige una plantilla usando patrones para preguntas comunes.
+    # Devuelve (template_id, params) o None si ningún patrón especializado encaja
+    scan = scan_question(f"{question_en} {original_question}")
+    return match_fallback(scan.found, scan.genre, scan.number)